@@ -1,46 +1,35 @@
-from app.database import PostgresDatabase
-from app.database.db_task_manager import TaskManagerRepository
+# Run the api server
+#   uv run app/api.py [--port 8033] [--workers 4]
+# The app is built by app.main:create_app, which every worker process calls.
+# Where gunicorn is installed the server runs as a gunicorn master with
+# app/gunicorn_conf.py (graceful reload with kill -HUP), the same as
+#   gunicorn -c app/gunicorn_conf.py 'app.main:create_app()'
+# On windows it falls back to uvicorn's supervisor, which has no graceful reload.
+import argparse
+import os
+from pathlib import Path
 from app.api.api_server import TheFunScreenerServer
-from app.api.api_service import TheFunScreenerService
-from app.api.api import TheFunScreenerAPI
-
-from app.config.config import Config
-
-config = Config().load_configuration()
-
-
-def setup():
-    # Initialize dependencies
-    database = PostgresDatabase(**config.database.db_config)
-    task_manager = TaskManagerRepository(database)
-
-    # Create server
-    server = TheFunScreenerServer()
-
-    # Create business services
-    thefunscreener_service = TheFunScreenerService(task_manager)
-
-    # Api endpoints
-    api = TheFunScreenerAPI(thefunscreener_service)
-
-    # Register api endpoints on the server
-    server.add_routes(api.router)
-
-    return server
-
-
-# Create the app instance for Gunicorn or FastAPI to use
-server = setup()
-app = server.app
+from app.config.config import get_config
 
 if __name__ == "__main__":
-    # Run the server
-    # Parse command line arguments for port
-    import argparse
-    
+    config = get_config()
+
+    # Parse command line arguments for port and number of workers
     parser = argparse.ArgumentParser(description='Run TheFunScreener API server')
-    parser.add_argument('-p', '--port', type=int, default=8033, help='Port to run the server on')
+    parser.add_argument('-p', '--port', type=int, default=config.server.port, help='Port to run the server on')
+    parser.add_argument(
+        '-w', '--workers', type=int, default=config.server.workers, help='Number of worker processes (WEB_CONCURRENCY)'
+    )
     args = parser.parse_args()
-    
-    # Pass the port as an argument to the run method
-    server.run(port=args.port)
+
+    # the workers read the worker count from the environment to split the connection budget
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+
+    # the workers build the app themselves, the supervisor does not
+    TheFunScreenerServer.run_workers(
+        "app.main:create_app",
+        port=args.port,
+        workers=args.workers,
+        graceful_timeout=config.server.graceful_timeout,
+        gunicorn_conf=str(Path(__file__).with_name("gunicorn_conf.py")),
+    )
@@ -1,19 +1,56 @@
 # Api definition
 # It uses a service and defines the endpoints to call the service methods
 # No business logic, just binding a service to a REST endpoint
+from datetime import date
+from typing import Annotated
+import orjson
 from fastapi import (
     APIRouter,
     Depends,
+    Header,
+    HTTPException,
+    Query,
+    status,
 )
+from fastapi.responses import Response, StreamingResponse
 from app.api.api_service import TheFunScreenerService
-from app.models.marketcap import MarketCapEntry
+from app.cache import CacheWarmer
+from app.api.serialization import (
+    ARROW_MEDIA_TYPE,
+    COLUMNAR_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+    PreSerializedJSONResponse,
+    ResponseFormat,
+    history_to_json,
+    negotiate_format,
+    render_screen,
+    stream_dated_screens,
+    stream_screen,
+)
+from app.models.marketcap import CompanyMarketCapHistory, ConstituentChanges, MarketCapEntry
 from app.api.auth import get_api_key
+from app.api.http_cache import ScreenValidators
+from app.utils.helper import month_starts, resolve_countries
+from app.utils.metrics import metrics, record_rows, stage
+
+# ?stream=true reads and sends large screens in chunks instead of building them in memory
+StreamQuery = Annotated[bool, Query(description="Stream the screen in chunks from a server-side cursor")]
+# revalidation of a cached screen (ETag/Last-Modified) is answered with 304 without screening
+IfNoneMatch = Annotated[str | None, Header()]
+IfModifiedSince = Annotated[str | None, Header()]
 
 
 class TheFunScreenerAPI:
-    def __init__(self, thefunscreener_service: TheFunScreenerService):
+    def __init__(
+        self,
+        thefunscreener_service: TheFunScreenerService,
+        batch_max_dates: int = 600,
+        cache_warmer: CacheWarmer | None = None,
+    ):
         self.router = APIRouter(tags=["thefunscreener"])
         self.thefunscreener_service = thefunscreener_service
+        self.batch_max_dates = batch_max_dates
+        self.cache_warmer = cache_warmer
         self._setup_routes()
 
     def _setup_routes(self):
@@ -24,27 +61,220 @@ class TheFunScreenerAPI:
             return {"message": "Welcome to TheFunScreener API"}
 
         @self.router.get("/health")
-        async def health_check(api_key: str = Depends(get_api_key)):
-            """Health check endpoint for monitoring."""
-            return {"status": "healthy"}
+        async def health_check(response: Response, api_key: str = Depends(get_api_key)):
+            """Health check endpoint for monitoring, not ready (503) until the cache is warm."""
+            health = {"status": "healthy", "cache": self.thefunscreener_service.get_cache_stats()}
+            if self.cache_warmer is not None:
+                health["warmup"] = self.cache_warmer.status()
+                if not self.cache_warmer.ready:
+                    health["status"] = "warming_up"
+                    response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+            return health
+
+        @self.router.get("/metrics")
+        async def get_metrics(api_key: str = Depends(get_api_key)):
+            """Request latency, per-stage timings and response sizes in the Prometheus text format."""
+            return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+        @self.router.post("/warmup", status_code=status.HTTP_202_ACCEPTED)
+        async def warmup(api_key: str = Depends(get_api_key)):
+            """Precompute the latest screens in the background, e.g. after the daily data load."""
+            if self.cache_warmer is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Cache warm-up is disabled")
+            started = self.cache_warmer.start()
+            return {"started": started, "warmup": self.cache_warmer.status()}
 
-        @self.router.get("/latest-market-cap/{country}/{mktcap}/{top_x}")
+        # the screens are serialized column-wise, response_model only documents the json schema
+        # the columnar json, arrow and ndjson formats are selected by ?format= or the Accept header
+        screen_responses: dict = {200: {"content": {COLUMNAR_MEDIA_TYPE: {}, ARROW_MEDIA_TYPE: {}, NDJSON_MEDIA_TYPE: {}}}}
+
+        @self.router.get("/latest-market-cap/{country}/{mktcap}/{top_x}", response_model=list[MarketCapEntry], responses=screen_responses)
         async def get_latest_market_cap(
             country: str,
             mktcap: str,
             top_x: int | None = None,
+            response_format: Annotated[ResponseFormat | None, Query(alias="format")] = None,
+            accept: Annotated[str | None, Header()] = None,
+            stream: StreamQuery = False,
+            if_none_match: IfNoneMatch = None,
+            if_modified_since: IfModifiedSince = None,
             api_key: str = Depends(get_api_key)
-        ) -> list[MarketCapEntry]:
-            return self.thefunscreener_service.get_latest_market_cap(country, mktcap, top_x)
+        ) -> Response:
+            self._check_country(country)
+            wire_format = negotiate_format(response_format, accept)
+            validators = await self._screen_validators(None, "latest", country, mktcap, top_x, wire_format, stream)
+            if validators.is_not_modified(if_none_match, if_modified_since):
+                return validators.not_modified()
+
+            if stream:
+                chunks = self.thefunscreener_service.stream_latest_market_cap(country, mktcap, top_x)
+                return validators.apply(stream_screen(chunks, wire_format))
+            res = await self.thefunscreener_service.get_latest_market_cap(country, mktcap, top_x)
+            return validators.apply(render_screen(res, wire_format))
 
-        @self.router.get("/historical-market-cap/{country}/{mktcap}/{year}/{month}/{top_x}")
+        @self.router.get("/historical-market-cap/{country}/{mktcap}/{year}/{month}/{top_x}", response_model=list[MarketCapEntry], responses=screen_responses)
         async def get_historical_market_cap(
             country: str,
             mktcap: str,
             year: int,
             month: int,
             top_x: int | None = None,
+            response_format: Annotated[ResponseFormat | None, Query(alias="format")] = None,
+            accept: Annotated[str | None, Header()] = None,
+            stream: StreamQuery = False,
+            if_none_match: IfNoneMatch = None,
+            if_modified_since: IfModifiedSince = None,
+            api_key: str = Depends(get_api_key)
+        ) -> Response:
+            self._check_country(country)
+            wire_format = negotiate_format(response_format, accept)
+            validators = await self._screen_validators(
+                date(year, month, 1), "historical", country, mktcap, top_x, wire_format, stream
+            )
+            if validators.is_not_modified(if_none_match, if_modified_since):
+                return validators.not_modified()
+
+            if stream:
+                chunks = self.thefunscreener_service.stream_historical_market_cap(country, mktcap, year, month, top_x)
+                return validators.apply(stream_screen(chunks, wire_format))
+            res = await self.thefunscreener_service.get_historical_market_cap(country, mktcap, year, month, top_x)
+            return validators.apply(render_screen(res, wire_format))
+
+        @self.router.get("/historical-market-cap-batch/{country}/{mktcap}/{top_x}", responses={200: {"content": {NDJSON_MEDIA_TYPE: {}}}})
+        async def get_historical_market_cap_batch(
+            country: str,
+            mktcap: str,
+            top_x: int | None = None,
+            start: Annotated[str | None, Query(pattern=r"^\d{4}-\d{2}$", description="First month, YYYY-MM")] = None,
+            end: Annotated[str | None, Query(pattern=r"^\d{4}-\d{2}$", description="Last month, YYYY-MM")] = None,
+            dates: Annotated[list[date] | None, Query(description="Dates to screen instead of month starts")] = None,
+            if_none_match: IfNoneMatch = None,
+            if_modified_since: IfModifiedSince = None,
+            api_key: str = Depends(get_api_key)
+        ) -> Response:
+            """Historical screens of many dates, streamed as one json line per date:
+            {"date": "YYYY-MM-DD", "constituents": [MarketCapEntry, ...]}
+            """
+            self._check_country(country)
+            batch_dates = self._batch_dates(start, end, dates)
+            validators = await self._screen_validators(
+                date.fromisoformat(max(batch_dates)), "batch", country, mktcap, top_x, tuple(batch_dates)
+            )
+            if validators.is_not_modified(if_none_match, if_modified_since):
+                return validators.not_modified()
+
+            screens = self.thefunscreener_service.get_historical_market_cap_batch(country, mktcap, batch_dates, top_x)
+            return validators.apply(StreamingResponse(stream_dated_screens(screens), media_type=NDJSON_MEDIA_TYPE))
+
+        @self.router.get("/constituent-changes/{country}/{mktcap}/{top_x}", response_model=list[ConstituentChanges])
+        async def get_constituent_changes(
+            country: str,
+            mktcap: str,
+            top_x: int | None = None,
+            start: Annotated[str | None, Query(pattern=r"^\d{4}-\d{2}$", description="First month, YYYY-MM")] = None,
+            end: Annotated[str | None, Query(pattern=r"^\d{4}-\d{2}$", description="Last month, YYYY-MM")] = None,
+            dates: Annotated[list[date] | None, Query(description="Dates to compare instead of month starts")] = None,
+            if_none_match: IfNoneMatch = None,
+            if_modified_since: IfModifiedSince = None,
+            api_key: str = Depends(get_api_key)
+        ) -> Response:
+            """Companies that entered or left the screen, and rank moves, from every date to the next one."""
+            self._check_country(country)
+            batch_dates = self._batch_dates(start, end, dates, min_dates=2)
+            validators = await self._screen_validators(
+                date.fromisoformat(max(batch_dates)), "changes", country, mktcap, top_x, tuple(batch_dates)
+            )
+            if validators.is_not_modified(if_none_match, if_modified_since):
+                return validators.not_modified()
+
+            changes = await self.thefunscreener_service.get_constituent_changes(country, mktcap, batch_dates, top_x)
+            with stage("serialization"):
+                body = orjson.dumps(changes)
+            return validators.apply(PreSerializedJSONResponse(body))
+
+        @self.router.get("/company/{companyid}/market-cap", response_model=CompanyMarketCapHistory)
+        async def get_company_market_cap(
+            companyid: int,
+            start: Annotated[date | None, Query(description="First pricing date, YYYY-MM-DD")] = None,
+            end: Annotated[date | None, Query(description="Last pricing date, YYYY-MM-DD")] = None,
+            if_none_match: IfNoneMatch = None,
+            if_modified_since: IfModifiedSince = None,
             api_key: str = Depends(get_api_key)
-        ) -> list[MarketCapEntry]:
-            return self.thefunscreener_service.get_historical_market_cap(country, mktcap, year, month, top_x)
-        
+        ) -> Response:
+            """Daily usd market cap of a company, read from the local history store."""
+            history_store = self.thefunscreener_service.history_store
+            until = None if history_store is None else history_store.until
+            if until is None:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="The market cap history is not built"
+                )
+
+            # the history is versioned by the last stored pricing date, earlier ranges never change
+            validators = ScreenValidators(until, end is not None and end < until, "company", companyid, start, end)
+            if validators.is_not_modified(if_none_match, if_modified_since):
+                return validators.not_modified()
+
+            series = self.thefunscreener_service.get_company_market_cap(companyid, start, end)
+            if series is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No market cap history of company {companyid}")
+            days, caps = series
+            record_rows(len(days))
+            with stage("serialization"):
+                body = history_to_json(companyid, days, caps)
+            return validators.apply(PreSerializedJSONResponse(body))
+
+    def _check_country(self, country: str) -> None:
+        """Check the country of a screen route, a country, "Global", a region or a list of countries.
+
+        Raises:
+            HTTPException: 422 if it is a malformed list of countries
+        """
+        try:
+            resolve_countries(country)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)) from e
+
+    def _batch_dates(
+        self, start: str | None, end: str | None, dates: list[date] | None, min_dates: int = 1
+    ) -> list[str]:
+        """Get the dates of a batch request, the given dates or the month starts from start to end.
+
+        Raises:
+            HTTPException: 422 if neither is given or the number of dates is out of bounds
+        """
+        try:
+            if dates:
+                batch_dates = [d.isoformat() for d in dates]
+            elif start and end:
+                batch_dates = month_starts(start, end)
+            else:
+                raise ValueError("Pass either dates or start and end")
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)) from e
+
+        if not min_dates <= len(batch_dates) <= self.batch_max_dates:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"A batch must contain between {min_dates} and {self.batch_max_dates} dates",
+            )
+        return batch_dates
+
+    async def _screen_validators(self, asofdate: date | None, *params) -> ScreenValidators:
+        """Get the caching validators of a screen.
+
+        A screen of a date before the last loaded pricing date can not change anymore,
+        its validators only depend on the date and the parameters. The latest screens
+        and screens of later dates are versioned by the last loaded pricing date, the
+        latest screens are also screened as of that date, so it fully identifies them.
+
+        Args:
+            asofdate: The (last) date of the screen, None for the latest screens
+            params: Everything else the response body depends on
+
+        Returns:
+            ScreenValidators: ETag, Last-Modified and Cache-Control of the response
+        """
+        version = await self.thefunscreener_service.get_data_version()
+        if asofdate is not None and version is not None and asofdate < version:
+            return ScreenValidators(asofdate, True, *params)
+        return ScreenValidators(version, False, asofdate, *params)
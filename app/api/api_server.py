@@ -1,8 +1,13 @@
+import importlib.util
+import os
+import sys
+from typing import Any, AsyncContextManager, Callable
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from fastapi import APIRouter
 from app.utils.logging import get_logger
+from app.utils.metrics import MetricsMiddleware
 
 # Initialize logger
 logger = get_logger(__name__)
@@ -11,13 +16,20 @@ logger = get_logger(__name__)
 class TheFunScreenerServer:
     """Server class handling FastAPI setup and authentication."""
 
-    def __init__(self):
-        """Initialize server with configuration."""
-        self.app = self.setup_web_app()
+    def __init__(self, lifespan: Callable[[FastAPI], AsyncContextManager[Any]] | None = None):
+        """Initialize server with configuration.
 
-    def setup_web_app(self) -> FastAPI:
+        Args:
+            lifespan: Startup and shutdown of the application's resources
+        """
+        self.app = self.setup_web_app(lifespan)
+
+    def setup_web_app(self, lifespan: Callable[[FastAPI], AsyncContextManager[Any]] | None = None) -> FastAPI:
         """Set up and configure the FastAPI application.
 
+        Args:
+            lifespan: Startup and shutdown of the application's resources
+
         Returns:
             FastAPI: Configured FastAPI application
         """
@@ -28,6 +40,7 @@ class TheFunScreenerServer:
             openapi_url="/api/v1/openapi.json",
             description="API for thefunscreener",
             version="1.0.0",
+            lifespan=lifespan,
         )
 
         # Add CORS middleware
@@ -40,6 +53,9 @@ class TheFunScreenerServer:
             allow_headers=["*"],
         )
 
+        # Latency, stage timings and rows of every request, served by /metrics
+        app.add_middleware(MetricsMiddleware)
+
         return app
 
     def add_routes(self, router: APIRouter) -> None:
@@ -53,3 +69,44 @@ class TheFunScreenerServer:
     def run(self, port: int = 8033) -> None:
         """Run the FastAPI application."""
         uvicorn.run(self.app, host="0.0.0.0", port=port, reload=False)
+
+    @staticmethod
+    def run_workers(
+        app_path: str, port: int = 8033, workers: int = 2, graceful_timeout: int = 30, gunicorn_conf: str | None = None
+    ) -> None:
+        """Run the application in one or several worker processes.
+
+        With gunicorn_conf and gunicorn installed (not on windows), the process is
+        replaced by a gunicorn master with that configuration, which reloads its
+        workers gracefully on kill -HUP. Otherwise the uvicorn supervisor runs the
+        workers, it has no graceful reload.
+
+        Args:
+            app_path: Import string of the application factory, e.g. "app.main:create_app",
+                every worker imports it and builds its app
+            port: Port shared by the workers
+            workers: Number of worker processes
+            graceful_timeout: Seconds the workers may finish their requests on shutdown
+            gunicorn_conf: Path of the gunicorn configuration, e.g. "app/gunicorn_conf.py"
+        """
+        if gunicorn_conf is not None and importlib.util.find_spec("gunicorn") is not None:
+            logger.info(f"Starting {workers} workers with gunicorn, kill -HUP {os.getpid()} reloads them")
+            # the command line wins over the configuration file
+            os.execv(sys.executable, [
+                sys.executable, "-m", "gunicorn",
+                "--config", gunicorn_conf,
+                "--bind", f"0.0.0.0:{port}",
+                "--workers", str(workers),
+                "--graceful-timeout", str(graceful_timeout),
+                f"{app_path}()",
+            ])
+
+        logger.info(f"Starting {workers} workers with uvicorn, without graceful reload")
+        uvicorn.run(
+            app_path,
+            factory=True,
+            host="0.0.0.0",
+            port=port,
+            workers=workers,
+            timeout_graceful_shutdown=graceful_timeout,
+        )
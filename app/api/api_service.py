@@ -1,59 +1,190 @@
-from datetime import datetime
+from __future__ import annotations
+import asyncio
+import time
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable
+from contextlib import aclosing
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Any
+from app.cache import MarketCapHistoryStore, MarketCapUniverse, ScreenCache, SharedScreenCache, SnapshotStore
 from app.database.db_task_manager import TaskManagerRepository
+from app.models.screen_result import ScreenResult
+from app.utils.imports import LazyModule
 from app.utils.logging import get_logger
-from app.utils.helper import convert_mktcap_to_number
-from app.models.marketcap import MarketCapEntry
+from app.utils.metrics import stage
+from app.utils.helper import convert_mktcap_to_number, lowest_mktcap_threshold, resolve_countries
 
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = LazyModule("numpy")
 
 logger = get_logger(__name__)
 
+
+def diff_constituents(before: ScreenResult, after: ScreenResult) -> dict[str, list[dict[str, Any]]]:
+    """
+    Get the companies that entered, left or changed rank between two screens
+
+    Both screens are sorted by usdmarketcap, the rank of a company is its position
+    (1 = largest). The company ids of each screen are sorted once, the adds, drops
+    and common companies are set operations on the sorted ids.
+
+    Args:
+        before: The screen of the earlier date
+        after: The screen of the later date
+
+    Returns:
+        dict: adds (by new rank), drops (by old rank) and moves (by new rank),
+            shaped like ConstituentChanges
+    """
+    # position of every company in the screen, in the order of the sorted ids
+    order_before = np.argsort(before.columns["companyid"], kind="stable")
+    order_after = np.argsort(after.columns["companyid"], kind="stable")
+    ids_before = before.columns["companyid"][order_before]
+    ids_after = after.columns["companyid"][order_after]
+
+    added = np.setdiff1d(ids_after, ids_before, assume_unique=True)
+    dropped = np.setdiff1d(ids_before, ids_after, assume_unique=True)
+    common, common_before, common_after = np.intersect1d(ids_before, ids_after, assume_unique=True, return_indices=True)
+
+    def constituents(screen: ScreenResult, ids_sorted: np.ndarray, order: np.ndarray, ids: np.ndarray) -> list[dict[str, Any]]:
+        rows = np.sort(order[np.searchsorted(ids_sorted, ids)])
+        return [
+            {"companyid": companyid, "companyname": name, "tickersymbol": ticker, "rank": rank, "usdmarketcap": cap}
+            for companyid, name, ticker, rank, cap in zip(
+                screen.columns["companyid"][rows].tolist(),
+                screen.columns["companyname"][rows].tolist(),
+                screen.columns["tickersymbol"][rows].tolist(),
+                (rows + 1).tolist(),
+                screen.columns["usdmarketcap"][rows].tolist(),
+                strict=True,
+            )
+        ]
+
+    from_rank = order_before[common_before] + 1
+    to_rank = order_after[common_after] + 1
+    moved = np.flatnonzero(from_rank != to_rank)
+    moved = moved[np.argsort(to_rank[moved], kind="stable")]
+    return {
+        "adds": constituents(after, ids_after, order_after, added),
+        "drops": constituents(before, ids_before, order_before, dropped),
+        "moves": [
+            {"companyid": companyid, "tickersymbol": ticker, "from_rank": old, "to_rank": new}
+            for companyid, ticker, old, new in zip(
+                common[moved].tolist(),
+                after.columns["tickersymbol"][order_after[common_after[moved]]].tolist(),
+                from_rank[moved].tolist(),
+                to_rank[moved].tolist(),
+                strict=True,
+            )
+        ],
+    }
+
+
 class TheFunScreenerService:
-    def __init__(self, task_manager: TaskManagerRepository):
+    def __init__(
+        self,
+        task_manager: TaskManagerRepository,
+        snapshot_store: SnapshotStore | None = None,
+        screen_cache: ScreenCache | None = None,
+        universe_mode: bool = False,
+        batch_concurrency: int = 4,
+        stream_chunk_size: int = 2000,
+        shared_cache: SharedScreenCache | None = None,
+        version_ttl: float = 60.0,
+        history_store: MarketCapHistoryStore | None = None,
+    ):
+        """
+        Args:
+            task_manager: Repository running the market cap queries
+            snapshot_store: Persistent store of historical screens
+            screen_cache: In-memory cache of screens
+            universe_mode: If True, query one Global universe per date at the lowest
+                threshold and answer every country/category/top_x from it in memory
+            batch_concurrency: Dates of a batch request that are screened concurrently
+            stream_chunk_size: Rows read from the database at a time by the stream_* methods
+            shared_cache: Cache of the latest screens shared by the worker processes, consulted
+                before querying a screen the in-memory cache misses
+            version_ttl: Seconds the data version (last pricing date) is cached, new data
+                shows up in the latest screens at most this long after it was loaded
+            history_store: Local store of the daily market cap of every company
+        """
         self.task_manager = task_manager
+        self.snapshot_store = snapshot_store
+        self.screen_cache = screen_cache
+        self.universe_mode = universe_mode
+        self.batch_concurrency = batch_concurrency
+        self.stream_chunk_size = stream_chunk_size
+        self.shared_cache = shared_cache
+        self.version_ttl = version_ttl
+        self.history_store = history_store
+        self._data_version: date | None = None
+        self._data_version_expires = 0.0
+        self._data_version_load: asyncio.Future | None = None
 
 
-    def get_latest_market_cap(self, country: str, mktcap: str, top_x: int | None = None) -> list[MarketCapEntry]:
+    async def get_latest_market_cap(self, country: str, mktcap: str, top_x: int | None = None) -> ScreenResult:
         """
         Get the latest market cap for a given country and market cap category
 
         Args:
-            country: The country to get the market cap for
+            country: The country to get the market cap for, also "Global", a named
+                region (e.g. "EU") or a comma-separated list of countries
             mktcap: The market cap category, can take values "mega", "large", "mid"
 
         Returns:
-            list[MarketCapEntry]: A list of market cap entries
+            ScreenResult: The screen, one row with the MarketCapEntry fields per company
         """
         mktcap_thres = convert_mktcap_to_number(mktcap)
+        countries = resolve_countries(country)
 
-        # get the latest trading date
-        today = datetime.now().strftime("%Y-%m-%d")
+        # the latest screens are screened as of and cached per data version, so a screen
+        # is fully identified by the version its ETag is derived from
+        version = await self.get_data_version()
+        asofdate = self._latest_asofdate(version)
 
-        res = self.task_manager.query_global_market_cap(
-            asofdate=today, 
-            mktcap_thres=mktcap_thres, 
-            country=country, 
-            allow_fuzzy=True,
+        return await self._screen_countries(
+            countries, top_x, lambda code: self._get_latest_screen(asofdate, version, code, mktcap_thres, top_x)
         )
 
-        # keep the most recent marketcap
-        res = res.sort_values(by="pricingdate", ascending=False).drop_duplicates(subset="companyid")
+    @staticmethod
+    def _latest_asofdate(version: date | None) -> str:
+        """
+        Get the date the latest screens are screened as of, the last loaded pricing date
+
+        Screening as of the data version instead of today, the latest screens only change
+        when new data is loaded, not when the day rolls over without new data (weekends,
+        holidays, a late load). Today if no data is loaded.
+        """
+        return (version or datetime.now().date()).isoformat()
+
+    async def _get_latest_screen(
+        self, asofdate: str, version: date | None, country: str, mktcap_thres: float, top_x: int | None
+    ) -> ScreenResult:
+        """
+        Get the latest screen of one country
+        """
+        if self.universe_mode:
+            universe = await self._get_universe(asofdate, version)
+            with stage("transform"):
+                return universe.select(country, mktcap_thres, top_x)
+
+        # the screen only changes with the daily data load, identical requests share one query
+        if self.screen_cache is not None:
+            res = await self.screen_cache.get_or_load(
+                (asofdate, version, country, mktcap_thres),
+                lambda: self._load_shared_screen(asofdate, country, mktcap_thres, version),
+            )
+        else:
+            res = await self._load_screen(asofdate, country, mktcap_thres, top_x)
 
         if top_x is not None:
-            res = res.sort_values(by="usdmarketcap", ascending=False).head(top_x)
-
-        return [MarketCapEntry(
-            companyid=row["companyid"],
-            marketcap=row["marketcap"],
-            pricingdate=row["pricingdate"].strftime("%Y-%m-%d"),
-            usdmarketcap=row["usdmarketcap"],
-            companyname=row["companyname"],
-            tickersymbol=row["tickersymbol"],
-            currency=row["currency"],
-            exchange=row["exchange"],
-            country=row["country"]
-            ) for _, row in res.iterrows()]
-
-    def get_historical_market_cap(self, country: str, mktcap: str, year: int, month:int, top_x: int | None = None) -> list[MarketCapEntry]:
+            with stage("transform"):
+                res = res.top(top_x)
+
+        return res
+
+    async def get_historical_market_cap(self, country: str, mktcap: str, year: int, month:int, top_x: int | None = None) -> ScreenResult:
         """
         Get the historical market cap for a given country and market cap category
         """
@@ -62,25 +193,352 @@ class TheFunScreenerService:
         # get historical market cap
         historical_date = datetime(year, month, 1).strftime("%Y-%m-%d")
 
-        #TODO cache data if it does not exist
-        #TODO if it exists, load from cache
+        return await self._get_historical_screen(historical_date, country, mktcap_thres, top_x)
+
+    def get_historical_market_cap_batch(
+        self, country: str, mktcap: str, dates: list[str], top_x: int | None = None
+    ) -> AsyncIterator[tuple[str, ScreenResult]]:
+        """
+        Get the historical market cap of many dates for a given country and market cap category
+
+        The dates are screened concurrently (at most batch_concurrency at a time, cached
+        dates come from the snapshot store) and yielded in the given order as soon as
+        they are ready.
+
+        Args:
+            country: The country to get the market cap for
+            mktcap: The market cap category, can take values "mega", "large", "mid"
+            dates: The dates to screen, formatted as YYYY-MM-DD
+            top_x: If set, only the top_x largest companies of every date
+
+        Returns:
+            AsyncIterator[tuple[str, ScreenResult]]: The dates and their screens
+        """
+        # validate before the first screen is requested
+        mktcap_thres = convert_mktcap_to_number(mktcap)
+        resolve_countries(country)
+        return self._iter_historical_screens(country, mktcap_thres, dates, top_x)
+
+    async def _iter_historical_screens(
+        self, country: str, mktcap_thres: float, dates: list[str], top_x: int | None
+    ) -> AsyncIterator[tuple[str, ScreenResult]]:
+        """
+        Screen many dates concurrently and yield them in order
+        """
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def screen(asofdate: str) -> ScreenResult:
+            async with semaphore:
+                return await self._get_historical_screen(asofdate, country, mktcap_thres, top_x)
+
+        tasks = [asyncio.ensure_future(screen(asofdate)) for asofdate in dates]
+        try:
+            for asofdate, task in zip(dates, tasks, strict=True):
+                yield asofdate, await task
+        finally:
+            # the consumer stopped early (e.g. the client disconnected)
+            for task in tasks:
+                task.cancel()
+
+    async def get_constituent_changes(
+        self, country: str, mktcap: str, dates: list[str], top_x: int | None = None
+    ) -> list[dict[str, Any]]:
+        """
+        Get the adds, drops and rank moves of a screen between consecutive dates
+
+        The screens of the dates are read like get_historical_market_cap_batch (cached
+        dates come from the snapshot store), only their differences are returned.
+
+        Args:
+            country: The country to get the market cap for
+            mktcap: The market cap category, can take values "mega", "large", "mid"
+            dates: The dates to compare, formatted as YYYY-MM-DD, at least two
+            top_x: If set, only the top_x largest companies of every date are constituents
+
+        Returns:
+            list[dict]: The changes from every date to the next one, shaped like ConstituentChanges
+        """
+        if len(dates) < 2:
+            raise ValueError("At least two dates are needed to compare constituents")
+        mktcap_thres = convert_mktcap_to_number(mktcap)
+
+        changes = []
+        previous: tuple[str, ScreenResult] | None = None
+        async for asofdate, screen in self._iter_historical_screens(country, mktcap_thres, dates, top_x):
+            if previous is not None:
+                with stage("transform"):
+                    diff = diff_constituents(previous[1], screen)
+                changes.append({"from_date": previous[0], "to_date": asofdate, **diff})
+            previous = (asofdate, screen)
+        return changes
+
+    def stream_latest_market_cap(
+        self, country: str, mktcap: str, top_x: int | None = None
+    ) -> AsyncGenerator[ScreenResult, None]:
+        """
+        Stream the latest market cap for a given country and market cap category in chunks
+
+        Args:
+            country: The country to get the market cap for
+            mktcap: The market cap category, can take values "mega", "large", "mid"
+            top_x: If set, only the top_x largest companies
+
+        Returns:
+            AsyncGenerator[ScreenResult, None]: The screen in chunks, sorted by usdmarketcap
+        """
+        mktcap_thres = convert_mktcap_to_number(mktcap)
+        resolve_countries(country)
+        return self._stream_screen(None, country, mktcap_thres, top_x)
+
+    def stream_historical_market_cap(
+        self, country: str, mktcap: str, year: int, month: int, top_x: int | None = None
+    ) -> AsyncGenerator[ScreenResult, None]:
+        """
+        Stream the historical market cap for a given country and market cap category in chunks
+        """
+        mktcap_thres = convert_mktcap_to_number(mktcap)
+        resolve_countries(country)
+        historical_date = datetime(year, month, 1).strftime("%Y-%m-%d")
+        return self._stream_screen(historical_date, country, mktcap_thres, top_x)
+
+    def get_company_market_cap(
+        self, companyid: int, start: date | None = None, end: date | None = None
+    ) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        Get the daily usd market cap of a company from the history store, without a database query
+
+        Args:
+            companyid: The company
+            start: First pricing date, defaults to the first one stored
+            end: Last pricing date, defaults to the last one stored
+
+        Returns:
+            tuple[np.ndarray, np.ndarray] | None: Pricing dates (days since 1970-01-01) and
+                usd market caps, None if the company is not in the store
+        """
+        if self.history_store is None:
+            return None
+        return self.history_store.series(companyid, start, end)
+
+    def get_cache_stats(self) -> dict:
+        """
+        Get the hit/miss/eviction counters of the screen cache
+        """
+        stats = {} if self.screen_cache is None else self.screen_cache.stats()
+        if self.shared_cache is not None:
+            stats.update({f"shared_{name}": value for name, value in self.shared_cache.stats().items()})
+        return stats
+
+    async def get_data_version(self) -> date | None:
+        """
+        Get the last loaded pricing date, the version of the data of every screen
+
+        The version is cached for version_ttl seconds and concurrent callers share one query.
+        """
+        if self._data_version_load is None and time.monotonic() < self._data_version_expires:
+            return self._data_version
+
+        if self._data_version_load is None:
+            self._data_version_load = asyncio.ensure_future(self._load_data_version())
+        return await asyncio.shield(self._data_version_load)
+
+    async def _load_data_version(self) -> date | None:
+        """
+        Query the data version and cache it
+        """
+        try:
+            version = await self.task_manager.query_latest_pricingdate_async()
+            if version != self._data_version:
+                logger.info(f"Data version is {version}")
+            self._data_version = version
+            self._data_version_expires = time.monotonic() + self.version_ttl
+            return version
+        finally:
+            self._data_version_load = None
+
+    async def _load_shared_screen(
+        self, asofdate: str, country: str, mktcap_thres: float, version: date | None = None
+    ) -> ScreenResult:
+        """
+        Load a screen through the cache shared by the workers, so only one of them queries it
+        """
+        if self.shared_cache is None:
+            return await self._load_screen(asofdate, country, mktcap_thres)
+        return await self.shared_cache.get_or_load(
+            (asofdate, version, country, mktcap_thres),
+            lambda: self._load_screen(asofdate, country, mktcap_thres),
+        )
+
+    async def _load_screen(self, asofdate: str, country: str, mktcap_thres: float, top_x: int | None = None) -> ScreenResult:
+        """
+        Query a screen with the most recent market cap of every company, sorted by usdmarketcap
+
+        The deduplication and top_x are done by the database, so only the rows of the
+        response are transferred. Pass top_x only if the result is not reused.
+        """
+        return await self.task_manager.query_global_market_cap_async(
+            asofdate=asofdate,
+            mktcap_thres=mktcap_thres,
+            country=country,
+            allow_fuzzy=True,
+            latest_only=True,
+            limit=top_x,
+        )
+
+    async def _stream_screen(
+        self, asofdate: str | None, country: str, mktcap_thres: float, top_x: int | None
+    ) -> AsyncGenerator[ScreenResult, None]:
+        """
+        Stream a screen in chunks
+
+        A screen already held by the screen cache is yielded as is. Otherwise it is read
+        with a server-side cursor and not cached, so a large screen (e.g. Global/mid)
+        never has to fit in memory at once. The latest screen (asofdate None) is
+        screened as of and looked up under the current data version. The screens of
+        a region are merged in memory and yielded as one chunk.
+        """
+        latest = asofdate is None
+        version = None
+        if asofdate is None:
+            version = await self.get_data_version()
+            asofdate = self._latest_asofdate(version)
+        countries = resolve_countries(country)
+        if len(countries) > 1:
+            if latest:
+                yield await self._screen_countries(
+                    countries, top_x, lambda code: self._get_latest_screen(asofdate, version, code, mktcap_thres, top_x)
+                )
+            else:
+                yield await self._screen_countries(
+                    countries, top_x, lambda code: self._get_historical_country_screen(asofdate, code, mktcap_thres, top_x)
+                )
+            return
+
+        # cached and queried under the normalized code, like the screens that are not streamed
+        country = countries[0]
+        cached = self._get_cached_screen(asofdate, country, mktcap_thres, top_x, version)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = self.task_manager.stream_global_market_cap_async(
+            asofdate=asofdate,
+            mktcap_thres=mktcap_thres,
+            country=country,
+            allow_fuzzy=True,
+            latest_only=True,
+            limit=top_x,
+            chunk_size=self.stream_chunk_size,
+        )
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                yield chunk
+
+    def _get_cached_screen(
+        self, asofdate: str, country: str, mktcap_thres: float, top_x: int | None, version: date | None = None
+    ) -> ScreenResult | None:
+        """
+        Get a screen from the screen cache without loading it, None if not cached
+        """
+        if self.screen_cache is None:
+            return None
+
+        if self.universe_mode:
+            universe = self.screen_cache.get(("universe", asofdate, version))
+            return None if universe is None else universe.select(country, mktcap_thres, top_x)
+
+        res = self.screen_cache.get((asofdate, version, country, mktcap_thres))
+        if res is not None and top_x is not None:
+            with stage("transform"):
+                res = res.top(top_x)
+        return res
+
+    async def _screen_countries(
+        self, countries: list[str], top_x: int | None, screen: Callable[[str], Awaitable[ScreenResult]]
+    ) -> ScreenResult:
+        """
+        Screen every country of a region, at most batch_concurrency at a time, and merge the screens
+
+        Every country is screened (and cached) on its own, the sorted screens are merged
+        with a k-way merge so top_x applies to the whole region.
+        """
+        if len(countries) == 1:
+            return await screen(countries[0])
+
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def bounded(country: str) -> ScreenResult:
+            async with semaphore:
+                return await screen(country)
+
+        screens = await asyncio.gather(*(bounded(country) for country in countries))
+        with stage("transform"):
+            return ScreenResult.merge_top(screens, top_x)
+
+    async def _get_historical_screen(self, asofdate: str, country: str, mktcap_thres: float, top_x: int | None) -> ScreenResult:
+        """
+        Get the screen of a past date, of a country or a region
+        """
+        return await self._screen_countries(
+            resolve_countries(country),
+            top_x,
+            lambda code: self._get_historical_country_screen(asofdate, code, mktcap_thres, top_x),
+        )
 
-        res = self.task_manager.query_global_market_cap(asofdate=historical_date, mktcap_thres=mktcap_thres, country=country, allow_fuzzy=True)
+    async def _get_historical_country_screen(
+        self, asofdate: str, country: str, mktcap_thres: float, top_x: int | None
+    ) -> ScreenResult:
+        """
+        Get the screen of a past date of one country
+        """
+        if self.universe_mode:
+            universe = await self._get_universe(asofdate)
+            with stage("transform"):
+                return universe.select(country, mktcap_thres, top_x)
 
-        # keep the most recent marketcap
-        res = res.sort_values(by="pricingdate", ascending=False).drop_duplicates(subset="companyid")
+        res = await self._get_snapshot(asofdate, country, mktcap_thres, top_x)
 
         if top_x is not None:
-            res = res.sort_values(by="usdmarketcap", ascending=False).head(top_x)
-
-        return [MarketCapEntry(
-            companyid=row["companyid"],
-            marketcap=row["marketcap"],
-            pricingdate=row["pricingdate"].strftime("%Y-%m-%d"),
-            usdmarketcap=row["usdmarketcap"],
-            companyname=row["companyname"],
-            tickersymbol=row["tickersymbol"],
-            currency=row["currency"],
-            exchange=row["exchange"],
-            country=row["country"]
-            ) for _, row in res.iterrows()]
\ No newline at end of file
+            with stage("transform"):
+                res = res.top(top_x)
+
+        return res
+
+    async def _get_snapshot(self, asofdate: str, country: str, mktcap_thres: float, top_x: int | None = None) -> ScreenResult:
+        """
+        Get a screen through the snapshot store, past screens never change
+
+        top_x is only pushed to the database if there is no store to fill.
+        """
+        if self.snapshot_store is None:
+            return await self._load_screen(asofdate, country, mktcap_thres, top_x)
+
+        res = await asyncio.to_thread(self.snapshot_store.load, asofdate, country, mktcap_thres)
+        if res is None:
+            res = await self._load_screen(asofdate, country, mktcap_thres)
+
+            # only cache complete screens, the data of today or later is still being loaded
+            if asofdate < datetime.now().strftime("%Y-%m-%d"):
+                await asyncio.to_thread(self.snapshot_store.save, asofdate, country, mktcap_thres, res)
+
+        return res
+
+    async def _get_universe(self, asofdate: str, version: date | None = None) -> MarketCapUniverse:
+        """
+        Get the Global universe at the lowest threshold of a date, every screen of the date is a slice of it
+
+        The latest universe is cached per data version, past ones with version None.
+        """
+        lowest_thres = lowest_mktcap_threshold()
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        async def load():
+            if version is None and asofdate < today:
+                res = await self._get_snapshot(asofdate, "Global", lowest_thres)
+            else:
+                res = await self._load_shared_screen(asofdate, "Global", lowest_thres, version)
+            return MarketCapUniverse(res)
+
+        if self.screen_cache is None:
+            return await load()
+        return await self.screen_cache.get_or_load(("universe", asofdate, version), load)
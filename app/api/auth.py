@@ -1,10 +1,103 @@
+import hmac
+import signal
+from typing import Callable, Iterable
 from fastapi import Security, HTTPException, status
 from fastapi.security.api_key import APIKeyHeader
 from app.config.config import Config
+from app.utils.logging import get_logger
+from app.utils.metrics import stage
+
+# Initialize logger
+logger = get_logger(__name__)
 
 API_KEY_NAME = "thefunscreener-api-key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=True)
 
+
+def load_api_keys() -> frozenset[str]:
+    """Load the accepted api keys from the configuration (.env and environment).
+
+    Returns:
+        frozenset[str]: The accepted api keys
+    """
+    return Config.load_configuration().api_keys
+
+
+class ApiKeys:
+    """Accepted api keys, loaded once and only reloaded on request.
+
+    The key set is an immutable snapshot, a reload swaps it as a whole, so requests
+    validating concurrently see either the old or the new keys.
+    """
+
+    def __init__(self, loader: Callable[[], Iterable[str]] = load_api_keys):
+        """Initialize the key set, the keys are loaded on first use.
+
+        Args:
+            loader: Function returning the accepted api keys
+        """
+        self.loader = loader
+        self._keys: frozenset[bytes] | None = None
+
+    def reload(self, keys: Iterable[str] | None = None) -> None:
+        """Load the keys again, e.g. after a key rotation.
+
+        Args:
+            keys: The accepted keys, if None they are taken from the loader
+        """
+        if keys is None:
+            keys = self.loader()
+        self._keys = frozenset(key.encode() for key in keys)
+        logger.info(f"Loaded {len(self._keys)} api key(s)")
+
+    def is_valid(self, key: str) -> bool:
+        """Check a key in constant time against every accepted key.
+
+        Args:
+            key: The key sent by the client
+
+        Returns:
+            bool: True if the key is accepted
+        """
+        if self._keys is None:
+            self.reload()
+        assert self._keys is not None
+
+        candidate = key.encode()
+        valid = False
+        # no early exit, the time taken does not depend on which key matched
+        for accepted in self._keys:
+            valid |= hmac.compare_digest(candidate, accepted)
+        return valid
+
+
+api_keys = ApiKeys()
+
+
+def install_reload_handler(keys: ApiKeys = api_keys) -> None:
+    """Reload the api keys when the process receives SIGHUP.
+
+    Rotate a key by editing .env (or API_KEY/API_KEYS) and sending `kill -HUP <pid>`.
+    Only the api keys are reloaded, the other settings still require a restart.
+
+    Args:
+        keys: The key set to reload
+    """
+    if not hasattr(signal, "SIGHUP"):
+        logger.warning("SIGHUP is not available, api keys are only loaded at startup")
+        return
+
+    def handle_sighup(signum, frame):
+        logger.info("Received SIGHUP, reloading api keys")
+        try:
+            keys.reload()
+        except Exception as e:
+            # keep serving with the previous keys
+            logger.error(f"Failed to reload api keys: {e}")
+
+    signal.signal(signal.SIGHUP, handle_sighup)
+
+
 async def get_api_key(api_key_header: str = Security(api_key_header)):
     """Validate API key from header.
     
@@ -17,8 +110,9 @@ async def get_api_key(api_key_header: str = Security(api_key_header)):
     Raises:
         HTTPException: If API key is invalid
     """
-    config = Config().load_configuration()
-    if api_key_header != config.api_key:
+    with stage("auth"):
+        valid = api_keys.is_valid(api_key_header)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API Key"
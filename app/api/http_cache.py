@@ -0,0 +1,73 @@
+# HTTP caching of the screens
+# A screen is identified by its parameters and the version of the data it is
+# computed from (the last loaded pricing date), so the validators are known before
+# the screen is queried and a revalidation is answered without touching it.
+import hashlib
+from datetime import date, datetime, time, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict
+from fastapi import status
+from fastapi.responses import Response
+
+# Screens of dates before the data version never change
+IMMUTABLE = "private, max-age=31536000, immutable"
+# The latest screens change with every data load, clients revalidate each time
+REVALIDATE = "private, no-cache"
+
+
+class ScreenValidators:
+    """ETag, Last-Modified and Cache-Control of a screen response."""
+
+    def __init__(self, version: date | None, immutable: bool, *params: Any):
+        """Derive the validators of a screen.
+
+        Args:
+            version: Last loaded pricing date the screen is computed from
+            immutable: True if the screen can not change anymore
+            params: Everything else the response body depends on (route, parameters, format)
+        """
+        key = repr((version.isoformat() if version else None, params)).encode()
+        self.etag = f'"{hashlib.sha1(key).hexdigest()}"'
+        self.last_modified = None if version is None else datetime.combine(version, time(), tzinfo=timezone.utc)
+        self.cache_control = IMMUTABLE if immutable else REVALIDATE
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """The caching headers of the response."""
+        headers = {"ETag": self.etag, "Cache-Control": self.cache_control, "Vary": "Accept"}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+    def is_not_modified(self, if_none_match: str | None, if_modified_since: str | None) -> bool:
+        """Check whether the client's copy is current.
+
+        If-None-Match takes precedence, If-Modified-Since is only used without it.
+
+        Args:
+            if_none_match: The If-None-Match header
+            if_modified_since: The If-Modified-Since header
+
+        Returns:
+            bool: True if a 304 can be sent
+        """
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            # weak comparison, W/"x" matches "x"
+            return "*" in tags or any(tag.removeprefix("W/") == self.etag for tag in tags)
+
+        if if_modified_since is not None and self.last_modified is not None:
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def not_modified(self) -> Response:
+        """Build the 304 response."""
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=self.headers)
+
+    def apply(self, response: Response) -> Response:
+        """Add the caching headers to a response."""
+        response.headers.update(self.headers)
+        return response
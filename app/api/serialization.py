@@ -0,0 +1,338 @@
+# Serialization of market cap screens
+# Screens are converted column by column and written with orjson, instead of
+# validating one MarketCapEntry per row and encoding it with the json module
+from __future__ import annotations
+import io
+from collections.abc import AsyncIterator
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Dict, List
+import orjson
+from fastapi.responses import Response, StreamingResponse
+from app.models.marketcap import MarketCapEntry
+from app.models.screen_result import CATEGORICAL_FIELDS, ScreenResult, arrow_schema
+from app.utils.imports import LazyModule
+from app.utils.metrics import record_rows, stage
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pyarrow as pa
+else:
+    np = LazyModule("numpy")
+    pa = LazyModule("pyarrow")
+
+# output fields, in the order of MarketCapEntry
+FIELDS: List[str] = list(MarketCapEntry.model_fields)
+
+
+def screen_to_columns(screen: ScreenResult) -> Dict[str, List[Any]]:
+    """Convert a screen to one list of plain python values per field.
+
+    Args:
+        screen: The screen
+
+    Returns:
+        dict: Field name to column values
+    """
+    columns: Dict[str, List[Any]] = {}
+    for field in FIELDS:
+        if field == "pricingdate":
+            columns[field] = np.datetime_as_string(screen.columns[field], unit="D").tolist()
+        else:
+            # numpy scalars become python ints, floats and strs
+            columns[field] = screen[field].tolist()
+    return columns
+
+
+def screen_to_records(screen: ScreenResult) -> List[Dict[str, Any]]:
+    """Convert a screen to a list of dicts shaped like MarketCapEntry.
+
+    Args:
+        screen: The screen
+
+    Returns:
+        list[dict]: One record per row
+    """
+    columns = screen_to_columns(screen)
+    return [dict(zip(FIELDS, row, strict=True)) for row in zip(*columns.values(), strict=True)]
+
+
+def screen_to_json(screen: ScreenResult) -> bytes:
+    """Serialize a screen to the json of list[MarketCapEntry].
+
+    Args:
+        screen: The screen
+
+    Returns:
+        bytes: The json document
+    """
+    return orjson.dumps(screen_to_records(screen))
+
+
+def screen_to_ndjson(screen: ScreenResult) -> bytes:
+    """Serialize a screen to newline delimited json, one MarketCapEntry per line.
+
+    Args:
+        screen: The screen
+
+    Returns:
+        bytes: The json lines
+    """
+    return b"".join(orjson.dumps(record) + b"\n" for record in screen_to_records(screen))
+
+
+class PreSerializedJSONResponse(Response):
+    """Json response whose body is already serialized."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return orjson.dumps(content)
+
+
+class ResponseFormat(str, Enum):
+    """Wire formats of a screen."""
+
+    json = "json"
+    columnar = "columnar"
+    arrow = "arrow"
+    ndjson = "ndjson"
+
+
+JSON_MEDIA_TYPE = "application/json"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+COLUMNAR_MEDIA_TYPE = "application/vnd.thefunscreener.columnar+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+MEDIA_TYPES = {
+    ResponseFormat.json: JSON_MEDIA_TYPE,
+    ResponseFormat.columnar: COLUMNAR_MEDIA_TYPE,
+    ResponseFormat.arrow: ARROW_MEDIA_TYPE,
+    ResponseFormat.ndjson: NDJSON_MEDIA_TYPE,
+}
+
+
+def _dictionary_column(screen: ScreenResult, field: str) -> Dict[str, List[Any]]:
+    """Get the dictionary and indices of a categorical field, the dictionary in order of first appearance."""
+    # the dictionary of a screen can hold values of rows that were filtered out
+    codes, first, indices = np.unique(screen.columns[field], return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return {
+        "dictionary": screen.dictionaries[field][codes[order]].tolist(),
+        "indices": rank[indices.reshape(-1)].tolist(),
+    }
+
+
+def screen_to_columnar_json(screen: ScreenResult) -> bytes:
+    """Serialize a screen to columnar json.
+
+    Every field is one array, string fields with few distinct values are dictionary
+    encoded:
+
+        {"length": 2,
+         "columns": {"companyid": [21835, 24937], ...,
+                     "currency": {"dictionary": ["USD"], "indices": [0, 0]}, ...}}
+
+    Args:
+        screen: The screen
+
+    Returns:
+        bytes: The json document
+    """
+    columns: Dict[str, Any] = screen_to_columns(screen)
+    for field in CATEGORICAL_FIELDS:
+        columns[field] = _dictionary_column(screen, field)
+    return orjson.dumps({"length": len(screen), "columns": columns})
+
+
+def screen_to_arrow(screen: ScreenResult) -> bytes:
+    """Serialize a screen to an Arrow IPC stream.
+
+    Args:
+        screen: The screen
+
+    Returns:
+        bytes: The Arrow IPC stream with a single record batch
+    """
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, arrow_schema()) as writer:
+        writer.write_table(screen.to_arrow())
+    return sink.getvalue().to_pybytes()
+
+
+def history_to_json(companyid: int, days: np.ndarray, caps: np.ndarray) -> bytes:
+    """Serialize the market cap history of a company to the json of CompanyMarketCapHistory.
+
+    Args:
+        companyid: The company
+        days: Pricing dates as days since 1970-01-01
+        caps: The usd market cap of every pricing date
+
+    Returns:
+        bytes: The json document
+    """
+    return orjson.dumps({
+        "companyid": companyid,
+        "pricingdate": np.datetime_as_string(days.astype("datetime64[D]"), unit="D").tolist(),
+        "usdmarketcap": caps.tolist(),
+    })
+
+
+def negotiate_format(response_format: ResponseFormat | None, accept: str | None) -> ResponseFormat:
+    """Pick the wire format, an explicit format parameter wins over the Accept header.
+
+    Args:
+        response_format: The requested format, if any
+        accept: The Accept header of the request
+
+    Returns:
+        ResponseFormat: The format to respond with
+    """
+    if response_format is not None:
+        return response_format
+    if accept:
+        for media_range in accept.split(","):
+            media_type = media_range.split(";")[0].strip().lower()
+            for fmt, fmt_media_type in MEDIA_TYPES.items():
+                if media_type == fmt_media_type:
+                    return fmt
+    return ResponseFormat.json
+
+
+def render_screen(screen: ScreenResult, response_format: ResponseFormat) -> Response:
+    """Build the response of a screen in the given format.
+
+    Args:
+        screen: The screen
+        response_format: The wire format
+
+    Returns:
+        Response: The serialized screen
+    """
+    record_rows(len(screen))
+    with stage("serialization"):
+        if response_format is ResponseFormat.arrow:
+            return Response(screen_to_arrow(screen), media_type=ARROW_MEDIA_TYPE)
+        if response_format is ResponseFormat.columnar:
+            return Response(screen_to_columnar_json(screen), media_type=COLUMNAR_MEDIA_TYPE)
+        if response_format is ResponseFormat.ndjson:
+            return Response(screen_to_ndjson(screen), media_type=NDJSON_MEDIA_TYPE)
+        return PreSerializedJSONResponse(screen_to_json(screen))
+
+
+async def stream_screen_json(chunks: AsyncIterator[ScreenResult]) -> AsyncIterator[bytes]:
+    """Serialize a screen given in chunks to the json of list[MarketCapEntry], chunk by chunk.
+
+    Args:
+        chunks: The screen in chunks
+
+    Yields:
+        bytes: Consecutive pieces of the json array
+    """
+    yield b"["
+    separator = b""
+    async for chunk in chunks:
+        if not len(chunk):
+            continue
+        # strip the brackets of the chunk's array and join the arrays with a comma
+        with stage("serialization"):
+            body = screen_to_json(chunk)[1:-1]
+        yield separator + body
+        separator = b","
+    yield b"]"
+
+
+async def stream_screen_ndjson(chunks: AsyncIterator[ScreenResult]) -> AsyncIterator[bytes]:
+    """Serialize a screen given in chunks to newline delimited json, chunk by chunk.
+
+    Args:
+        chunks: The screen in chunks
+
+    Yields:
+        bytes: The json lines of a chunk
+    """
+    async for chunk in chunks:
+        if len(chunk):
+            with stage("serialization"):
+                body = screen_to_ndjson(chunk)
+            yield body
+
+
+async def stream_screen_arrow(chunks: AsyncIterator[ScreenResult]) -> AsyncIterator[bytes]:
+    """Serialize a screen given in chunks to an Arrow IPC stream with one record batch per chunk.
+
+    Args:
+        chunks: The screen in chunks
+
+    Yields:
+        bytes: The stream header, then one encoded record batch per chunk
+    """
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, arrow_schema()) as writer:
+        async for chunk in chunks:
+            with stage("serialization"):
+                writer.write_table(chunk.to_arrow())
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    # schema if nothing was written, and the end of stream marker
+    yield sink.getvalue()
+
+
+async def _collect_columnar_json(chunks: AsyncIterator[ScreenResult]) -> AsyncIterator[bytes]:
+    """Columnar json needs every column complete, so the chunks are collected first."""
+    screen = ScreenResult.concat([chunk async for chunk in chunks])
+    with stage("serialization"):
+        body = screen_to_columnar_json(screen)
+    yield body
+
+
+async def _count_rows(chunks: AsyncIterator[ScreenResult]) -> AsyncIterator[ScreenResult]:
+    """Record the rows of a streamed screen as they pass."""
+    async for chunk in chunks:
+        record_rows(len(chunk))
+        yield chunk
+
+
+def stream_screen(chunks: AsyncIterator[ScreenResult], response_format: ResponseFormat) -> StreamingResponse:
+    """Build a streamed response of a screen given in chunks.
+
+    Only the current chunk is serialized at a time, except for the columnar json
+    format which is not streamable and is built once all chunks arrived.
+
+    Args:
+        chunks: The screen in chunks
+        response_format: The wire format
+
+    Returns:
+        StreamingResponse: The serialized screen
+    """
+    chunks = _count_rows(chunks)
+    if response_format is ResponseFormat.arrow:
+        return StreamingResponse(stream_screen_arrow(chunks), media_type=ARROW_MEDIA_TYPE)
+    if response_format is ResponseFormat.columnar:
+        return StreamingResponse(_collect_columnar_json(chunks), media_type=COLUMNAR_MEDIA_TYPE)
+    if response_format is ResponseFormat.ndjson:
+        return StreamingResponse(stream_screen_ndjson(chunks), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(stream_screen_json(chunks), media_type=JSON_MEDIA_TYPE)
+
+
+async def stream_dated_screens(screens: AsyncIterator[tuple[str, ScreenResult]]) -> AsyncIterator[bytes]:
+    """Serialize screens of many dates to newline delimited json, one line per date.
+
+        {"date": "2024-01-01", "constituents": [{"companyid": 21835, ...}, ...]}
+
+    Args:
+        screens: The dates and their screens
+
+    Yields:
+        bytes: One json line per date
+    """
+    async for asofdate, screen in screens:
+        record_rows(len(screen))
+        with stage("serialization"):
+            line = orjson.dumps({"date": asofdate, "constituents": screen_to_records(screen)}) + b"\n"
+        yield line
@@ -0,0 +1,8 @@
+from .history_store import MarketCapHistoryStore
+from .screen_cache import ScreenCache
+from .shared_cache import SharedScreenCache
+from .snapshot_store import SnapshotStore
+from .universe import MarketCapUniverse
+from .warmup import CacheWarmer
+
+__all__ = ["CacheWarmer", "MarketCapHistoryStore", "MarketCapUniverse", "ScreenCache", "SharedScreenCache", "SnapshotStore"]
@@ -0,0 +1,362 @@
+from __future__ import annotations
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import date, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Tuple
+from app.database.base_database import BaseDatabase
+from app.utils.imports import LazyModule
+from app.utils.logging import get_logger
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    np = LazyModule("numpy")
+    pd = LazyModule("pandas")
+
+# Initialize logger
+logger = get_logger(__name__)
+
+# the files of a generation and the dtype of their values
+ARRAYS = {
+    "companyid": "<i8",
+    "offsets": "<i8",
+    "pricingdate": "<i4",
+    "usdmarketcap": "<f8",
+}
+
+EPOCH = date(1970, 1, 1)
+
+
+def to_days(d: date) -> int:
+    """Get a date as days since 1970-01-01, how pricing dates are stored."""
+    return (d - EPOCH).days
+
+
+class _Generation:
+    """Arrays of one written version of the store, memory-mapped read-only."""
+
+    __slots__ = ("companyid", "name", "offsets", "pricingdate", "until", "usdmarketcap")
+
+    def __init__(self, path: Path):
+        meta = json.loads((path / "meta.json").read_text())
+        self.name = path.name
+        self.until = date.fromisoformat(meta["until"])
+        self.companyid = self._map(path, "companyid")
+        self.offsets = self._map(path, "offsets")
+        self.pricingdate = self._map(path, "pricingdate")
+        self.usdmarketcap = self._map(path, "usdmarketcap")
+
+    @staticmethod
+    def _map(path: Path, field: str) -> np.ndarray:
+        """Map the file of a field."""
+        file = path / f"{field}.bin"
+        # an empty file can not be mapped
+        if not file.stat().st_size:
+            return np.empty(0, dtype=ARRAYS[field])
+        # a plain ndarray view of the mapping, slicing a memmap object is slower
+        return np.memmap(file, dtype=ARRAYS[field], mode="r").view(np.ndarray)
+
+
+class MarketCapHistoryStore:
+    """Local memory-mapped store of the daily usd market cap of every company.
+
+    The rows of a company are contiguous and sorted by pricing date, an offset index
+    gives where each company starts:
+
+        companyid     int64    sorted company ids
+        offsets       int64    rows of companyid[i] are offsets[i]:offsets[i + 1]
+        pricingdate   int32    days since 1970-01-01
+        usdmarketcap  float64
+
+    A range query is two binary searches and a slice of the mapped files, no copy and
+    no database query. The store is written by ingest (scripts/refresh_market_cap_history.py)
+    into a new generation directory next to the current one, and <root>/CURRENT is
+    switched to it once it is complete. Readers map the new generation on their next
+    query. The previous generation is kept until the next switch, older ones stay
+    readable until their mappings are dropped.
+    """
+
+    def __init__(self, root: Path):
+        """Initialize the store.
+
+        Args:
+            root: Directory of the generations, created on first ingest
+        """
+        self.root = Path(root)
+        # file holding the name of the current generation, checked on every query
+        self.current = self.root / "CURRENT"
+        # file holding the name of the generation before, removed by the next switch
+        self.previous = self.root / "PREVIOUS"
+        self._current_path = str(self.current)
+        self._generation: _Generation | None = None
+        self._current_stat: Tuple[int, int] | None = None
+        self._lock = threading.Lock()
+
+    def _get_generation(self) -> _Generation | None:
+        """Get the current generation, mapping it if it changed since the last call."""
+        try:
+            key = self._current_key()
+        except FileNotFoundError:
+            return None
+        if key != self._current_stat:
+            with self._lock:
+                if key != self._current_stat:
+                    try:
+                        name = self.current.read_text().strip()
+                        self._generation = _Generation(self.root / name)
+                    except FileNotFoundError:
+                        # switched twice since CURRENT was read, the generation it named is
+                        # gone, the one it names now is kept until the next two switches
+                        key = self._current_key()
+                        name = self.current.read_text().strip()
+                        self._generation = _Generation(self.root / name)
+                    self._current_stat = key
+                    logger.info(f"Mapped market cap history {name}")
+        return self._generation
+
+    def _current_key(self) -> Tuple[int, int]:
+        """Get what identifies the CURRENT file, it is replaced by a new file on every switch."""
+        stat = os.stat(self._current_path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    @property
+    def until(self) -> date | None:
+        """Last pricing date in the store, None if it was not built yet."""
+        generation = self._get_generation()
+        return None if generation is None else generation.until
+
+    def __len__(self) -> int:
+        generation = self._get_generation()
+        return 0 if generation is None else len(generation.pricingdate)
+
+    def series(
+        self, companyid: int, start: date | None = None, end: date | None = None
+    ) -> Tuple[np.ndarray, np.ndarray] | None:
+        """Get the market cap history of a company.
+
+        Args:
+            companyid: The company
+            start: First pricing date, defaults to the first one stored
+            end: Last pricing date, defaults to the last one stored
+
+        Returns:
+            tuple | None: Pricing dates (days since 1970-01-01) and usd market caps,
+                read-only views of the store. None if the company is not in the store
+        """
+        generation = self._get_generation()
+        if generation is None:
+            return None
+        i = int(np.searchsorted(generation.companyid, companyid))
+        if i == len(generation.companyid) or generation.companyid[i] != companyid:
+            return None
+
+        lo, hi = int(generation.offsets[i]), int(generation.offsets[i + 1])
+        days = generation.pricingdate[lo:hi]
+        first = 0 if start is None else int(np.searchsorted(days, to_days(start), side="left"))
+        last = len(days) if end is None else int(np.searchsorted(days, to_days(end), side="right"))
+        return days[first:last], generation.usdmarketcap[lo + first : lo + last]
+
+    def ingest(
+        self,
+        database: BaseDatabase,
+        since: date | None = None,
+        until: date | None = None,
+        rebuild: bool = False,
+        chunk_size: int = 100_000,
+    ) -> int:
+        """Load the market caps of new pricing dates from ciqmarketcap.
+
+        The rows of the new dates are streamed in company order and merged with the
+        current generation into a new one, so neither is held in memory at once.
+
+        Args:
+            database: Database holding the CIQ tables
+            since: First pricing date to load, defaults to the day after the last stored one
+            until: Last pricing date to load, defaults to the last one in ciqmarketcap
+            rebuild: If True, build the store from scratch instead of appending
+            chunk_size: Rows read from the database at a time
+
+        Returns:
+            int: Number of rows added
+        """
+        current = None if rebuild else self._get_generation()
+        if since is None:
+            if current is not None:
+                since = current.until + timedelta(days=1)
+            else:
+                since = self._query_date(database, "SELECT min(pricingdate) FROM ciqmarketcap")
+        elif current is not None and since <= current.until:
+            raise ValueError(f"The store already holds the pricing dates until {current.until}, rebuild it to reload them")
+        if until is None:
+            until = self._query_date(database, "SELECT max(pricingdate) FROM ciqmarketcap")
+
+        if since is None or until is None or since > until:
+            logger.info("The market cap history is up to date")
+            return 0
+
+        chunks = database.stream_columns(self._ingest_query(), {"since": since, "until": until}, chunk_size)
+        rows = self._write(current, (self._to_arrays(chunk) for chunk in chunks), until)
+        logger.info(f"Added {rows} rows of {since} - {until} to the market cap history")
+        return rows
+
+    def _write(
+        self, current: _Generation | None, chunks: Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]], until: date
+    ) -> int:
+        """Merge rows sorted by company and date, all after current.until, into a new generation.
+
+        Returns:
+            int: Number of rows merged
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = Path(tempfile.mkdtemp(dir=self.root, prefix=f"{until.isoformat()}-{uuid.uuid4().hex[:8]}-"))
+        # company ids and row counts of the written blocks, a company can span two blocks
+        blocks: List[Tuple[np.ndarray, np.ndarray]] = []
+        added = 0
+        copied = 0  # companies of the current generation written so far
+
+        try:
+            with open(path / "pricingdate.bin", "wb") as dates_file, open(path / "usdmarketcap.bin", "wb") as caps_file:
+
+                def copy_current(stop: int) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+                    """Get the rows of the current generation's companies copied..stop."""
+                    nonlocal copied
+                    if current is None or stop <= copied:
+                        return [], []
+                    lo, hi = current.offsets[copied], current.offsets[stop]
+                    blocks.append((current.companyid[copied:stop], np.diff(current.offsets[copied : stop + 1])))
+                    copied = stop
+                    return [current.pricingdate[lo:hi]], [current.usdmarketcap[lo:hi]]
+
+                for companyid, days, caps in chunks:
+                    starts = np.flatnonzero(np.r_[True, companyid[1:] != companyid[:-1]])
+                    ends = np.r_[starts[1:], len(companyid)]
+                    date_parts: List[np.ndarray] = []
+                    cap_parts: List[np.ndarray] = []
+                    for start, end in zip(starts.tolist(), ends.tolist(), strict=True):
+                        # the stored rows of the company and every company before it come first
+                        if current is not None:
+                            old_dates, old_caps = copy_current(
+                                int(np.searchsorted(current.companyid, companyid[start], side="right"))
+                            )
+                            date_parts += old_dates
+                            cap_parts += old_caps
+                        date_parts.append(days[start:end])
+                        cap_parts.append(caps[start:end])
+                    blocks.append((companyid[starts], ends - starts))
+                    dates_file.write(np.concatenate(date_parts).astype(ARRAYS["pricingdate"]).tobytes())
+                    caps_file.write(np.concatenate(cap_parts).astype(ARRAYS["usdmarketcap"]).tobytes())
+                    added += len(companyid)
+
+                if current is not None:
+                    old_dates, old_caps = copy_current(len(current.companyid))
+                    for part in old_dates:
+                        dates_file.write(part.tobytes())
+                    for part in old_caps:
+                        caps_file.write(part.tobytes())
+
+            # merge the blocks of companies spanning two blocks into one index entry
+            ids = np.concatenate([ids for ids, _ in blocks]) if blocks else np.empty(0, dtype=np.int64)
+            counts = np.concatenate([counts for _, counts in blocks]) if blocks else np.empty(0, dtype=np.int64)
+            companyids, inverse = np.unique(ids, return_inverse=True)
+            rows = np.zeros(len(companyids), dtype=np.int64)
+            np.add.at(rows, inverse.reshape(-1), counts)
+            offsets = np.concatenate([[0], np.cumsum(rows)])
+            companyids.astype(ARRAYS["companyid"]).tofile(path / "companyid.bin")
+            offsets.astype(ARRAYS["offsets"]).tofile(path / "offsets.bin")
+            (path / "meta.json").write_text(json.dumps({"until": until.isoformat(), "rows": int(offsets[-1])}))
+        except BaseException:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+
+        self._switch(path.name)
+        return added
+
+    def _switch(self, name: str) -> None:
+        """Make a generation the current one and remove the one before the previous one.
+
+        The previous generation is kept, a reader may have read its name from CURRENT
+        but not mapped it yet. Generations that were never current (e.g. one another
+        ingest is still writing) are not touched.
+        """
+        previous = self._read_name(self.current)
+        superseded = self._read_name(self.previous)
+        self._write_name(self.current, name)
+        if previous is not None:
+            self._write_name(self.previous, previous)
+        # open mappings keep the files of a removed generation readable
+        if superseded is not None and superseded not in (name, previous):
+            shutil.rmtree(self.root / superseded, ignore_errors=True)
+
+    def _write_name(self, path: Path, name: str) -> None:
+        """Atomically replace the file naming a generation."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(name)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_name(path: Path) -> str | None:
+        """Read the file naming a generation, None if there is none."""
+        try:
+            return path.read_text().strip()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _to_arrays(columns: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Convert a chunk of the ingest query to company ids, pricing days and caps."""
+        companyid = np.asarray(columns["companyid"], dtype=np.int64)
+        days = np.asarray(columns["pricingdate"], dtype="datetime64[D]").astype(np.int64)
+        caps = np.asarray(columns["usdmarketcap"], dtype=np.float64)
+        return companyid, days, caps
+
+    @staticmethod
+    def _query_date(database: BaseDatabase, query: str) -> date | None:
+        """Run a query returning a single date, None if it returns NULL."""
+        res = pd.DataFrame(database.query_all(query))
+        if res.empty or pd.isna(res.iloc[0, 0]):
+            return None
+        return pd.Timestamp(res.iloc[0, 0]).date()
+
+    @staticmethod
+    def _ingest_query() -> str:
+        """Build the query of the usd market caps between %(since)s and %(until)s.
+
+        Like the screens, the usd market cap uses the exchange rate of the pricing
+        date itself. The rows are sorted by company and date, the order of the store.
+        """
+        return """
+            SELECT DISTINCT ON (ciqmarketcap.companyid, ciqmarketcap.pricingdate)
+                ciqmarketcap.companyid,
+                ciqmarketcap.pricingdate,
+                round(ciqmarketcap.marketcap / ciqexchangerate.priceclose, 2) as usdmarketcap
+            FROM
+                ciqmarketcap
+            JOIN
+                ciqcompany ON ciqmarketcap.companyID = ciqcompany.companyID
+            JOIN
+                ciqsecurity ON ciqmarketcap.companyID = ciqsecurity.companyID
+            JOIN
+                ciqtradingitem on ciqsecurity.securityid = ciqtradingitem.securityid
+            JOIN
+                ciqexchangerate on ciqtradingitem.currencyid = ciqexchangerate.currencyid
+                    AND ciqexchangerate.pricedate = ciqmarketcap.pricingdate
+            WHERE
+                ciqmarketcap.pricingdate BETWEEN %(since)s::date AND %(until)s::date
+            AND
+                ciqexchangerate.latestsnapflag = 1
+            AND
+                ciqcompany.companytypeid in (4, 5)
+            AND
+                ciqsecurity.primaryflag = 1
+            AND
+                ciqtradingitem.primaryflag = 1
+            ORDER BY
+                ciqmarketcap.companyid, ciqmarketcap.pricingdate
+        """
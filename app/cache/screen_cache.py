@@ -0,0 +1,149 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, time, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from app.utils.logging import get_logger
+
+# Initialize logger
+logger = get_logger(__name__)
+
+
+def next_refresh(now: datetime, refresh_time: time) -> datetime:
+    """Get the first daily refresh after now.
+
+    Args:
+        now: The current time (timezone aware)
+        refresh_time: Time of day (UTC) at which new data is available
+
+    Returns:
+        datetime: The next refresh time
+    """
+    refresh = datetime.combine(now.date(), refresh_time, tzinfo=timezone.utc)
+    if refresh <= now:
+        refresh += timedelta(days=1)
+    return refresh
+
+
+class ScreenCache:
+    """Bounded in-memory cache of market cap screens.
+
+    Entries expire at the next daily data refresh, the least recently used entry is
+    evicted when the cache is full, and concurrent misses of the same key share a
+    single load (single-flight) instead of each running the query.
+    """
+
+    def __init__(self, maxsize: int = 256, refresh_time: time = time(6, 0)):
+        """Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of cached screens
+            refresh_time: Time of day (UTC) at which the underlying data is refreshed
+        """
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be positive, got {maxsize}")
+
+        self.maxsize = maxsize
+        self.refresh_time = refresh_time
+        self._entries: OrderedDict[Hashable, Tuple[Any, datetime]] = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any | None:
+        """Get a fresh entry and mark it as recently used.
+
+        Args:
+            key: The cache key
+
+        Returns:
+            The cached value, None if missing or expired
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at = entry
+        if datetime.now(timezone.utc) >= expires_at:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store an entry until the next data refresh, evicting the LRU entry if full.
+
+        Args:
+            key: The cache key
+            value: The value to cache
+        """
+        expires_at = next_refresh(datetime.now(timezone.utc), self.refresh_time)
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            evicted, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            logger.debug(f"Evicted {evicted} from screen cache")
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Get an entry, loading it on a miss.
+
+        If a load of the same key is already running, wait for its result instead of
+        starting another one. The load runs in its own task, so a cancelled caller
+        does not cancel it for the others. Failed loads are not cached and are raised
+        to every waiting caller.
+
+        Args:
+            key: The cache key
+            loader: Coroutine function computing the value
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Run a loader and cache its result."""
+        try:
+            value = await loader()
+            self.set(key, value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Get the cache counters.
+
+        Returns:
+            dict: Size, hits, misses, coalesced misses and evictions
+        """
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
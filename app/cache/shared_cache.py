@@ -0,0 +1,200 @@
+from __future__ import annotations
+import asyncio
+import errno
+import hashlib
+import os
+import tempfile
+import time as timer
+from datetime import datetime, time, timedelta, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Hashable
+from app.cache.screen_cache import next_refresh
+from app.models.screen_result import ScreenResult
+from app.utils.imports import LazyModule
+from app.utils.logging import get_logger
+
+try:
+    import fcntl
+except ImportError:  # windows, the package still imports but the cache cannot be used
+    fcntl = None  # type: ignore[assignment]
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+else:
+    pa = LazyModule("pyarrow")
+
+# Initialize logger
+logger = get_logger(__name__)
+
+
+class SharedScreenCache:
+    """Screen cache shared by the worker processes of a host.
+
+    Screens are stored as Arrow IPC files in a directory on a memory backed file
+    system (/dev/shm), so every worker reads the screens another worker loaded
+    instead of querying them again:
+
+        <root>/<sha1 of the key>.arrow
+
+    Like the in-memory ScreenCache, entries expire at the daily data refresh. A
+    miss is loaded by one process only, the others wait on the key's lock file
+    and read its result (cross-process single-flight). The locks are flock(2)
+    locks, so the cache runs on unix hosts only, like the gunicorn server; the
+    package still imports elsewhere but creating the cache fails.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        refresh_time: time = time(6, 0),
+        lock_timeout: float = 60.0,
+        poll_interval: float = 0.05,
+    ):
+        """Initialize the cache.
+
+        Args:
+            root: Directory of the entries, created if missing, e.g. /dev/shm/thefunscreener
+            refresh_time: Time of day (UTC) at which the underlying data is refreshed
+            lock_timeout: Seconds to wait for another process loading the same key,
+                after which the key is loaded anyway
+            poll_interval: Seconds between attempts to take a key's lock
+
+        Raises:
+            RuntimeError: If the platform has no flock(2), e.g. windows
+        """
+        if fcntl is None:
+            raise RuntimeError("SharedScreenCache needs flock(2) and runs on unix hosts only, unset SHARED_CACHE_DIR")
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.refresh_time = refresh_time
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def path(self, key: Hashable) -> Path:
+        """Get the file of an entry."""
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return self.root / f"{digest}.arrow"
+
+    def last_refresh(self) -> float:
+        """Get the time of the last data refresh as a timestamp, older entries are stale."""
+        return (next_refresh(datetime.now(timezone.utc), self.refresh_time) - timedelta(days=1)).timestamp()
+
+    def get(self, key: Hashable) -> ScreenResult | None:
+        """Read a fresh entry.
+
+        Args:
+            key: The cache key
+
+        Returns:
+            ScreenResult | None: The cached screen, None if missing or expired
+        """
+        path = self.path(key)
+        try:
+            if path.stat().st_mtime < self.last_refresh():
+                return None
+            with pa.memory_map(str(path)) as source:
+                return ScreenResult.from_arrow(pa.ipc.open_file(source).read_all())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable shared cache entry {path}: {e}")
+            return None
+
+    def set(self, key: Hashable, screen: ScreenResult) -> None:
+        """Store an entry until the next data refresh.
+
+        The file is written next to its final location and renamed into place, so
+        other processes never read a partially written entry.
+
+        Args:
+            key: The cache key
+            screen: The screen to cache
+        """
+        self.purge()
+        table = screen.to_arrow()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[ScreenResult]]) -> ScreenResult:
+        """Get an entry, loading it on a miss unless another process already does.
+
+        Args:
+            key: The cache key
+            loader: Coroutine function computing the screen
+
+        Returns:
+            ScreenResult: The cached or freshly loaded screen
+        """
+        screen = await asyncio.to_thread(self.get, key)
+        if screen is not None:
+            self.hits += 1
+            return screen
+
+        lock_fd = await self._lock(key)
+        try:
+            # another process may have loaded it while we waited for the lock
+            screen = await asyncio.to_thread(self.get, key)
+            if screen is not None:
+                self.coalesced += 1
+                return screen
+
+            self.misses += 1
+            screen = await loader()
+            await asyncio.to_thread(self.set, key, screen)
+            return screen
+        finally:
+            if lock_fd is not None:
+                os.close(lock_fd)
+
+    async def _lock(self, key: Hashable) -> int | None:
+        """Take the lock file of a key, None if it could not be taken within lock_timeout."""
+        fd = os.open(self.path(key).with_suffix(".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = timer.monotonic() + self.lock_timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except OSError as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    os.close(fd)
+                    raise
+            if timer.monotonic() >= deadline:
+                os.close(fd)
+                logger.warning(f"Timed out waiting for another worker to load {key}, loading it")
+                return None
+            await asyncio.sleep(self.poll_interval)
+
+    def purge(self) -> int:
+        """Delete the entries of previous data refreshes, they only take up memory.
+
+        Returns:
+            int: Number of deleted files
+        """
+        stale_before = self.last_refresh()
+        deleted = 0
+        for path in self.root.glob("*.arrow"):
+            try:
+                if path.stat().st_mtime < stale_before:
+                    path.unlink()
+                    path.with_suffix(".lock").unlink(missing_ok=True)
+                    deleted += 1
+            except FileNotFoundError:
+                pass
+        return deleted
+
+    def stats(self) -> Dict[str, int]:
+        """Get the cache counters of this process.
+
+        Returns:
+            dict: Hits, misses and misses loaded by another process
+        """
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
@@ -0,0 +1,108 @@
+from __future__ import annotations
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING
+from app.models.screen_result import ScreenResult
+from app.utils.imports import LazyModule
+from app.utils.logging import get_logger
+
+if TYPE_CHECKING:
+    import pyarrow.parquet as pq
+else:
+    pq = LazyModule("pyarrow.parquet")
+
+# Initialize logger
+logger = get_logger(__name__)
+
+# only plain country codes and "Global" are used as part of a file name
+_SAFE_KEY = re.compile(r"^[A-Za-z0-9]+$")
+
+# version of the screens in the store, bumped whenever the screens of a key change
+# so older snapshots are no longer read, e.g. 2 converts every row with the exchange
+# rate of its own pricing date instead of the asofdate rate
+SNAPSHOT_VERSION = 2
+
+
+class SnapshotStore:
+    """Persistent on-disk store of historical market cap screens.
+
+    A screen of a past date never changes, so snapshots are stored as parquet files
+    keyed by (date, country, threshold) and never expire:
+
+        <root>/v<SNAPSHOT_VERSION>/<asofdate>/<country>_<threshold>.parquet
+
+    Snapshots of older versions are ignored and can be deleted.
+    """
+
+    def __init__(self, root: Path):
+        """Initialize the store.
+
+        Args:
+            root: Directory the snapshots are written to, created on first write
+        """
+        self.root = Path(root)
+
+    def path(self, asofdate: str, country: str, mktcap_thres: float) -> Path | None:
+        """Get the file of a snapshot.
+
+        Args:
+            asofdate: The date of the screen (YYYY-MM-DD)
+            country: The country code of the screen, or "Global"
+            mktcap_thres: The market cap threshold (in million USD)
+
+        Returns:
+            Path | None: The snapshot file, None if the key cannot be stored safely
+        """
+        if not _SAFE_KEY.match(country) or not re.match(r"^\d{4}-\d{2}-\d{2}$", asofdate):
+            return None
+        return self.root / f"v{SNAPSHOT_VERSION}" / asofdate / f"{country}_{mktcap_thres:g}.parquet"
+
+    def load(self, asofdate: str, country: str, mktcap_thres: float) -> ScreenResult | None:
+        """Load a snapshot.
+
+        Args:
+            asofdate: The date of the screen (YYYY-MM-DD)
+            country: The country code of the screen, or "Global"
+            mktcap_thres: The market cap threshold (in million USD)
+
+        Returns:
+            ScreenResult | None: The stored screen, None if it is not in the store
+        """
+        path = self.path(asofdate, country, mktcap_thres)
+        if path is None or not path.exists():
+            return None
+
+        try:
+            return ScreenResult.from_arrow(pq.read_table(path))
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+            return None
+
+    def save(self, asofdate: str, country: str, mktcap_thres: float, screen: ScreenResult) -> None:
+        """Persist a snapshot.
+
+        The file is written next to its final location and renamed into place, so
+        concurrent readers never see a partially written snapshot.
+
+        Args:
+            asofdate: The date of the screen (YYYY-MM-DD)
+            country: The country code of the screen, or "Global"
+            mktcap_thres: The market cap threshold (in million USD)
+            screen: The screen to store
+        """
+        path = self.path(asofdate, country, mktcap_thres)
+        if path is None:
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pq.write_table(screen.to_arrow(), f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        logger.info(f"Stored snapshot {path} with {len(screen)} rows")
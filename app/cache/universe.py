@@ -0,0 +1,69 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Dict
+from app.models.screen_result import ScreenResult
+from app.utils.imports import LazyModule
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = LazyModule("numpy")
+
+
+class MarketCapUniverse:
+    """All companies above the lowest market cap threshold at one date.
+
+    The universe is deduplicated (one row per company), sorted by usdmarketcap in
+    descending order and split by country. Every (country, threshold, top_x) screen
+    of the date is a prefix of one of these results, so it is answered by a binary
+    search and a slice (a view of the arrays) instead of a database query.
+    """
+
+    def __init__(self, screen: ScreenResult):
+        """Build the universe.
+
+        Args:
+            screen: Deduplicated screen of all countries at the lowest threshold
+        """
+        self.screen = screen.top(None)
+
+        # a stable sort by country code keeps every country sorted by usdmarketcap
+        codes = self.screen.columns["country"]
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        self._by_country: Dict[str, ScreenResult] = {}
+        for indices in np.split(order, boundaries) if len(order) else []:
+            country = self.screen.dictionaries["country"][codes[indices[0]]]
+            self._by_country[str(country)] = self.screen.take(indices)
+
+        # negated caps are ascending, which is what np.searchsorted expects
+        self._neg_caps = {country: -group.columns["usdmarketcap"] for country, group in self._by_country.items()}
+        self._neg_caps["Global"] = -self.screen.columns["usdmarketcap"]
+
+    def __len__(self) -> int:
+        return len(self.screen)
+
+    @property
+    def countries(self) -> list[str]:
+        """Countries with at least one company in the universe."""
+        return list(self._by_country)
+
+    def select(self, country: str, mktcap_thres: float, top_x: int | None = None) -> ScreenResult:
+        """Get the screen of a country above a threshold.
+
+        Args:
+            country: The country code, or "Global" for all countries
+            mktcap_thres: The market cap threshold (in million USD)
+            top_x: If set, only the top_x largest companies
+
+        Returns:
+            ScreenResult: The screen, sorted by usdmarketcap in descending order
+        """
+        screen = self.screen if country == "Global" else self._by_country.get(country)
+        if screen is None or len(screen) == 0:
+            return self.screen.head(0)
+
+        # number of companies with usdmarketcap >= mktcap_thres
+        n = int(np.searchsorted(self._neg_caps[country], -mktcap_thres, side="right"))
+        if top_x is not None:
+            n = min(n, top_x)
+        return screen.head(n)
@@ -0,0 +1,160 @@
+import asyncio
+import time as timer
+from datetime import datetime, time, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Dict, Sequence, Set
+from app.cache.screen_cache import next_refresh
+from app.utils.logging import get_logger
+
+if TYPE_CHECKING:
+    from app.api.api_service import TheFunScreenerService
+
+# Initialize logger
+logger = get_logger(__name__)
+
+WARMUP_CATEGORIES = ("mega", "large", "mid")
+
+
+class CacheWarmer:
+    """Precompute the latest screens so the first requests do not pay the query.
+
+    Every country x category screen is loaded into the service's screen cache, a
+    few at a time. The queries run on the database threads, so warming happens in
+    the background while the server keeps answering. After the first warm-up the
+    screens are warmed again after every daily data refresh.
+    """
+
+    def __init__(
+        self,
+        service: "TheFunScreenerService",
+        countries: Sequence[str],
+        categories: Sequence[str] = WARMUP_CATEGORIES,
+        concurrency: int = 2,
+        refresh_time: time | None = None,
+        refresh_delay: timedelta = timedelta(minutes=5),
+    ):
+        """Initialize the warmer.
+
+        Args:
+            service: The service whose cache is warmed
+            countries: Countries to warm, e.g. ["US", "Global"]
+            categories: Market cap categories to warm for every country
+            concurrency: Number of screens loaded at the same time
+            refresh_time: Time of day (UTC) at which new data is available, if set the
+                screens are warmed again refresh_delay after it every day
+            refresh_delay: Time between the data refresh and the warm-up
+        """
+        self.service = service
+        self.countries = list(countries)
+        self.categories = list(categories)
+        self.concurrency = concurrency
+        self.refresh_time = refresh_time
+        self.refresh_delay = refresh_delay
+
+        self.state = "pending"
+        self.runs = 0
+        self.warmed = 0
+        self.failed = 0
+        self.started_at: datetime | None = None
+        self.finished_at: datetime | None = None
+        self.duration: float | None = None
+        self._task: asyncio.Task | None = None
+        self._background: Set[asyncio.Task] = set()
+
+    @property
+    def total(self) -> int:
+        """Number of screens per warm-up."""
+        return len(self.countries) * len(self.categories)
+
+    @property
+    def ready(self) -> bool:
+        """True once the first warm-up finished, even if some screens failed."""
+        return self.runs > 0
+
+    @property
+    def running(self) -> bool:
+        """True while a warm-up is running."""
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> bool:
+        """Start a warm-up in the background, unless one is already running.
+
+        Must be called from the event loop.
+
+        Returns:
+            bool: True if a warm-up was started
+        """
+        if self.running:
+            return False
+        self._task = asyncio.ensure_future(self.run())
+        return True
+
+    def start_daily(self) -> None:
+        """Warm up now and again after every daily data refresh, in the background.
+
+        Must be called from the event loop, e.g. as startup handler.
+        """
+        task = asyncio.ensure_future(self._run_daily())
+        # keep a reference, the event loop only holds weak ones
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def run(self) -> None:
+        """Warm every country x category screen once."""
+        if self.service.screen_cache is None:
+            logger.warning("The service has no screen cache, nothing to warm")
+
+        self.state = "running"
+        self.warmed = 0
+        self.failed = 0
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at = None
+        start = timer.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(country: str, category: str) -> None:
+            async with semaphore:
+                try:
+                    await self.service.get_latest_market_cap(country, category)
+                    self.warmed += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Failed to warm {country}/{category}: {e}")
+
+        await asyncio.gather(*(warm(country, category) for country in self.countries for category in self.categories))
+
+        self.duration = timer.perf_counter() - start
+        self.finished_at = datetime.now(timezone.utc)
+        self.state = "failed" if self.failed and self.failed == self.total else "done"
+        self.runs += 1
+        logger.info(f"Warmed {self.warmed}/{self.total} screens in {self.duration:.2f}s ({self.failed} failed)")
+
+    async def _run_daily(self) -> None:
+        """Warm up now and then after every data refresh."""
+        while True:
+            # join a warm-up that was started on request
+            self.start()
+            assert self._task is not None
+            await asyncio.shield(self._task)
+            if self.refresh_time is None:
+                return
+
+            now = datetime.now(timezone.utc)
+            wake_up = next_refresh(now - self.refresh_delay, self.refresh_time) + self.refresh_delay
+            await asyncio.sleep((wake_up - now).total_seconds())
+
+    def status(self) -> Dict[str, Any]:
+        """Get the progress of the current or last warm-up.
+
+        Returns:
+            dict: State, number of warmed and failed screens, and timings
+        """
+        return {
+            "state": self.state,
+            "total": self.total,
+            "warmed": self.warmed,
+            "failed": self.failed,
+            "runs": self.runs,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration": self.duration,
+        }
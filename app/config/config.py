@@ -1,8 +1,10 @@
 from pathlib import Path
+from datetime import time
+from functools import cache
 import os
 from dotenv import load_dotenv
-from typing import Dict, Any
-from pydantic import BaseModel, Field
+from typing import Dict, Any, List
+from pydantic import BaseModel, ConfigDict, Field
 
 class Paths(BaseModel):
     """Configuration for all file system paths
@@ -13,6 +15,7 @@ class Paths(BaseModel):
         output_dir: Directory for output data
         temp_dir: Directory for temporary files
     """
+    model_config = ConfigDict(frozen=True)
 
     base_dir: Path = Field(default_factory=lambda: Path(__file__).parent.parent.parent)
     # relative path
@@ -28,7 +31,7 @@ class LLMConfig(BaseModel):
     """
     This is a placeholder for the LLM config
     """
-    pass
+    model_config = ConfigDict(frozen=True)
 
 
 class DatabaseConfig(BaseModel):
@@ -36,26 +39,105 @@ class DatabaseConfig(BaseModel):
 
     Attributes:
         db_config: Database configuration dictionary
+        pool_config: Connection pool settings passed to the database
+        use_summary_table: Screen the pre-joined screener_daily_mktcap table
+        fx_in_memory: Convert the CIQ screens to USD with exchange rates kept in memory
+            instead of joining ciqexchangerate in every screen
+        connection_budget: Connections all server workers may open together, split
+            evenly into the pool of each worker
     """
+    model_config = ConfigDict(frozen=True)
+
     db_config: Dict[str, Any] = Field(default_factory=dict)
+    pool_config: Dict[str, Any] = Field(default_factory=dict)
+    use_summary_table: bool = False
+    fx_in_memory: bool = True
+    connection_budget: int | None = None
+
+
+class CacheConfig(BaseModel):
+    """Configuration for the screen caches
+
+    Attributes:
+        screen_cache_size: Maximum number of latest screens kept in memory
+        refresh_time: Time of day (UTC, HH:MM) at which new market data is available
+        universe_mode: Answer all screens of a date from one Global universe query
+        warmup: Precompute the latest screens at startup and after every data refresh
+        warmup_countries: Countries whose mega, large and mid screens are precomputed
+        warmup_concurrency: Number of screens precomputed at the same time
+        shared_cache_dir: Directory of the screen cache shared by the server workers,
+            on a memory backed file system such as /dev/shm. None disables it
+        history_dir: Directory of the memory-mapped market cap history of every company,
+            None for <data_output_dir>/history
+    """
+    model_config = ConfigDict(frozen=True)
+
+    screen_cache_size: int = 256
+    refresh_time: time = time(6, 0)
+    universe_mode: bool = False
+    warmup: bool = True
+    warmup_countries: List[str] = Field(default_factory=lambda: ["US", "Global"])
+    warmup_concurrency: int = 2
+    shared_cache_dir: Path | None = None
+    history_dir: Path | None = None
+
+
+class ServiceConfig(BaseModel):
+    """Configuration for the screener service
+
+    Attributes:
+        batch_concurrency: Dates of a batch request that are screened concurrently
+        batch_max_dates: Maximum number of dates of a batch request
+        stream_chunk_size: Rows read from the database at a time by streamed screens
+        version_ttl: Seconds the last loaded pricing date (ETag version) is cached
+    """
+    model_config = ConfigDict(frozen=True)
 
+    batch_concurrency: int = 4
+    batch_max_dates: int = 600
+    stream_chunk_size: int = 2000
+    version_ttl: float = 60.0
 
-class Config:
+
+class ServerConfig(BaseModel):
+    """Configuration for the production server
+
+    Attributes:
+        workers: Number of worker processes
+        port: Port the server listens on
+        graceful_timeout: Seconds a worker may finish its requests on shutdown or reload
+    """
+    model_config = ConfigDict(frozen=True)
+
+    workers: int = 1
+    port: int = 8033
+    graceful_timeout: int = 30
+
+
+class Config(BaseModel):
     """Main configuration class that combines all configuration aspects
 
-    This class loads and validates all configuration from environment variables
-    and provides access to all configuration sections.
+    An immutable snapshot of all configuration sections, loaded and validated from
+    environment variables. Use get_config() for the settings of the process, which
+    are loaded once.
     """
+    model_config = ConfigDict(frozen=True)
 
     # Configuration sections
     paths: Paths = Field(default_factory=Paths)
     llm: LLMConfig
     database: DatabaseConfig
+    cache: CacheConfig
+    service: ServiceConfig
+    server: ServerConfig
     api_key: str = Field(default="")
+    api_keys: frozenset[str] = frozenset()
 
     @classmethod
-    def load_configuration(cls) -> "type[Config]":
-        """Load and validate all configuration from environment variables.
+    def load_configuration(cls) -> "Config":
+        """Load and validate all configuration from .env and environment variables.
+
+        Every call reads .env again, e.g. to reload the api keys after a rotation.
 
         Returns:
             Config: A validated configuration instance
@@ -64,7 +146,12 @@ class Config:
         # define which .env file to be used
         env_file = ".env"
         env_file_encoding = "utf-8"  # default encoding
+        # the worker count set for the process (gunicorn, app/api.py --workers) wins over
+        # .env, so every worker splits the connection budget by the actual number of workers
+        process_workers = os.environ.get("WEB_CONCURRENCY")
         load_dotenv(dotenv_path=env_file, override=True, encoding=env_file_encoding)
+        if process_workers is not None:
+            os.environ["WEB_CONCURRENCY"] = process_workers
 
         # Configure postgres database
         db_config = {
@@ -75,9 +162,75 @@ class Config:
             "port": os.getenv("POSTGRES_PORT"),
         }
 
+        # Configure the connection pool used by the api server
+        pool_config = {
+            "pool": os.getenv("POSTGRES_POOL", "true").lower() == "true",
+            "pool_minconn": int(os.getenv("POSTGRES_POOL_MIN", "1")),
+            "pool_maxconn": int(os.getenv("POSTGRES_POOL_MAX", "10")),
+            "pool_timeout": float(os.getenv("POSTGRES_POOL_TIMEOUT", "30")),
+            "pool_recycle": float(os.getenv("POSTGRES_POOL_RECYCLE", "1800")),
+            "pool_pre_ping": os.getenv("POSTGRES_POOL_PRE_PING", "true").lower() == "true",
+        }
+
+        server = ServerConfig(
+            workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+            port=int(os.getenv("PORT", "8033")),
+            graceful_timeout=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+        )
+
+        # Every worker has its own pool, together they stay within the connection budget
+        connection_budget = int(os.getenv("POSTGRES_CONNECTION_BUDGET", "0")) or None
+        if connection_budget is not None:
+            pool_config["pool_maxconn"] = max(1, connection_budget // max(1, server.workers))
+            pool_config["pool_minconn"] = min(pool_config["pool_minconn"], pool_config["pool_maxconn"])
+
+        database = DatabaseConfig(
+            db_config=db_config,
+            pool_config=pool_config,
+            use_summary_table=os.getenv("SUMMARY_TABLE", "false").lower() == "true",
+            fx_in_memory=os.getenv("FX_IN_MEMORY", "true").lower() == "true",
+            connection_budget=connection_budget,
+        )
+        cache_config = CacheConfig(
+            screen_cache_size=int(os.getenv("SCREEN_CACHE_SIZE", "256")),
+            refresh_time=time.fromisoformat(os.getenv("SCREEN_CACHE_REFRESH_TIME", "06:00")),
+            universe_mode=os.getenv("UNIVERSE_MODE", "false").lower() == "true",
+            warmup=os.getenv("WARMUP", "true").lower() == "true",
+            warmup_countries=[
+                country.strip() for country in os.getenv("WARMUP_COUNTRIES", "US,Global").split(",") if country.strip()
+            ],
+            warmup_concurrency=int(os.getenv("WARMUP_CONCURRENCY", "2")),
+            shared_cache_dir=Path(os.environ["SHARED_CACHE_DIR"]) if os.getenv("SHARED_CACHE_DIR") else None,
+            history_dir=Path(os.environ["HISTORY_DIR"]) if os.getenv("HISTORY_DIR") else None,
+        )
+        service = ServiceConfig(
+            batch_concurrency=int(os.getenv("BATCH_CONCURRENCY", "4")),
+            batch_max_dates=int(os.getenv("BATCH_MAX_DATES", "600")),
+            stream_chunk_size=int(os.getenv("STREAM_CHUNK_SIZE", "2000")),
+            version_ttl=float(os.getenv("DATA_VERSION_TTL", "60")),
+        )
+        api_key = os.getenv("API_KEY", "")
+        # API_KEYS holds additional comma separated keys, e.g. the new and the old key during a rotation
+        keys = [api_key, *os.getenv("API_KEYS", "").split(",")]
+
         # Create config instance
-        cls.llm = LLMConfig()
-        cls.database = DatabaseConfig(db_config=db_config)
-        cls.paths = Paths()
-        cls.api_key = os.getenv("API_KEY", "")
-        return cls
+        return cls(
+            paths=Paths(),
+            llm=LLMConfig(),
+            database=database,
+            cache=cache_config,
+            service=service,
+            server=server,
+            api_key=api_key,
+            api_keys=frozenset(key.strip() for key in keys if key.strip()),
+        )
+
+
+@cache
+def get_config() -> Config:
+    """Get the configuration of the process, loaded on first use and then shared.
+
+    Returns:
+        Config: The immutable configuration
+    """
+    return Config.load_configuration()
@@ -1,5 +1,8 @@
 # import the PostgresDatabase class
 from .postgres_database import PostgresDatabase
-from .base_database import BaseDatabase
+from .async_postgres_database import AsyncPostgresDatabase
+from .base_database import AsyncBaseDatabase, BaseDatabase, WritableDatabase
+from .daily_market_cap import DailyMarketCapTable
+from .fx_rates import FxRates
 
-__all__ = ["BaseDatabase", "PostgresDatabase"]
+__all__ = ["AsyncBaseDatabase", "AsyncPostgresDatabase", "BaseDatabase", "DailyMarketCapTable", "FxRates", "PostgresDatabase", "WritableDatabase"]
@@ -0,0 +1,149 @@
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Iterator, Sequence, Tuple, List, TypeVar
+from app.database.base_database import AsyncBaseDatabase
+from app.database.postgres_database import PostgresDatabase
+from app.utils.logging import get_logger
+from app.utils.metrics import add_stage_time
+
+# Initialize logger
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+_EXHAUSTED = object()
+
+
+async def iterate_in_thread(
+    iterator: Iterator[T], run_sync: Callable[..., Awaitable[Any]] = asyncio.to_thread
+) -> AsyncGenerator[T, None]:
+    """Consume a blocking iterator from the event loop, one item per worker thread call.
+
+    Every item is awaited until its thread call finished, even if the consumer is
+    cancelled meanwhile, so the iterator is never advanced and closed concurrently.
+    Closing this generator closes the iterator (e.g. returns its connection).
+
+    Args:
+        iterator: The blocking iterator, e.g. a generator reading from a cursor
+        run_sync: Coroutine function running a callable in a worker thread
+
+    Yields:
+        The items of the iterator
+    """
+    pending: asyncio.Future | None = None
+    try:
+        while True:
+            pending = asyncio.ensure_future(run_sync(next, iterator, _EXHAUSTED))
+            item = await asyncio.shield(pending)
+            if item is _EXHAUSTED:
+                break
+            yield item
+    finally:
+        if pending is not None and not pending.done():
+            await asyncio.wait([pending])
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await run_sync(close)
+
+
+class AsyncPostgresDatabase(AsyncBaseDatabase):
+    """Async facade over PostgresDatabase.
+
+    psycopg2 has no native asyncio support, so queries run on a dedicated thread
+    pool sized to the connection pool. The event loop only awaits the result, which
+    lets concurrent requests overlap their database waits.
+    """
+
+    def __init__(self, database: PostgresDatabase, max_workers: int | None = None):
+        """Initialize the async database.
+
+        Args:
+            database: The synchronous database doing the actual work
+            max_workers: Number of query threads, defaults to the pool size
+        """
+        self.database = database
+        if max_workers is None:
+            max_workers = database.pool_config["maxconn"] if database.use_pool else 10
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-query")
+
+    async def run_sync(self, func, *args, **kwargs):
+        """Run a blocking database call on the query thread pool.
+
+        The current context is copied into the worker thread so context variables
+        set by the caller stay visible. The time the call waits for a free thread is
+        recorded as db_wait of the request.
+
+        Args:
+            func: The blocking callable
+            *args: Positional arguments of the callable
+            **kwargs: Keyword arguments of the callable
+
+        Returns:
+            The return value of the callable
+        """
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        submitted = time.perf_counter()
+
+        def call():
+            add_stage_time("db_wait", time.perf_counter() - submitted)
+            return func(*args, **kwargs)
+
+        return await loop.run_in_executor(self._executor, functools.partial(ctx.run, call))
+
+    async def query_all(self, query: str, params: Tuple | Dict[str, Any] = ()) -> List[Tuple]:
+        """Execute a query and return all results.
+
+        Args:
+            query: SQL query to execute
+            params: Query parameters
+
+        Returns:
+            list[tuple]: List of query results
+        """
+        return await self.run_sync(self.database.query_all, query, params)
+
+    async def query_prepared(self, name: str, query: str, params: Dict[str, Any]) -> List[Tuple]:
+        """Execute a query as a prepared statement, see PostgresDatabase.query_prepared.
+
+        Returns:
+            list[tuple]: List of query results
+        """
+        return await self.run_sync(self.database.query_prepared, name, query, params)
+
+    async def query_prepared_columns(self, name: str, query: str, params: Dict[str, Any]) -> Dict[str, Sequence[Any]]:
+        """Execute a query as a prepared statement, see PostgresDatabase.query_prepared_columns.
+
+        Returns:
+            dict: The values of every column by column name
+        """
+        return await self.run_sync(self.database.query_prepared_columns, name, query, params)
+
+    def stream_query(self, query: str, params: Tuple | Dict[str, Any] = (), chunk_size: int = 2000) -> AsyncGenerator[Any, None]:
+        """Execute a query and iterate the results in chunks, see PostgresDatabase.stream_query.
+
+        Returns:
+            AsyncGenerator[pd.DataFrame, None]: Chunks of at most chunk_size rows
+        """
+        chunks = self.database.stream_query(query, params, chunk_size)
+        return iterate_in_thread(chunks, self.run_sync)
+
+    def stream_columns(
+        self, query: str, params: Tuple | Dict[str, Any] = (), chunk_size: int = 2000
+    ) -> AsyncGenerator[Dict[str, Sequence[Any]], None]:
+        """Execute a query and iterate the columns of every chunk, see PostgresDatabase.stream_columns.
+
+        Returns:
+            AsyncGenerator[dict, None]: The values of every column per chunk of at most chunk_size rows
+        """
+        chunks = self.database.stream_columns(query, params, chunk_size)
+        return iterate_in_thread(chunks, self.run_sync)
+
+    async def close(self) -> None:
+        """Stop the query threads and close the pooled connections."""
+        self._executor.shutdown(wait=True)
+        self.database.close()
@@ -1,7 +1,13 @@
 from abc import ABC, abstractmethod
-from typing import Tuple, List
+from typing import Any, AsyncGenerator, Dict, Iterator, Sequence, Tuple, List
 from contextlib import contextmanager
 
+
+def frame_to_columns(df: Any) -> Dict[str, Sequence[Any]]:
+    """Split a dataframe result into its columns, see BaseDatabase.query_prepared_columns."""
+    return {str(name): df[name].to_numpy() for name in df.columns}
+
+
 class BaseDatabase(ABC):
     """Base database"""
 
@@ -16,7 +22,7 @@ class BaseDatabase(ABC):
         pass
 
     @abstractmethod
-    def query_all(self, query: str, params: Tuple = ()) -> List[Tuple]:
+    def query_all(self, query: str, params: Tuple | Dict[str, Any] = ()) -> List[Tuple]:
         """Execute a query and return all results,
            use context manager 'with' clause.
 
@@ -29,3 +35,135 @@ class BaseDatabase(ABC):
         """
         pass
 
+    def query_prepared(self, name: str, query: str, params: Dict[str, Any]) -> List[Tuple]:
+        """Execute a query that is run often with different parameters.
+
+        Databases supporting prepared statements plan the query once and reuse the
+        plan, by default the query is simply executed.
+
+        Args:
+            name: Statement name, unique per query text
+            query: SQL query with named placeholders like %(name)s
+            params: Query parameters by name
+
+        Returns:
+            list[tuple]: List of query results
+        """
+        return self.query_all(query, params)
+
+    def query_prepared_columns(self, name: str, query: str, params: Dict[str, Any]) -> Dict[str, Sequence[Any]]:
+        """Execute a query like query_prepared and return the values of every column.
+
+        For callers that build their own typed result (see ScreenResult) instead of a
+        dataframe, by default the dataframe of query_prepared is split up.
+
+        Args:
+            name: Statement name, unique per query text
+            query: SQL query with named placeholders like %(name)s
+            params: Query parameters by name
+
+        Returns:
+            dict: The values of every column by column name, in the order of the rows
+        """
+        return frame_to_columns(self.query_prepared(name, query, params))
+
+    def stream_query(self, query: str, params: Tuple | Dict[str, Any] = (), chunk_size: int = 2000) -> Iterator[Any]:
+        """Execute a query and yield the results in chunks.
+
+        Databases supporting server-side cursors bound the memory by the chunk size,
+        by default all results are fetched and yielded as a single chunk.
+
+        Args:
+            query: SQL query to execute
+            params: Query parameters
+            chunk_size: Number of rows fetched per round trip
+
+        Yields:
+            The next chunk of query results
+        """
+        yield self.query_all(query, params)
+
+    def stream_columns(
+        self, query: str, params: Tuple | Dict[str, Any] = (), chunk_size: int = 2000
+    ) -> Iterator[Dict[str, Sequence[Any]]]:
+        """Execute a query like stream_query and yield the values of every column per chunk.
+
+        Args:
+            query: SQL query to execute
+            params: Query parameters
+            chunk_size: Number of rows fetched per round trip
+
+        Yields:
+            dict: The values of every column of the next chunk by column name
+        """
+        for chunk in self.stream_query(query, params, chunk_size):
+            yield frame_to_columns(chunk)
+
+
+class WritableDatabase(BaseDatabase):
+    """Base database that can also be modified, e.g. to maintain a summary table"""
+
+    @abstractmethod
+    def execute(self, query: str, params: Tuple | Dict[str, Any] = ()) -> int:
+        """Execute a statement that modifies the database and commit it.
+
+        Args:
+            query: SQL statement to execute
+            params: Statement parameters
+
+        Returns:
+            int: Number of affected rows
+        """
+        pass
+
+
+class AsyncBaseDatabase(ABC):
+    """Base database with coroutine based query methods"""
+
+    @abstractmethod
+    async def query_all(self, query: str, params: Tuple | Dict[str, Any] = ()) -> List[Tuple]:
+        """Execute a query and return all results without blocking the event loop.
+
+        Args:
+            query: SQL query to execute
+            params: Query parameters
+
+        Returns:
+            list[tuple]: List of query results
+        """
+        pass
+
+    async def query_prepared(self, name: str, query: str, params: Dict[str, Any]) -> List[Tuple]:
+        """Async version of BaseDatabase.query_prepared, see there for the arguments.
+
+        Returns:
+            list[tuple]: List of query results
+        """
+        return await self.query_all(query, params)
+
+    async def query_prepared_columns(self, name: str, query: str, params: Dict[str, Any]) -> Dict[str, Sequence[Any]]:
+        """Async version of BaseDatabase.query_prepared_columns, see there for the arguments.
+
+        Returns:
+            dict: The values of every column by column name
+        """
+        return frame_to_columns(await self.query_prepared(name, query, params))
+
+    async def stream_query(self, query: str, params: Tuple | Dict[str, Any] = (), chunk_size: int = 2000) -> AsyncGenerator[Any, None]:
+        """Async version of BaseDatabase.stream_query, see there for the arguments.
+
+        Yields:
+            The next chunk of query results
+        """
+        yield await self.query_all(query, params)
+
+    async def stream_columns(
+        self, query: str, params: Tuple | Dict[str, Any] = (), chunk_size: int = 2000
+    ) -> AsyncGenerator[Dict[str, Sequence[Any]], None]:
+        """Async version of BaseDatabase.stream_columns, see there for the arguments.
+
+        Yields:
+            dict: The values of every column of the next chunk by column name
+        """
+        async for chunk in self.stream_query(query, params, chunk_size):
+            yield frame_to_columns(chunk)
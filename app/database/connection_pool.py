@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+from app.utils.logging import get_logger
+
+# Initialize logger
+logger = get_logger(__name__)
+
+
+class PoolTimeoutError(psycopg2.OperationalError):
+    """Raised when no pooled connection becomes available in time."""
+
+
+class ConnectionPool:
+    """Blocking, health-checked pool of psycopg2 connections.
+
+    At most `maxconn` connections are checked out at once; further checkouts wait
+    up to `timeout` seconds for one to be returned. Idle connections are kept for
+    reuse (psycopg2's own pools close everything above minconn on return), pinged
+    on checkout and recycled once they are older than `recycle` seconds.
+    """
+
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        minconn: int = 1,
+        maxconn: int = 10,
+        timeout: float = 30.0,
+        recycle: float = 1800.0,
+        pre_ping: bool = True,
+    ):
+        """Initialize the pool and open `minconn` connections.
+
+        Args:
+            config: psycopg2 connection keyword arguments
+            minconn: Number of connections opened up front
+            maxconn: Maximum number of connections checked out at once
+            timeout: Seconds to wait for a free connection before giving up
+            recycle: Maximum connection age in seconds, <= 0 disables recycling
+            pre_ping: If True, run a cheap query on checkout to detect dead connections
+        """
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: minconn={minconn}, maxconn={maxconn}")
+
+        self.config = config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+
+        # idle connections with their creation time, most recently returned last
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        self._created_at: Dict[int, float] = {}
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self.closed = False
+
+        for _ in range(minconn):
+            conn, created_at = self._connect()
+            self._idle.append((conn, created_at))
+
+    @property
+    def in_use(self) -> int:
+        """Number of connections currently checked out."""
+        return self._in_use
+
+    @property
+    def idle(self) -> int:
+        """Number of open connections waiting in the pool."""
+        return len(self._idle)
+
+    def getconn(self):
+        """Check out a healthy connection, waiting for a free slot if necessary.
+
+        Returns:
+            Connection: A live psycopg2 connection
+
+        Raises:
+            PoolTimeoutError: If no connection became available within the timeout
+        """
+        if self.closed:
+            raise PoolError("connection pool is closed")
+
+        start_time = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeoutError(f"Timed out after {self.timeout}s waiting for a database connection")
+        wait_time = time.perf_counter() - start_time
+
+        try:
+            conn = self._checkout_healthy()
+        except BaseException:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            in_use = self._in_use
+        logger.info(f"Checked out pooled connection in {wait_time * 1000:.1f}ms ({in_use}/{self.maxconn} in use)")
+        return conn
+
+    def putconn(self, conn, close: bool = False) -> None:
+        """Return a connection to the pool.
+
+        Args:
+            conn: Connection previously obtained from getconn
+            close: If True, discard the connection instead of keeping it idle
+        """
+        try:
+            if not close and not self.closed and not conn.closed:
+                # never hand out a connection that is still inside a transaction
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+
+            if close or self.closed or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, self._created_at[id(conn)]))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def closeall(self) -> None:
+        """Close every idle connection and refuse further checkouts."""
+        self.closed = True
+        with self._lock:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+
+    def _connect(self) -> Tuple[Any, float]:
+        """Open a new connection and remember when it was created."""
+        conn = psycopg2.connect(**self.config)
+        created_at = time.monotonic()
+        self._created_at[id(conn)] = created_at
+        return conn, created_at
+
+    def _checkout_healthy(self):
+        """Take idle connections until one passes the health checks, else open a new one."""
+        while True:
+            with self._lock:
+                item = self._idle.pop() if self._idle else None
+            if item is None:
+                conn, _ = self._connect()
+                return conn
+
+            conn, created_at = item
+            if conn.closed:
+                logger.warning("Discarding closed pooled connection")
+            elif self.recycle > 0 and time.monotonic() - created_at > self.recycle:
+                logger.info(f"Recycling pooled connection older than {self.recycle}s")
+            elif self.pre_ping and not self._ping(conn):
+                logger.warning("Discarding pooled connection that failed the health check")
+            else:
+                return conn
+
+            self._discard(conn)
+
+    def _discard(self, conn) -> None:
+        """Close a connection and forget about it."""
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except (Exception, psycopg2.DatabaseError) as e:
+            logger.warning(f"Failed to close pooled connection: {e}")
+
+    @staticmethod
+    def _ping(conn) -> bool:
+        """Check that the server still answers on this connection."""
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (Exception, psycopg2.DatabaseError):
+            return False
@@ -0,0 +1,179 @@
+from __future__ import annotations
+from datetime import date, timedelta
+from typing import TYPE_CHECKING
+from app.database.base_database import WritableDatabase
+from app.utils.imports import LazyModule
+from app.utils.logging import get_logger
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = LazyModule("pandas")
+
+# Initialize logger
+logger = get_logger(__name__)
+
+TABLE_NAME = "screener_daily_mktcap"
+
+
+class DailyMarketCapTable:
+    """Pre-joined daily market cap table used by the screens.
+
+    One row per company and pricing date with the usd market cap already computed
+    and the company, listing and country columns of the screens. It replaces the
+    eight table join of every screen with an index range scan on
+    (pricingdate, country, usdmarketcap).
+    """
+
+    def __init__(self, database: WritableDatabase):
+        """Initialize the table with a database connection.
+
+        Args:
+            database: Database holding the CIQ tables, with write access
+        """
+        self.database = database
+
+    def create(self) -> None:
+        """Create the table and its indexes if they do not exist."""
+        self.database.execute(f"""
+            CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+                companyid bigint NOT NULL,
+                pricingdate date NOT NULL,
+                marketcap numeric,
+                usdmarketcap numeric NOT NULL,
+                companyname text,
+                tickersymbol text,
+                currency text,
+                exchange text,
+                country text,
+                PRIMARY KEY (companyid, pricingdate)
+            )
+        """)
+        # country screens, and Global screens which have no country condition
+        self.database.execute(f"""
+            CREATE INDEX IF NOT EXISTS {TABLE_NAME}_date_country_cap_idx
+                ON {TABLE_NAME} (pricingdate, country, usdmarketcap DESC)
+        """)
+        self.database.execute(f"""
+            CREATE INDEX IF NOT EXISTS {TABLE_NAME}_date_cap_idx
+                ON {TABLE_NAME} (pricingdate, usdmarketcap DESC)
+        """)
+
+    def latest_pricingdate(self) -> date | None:
+        """Get the most recent pricing date in the table.
+
+        Returns:
+            date | None: The last loaded pricing date, None if the table is empty
+        """
+        return self._query_date(f"SELECT max(pricingdate) FROM {TABLE_NAME}")
+
+    def refresh(self, since: date | None = None, until: date | None = None, days_per_batch: int = 31) -> int:
+        """Load the market caps of new pricing dates.
+
+        Without since, only the pricing dates after the last loaded one are added.
+        The dates are loaded in batches of days_per_batch, one transaction each, so an
+        interrupted backfill resumes where it stopped. Rows that are loaded again are
+        updated in place.
+
+        Args:
+            since: First pricing date to load, defaults to the day after the last loaded one
+            until: Last pricing date to load, defaults to the last one in ciqmarketcap
+            days_per_batch: Number of pricing dates per insert
+
+        Returns:
+            int: Number of inserted or updated rows
+        """
+        if since is None:
+            latest = self.latest_pricingdate()
+            if latest is None:
+                since = self._query_date("SELECT min(pricingdate) FROM ciqmarketcap")
+            else:
+                since = latest + timedelta(days=1)
+        if until is None:
+            until = self._query_date("SELECT max(pricingdate) FROM ciqmarketcap")
+
+        if since is None or until is None or since > until:
+            logger.info(f"{TABLE_NAME} is up to date")
+            return 0
+
+        total = 0
+        start = since
+        while start <= until:
+            end = min(start + timedelta(days=days_per_batch - 1), until)
+            rows = self.database.execute(self._refresh_query(), {"since": start, "until": end})
+            logger.info(f"Loaded {rows} rows into {TABLE_NAME} for {start} - {end}")
+            total += rows
+            start = end + timedelta(days=1)
+
+        self.database.execute(f"ANALYZE {TABLE_NAME}")
+        return total
+
+    def _query_date(self, query: str) -> date | None:
+        """Run a query returning a single date, None if it returns NULL."""
+        res = pd.DataFrame(self.database.query_all(query))
+        if res.empty or pd.isna(res.iloc[0, 0]):
+            return None
+        return res.iloc[0, 0]
+
+    @staticmethod
+    def _refresh_query() -> str:
+        """Build the statement loading the pricing dates between %(since)s and %(until)s.
+
+        The usd market cap uses the exchange rate of the pricing date itself. The joins
+        can return a company several times for a pricing date (several primary trading
+        items or latest rates), only one row of each is inserted, Postgres rejects an
+        upsert that updates a row twice.
+        """
+        return f"""
+            INSERT INTO {TABLE_NAME} (
+                companyid, pricingdate, marketcap, usdmarketcap,
+                companyname, tickersymbol, currency, exchange, country
+            )
+            SELECT DISTINCT ON (ciqmarketcap.companyid, ciqmarketcap.pricingdate)
+                ciqmarketcap.companyid,
+                ciqmarketcap.pricingdate,
+                ciqmarketcap.marketcap,
+                round(ciqmarketcap.marketcap / ciqexchangerate.priceclose, 2) as usdmarketcap,
+                ciqcompany.companyname,
+                ciqtradingitem.tickersymbol,
+                ciqcurrency.isocode as currency,
+                ciqexchange.exchangesymbol as exchange,
+                ciqcountrygeo.isocountry2 as country
+            FROM
+                ciqmarketcap
+            JOIN
+                ciqcompany ON ciqmarketcap.companyID = ciqcompany.companyID
+            JOIN
+                ciqsecurity ON ciqmarketcap.companyID = ciqsecurity.companyID
+            JOIN
+                ciqtradingitem on ciqsecurity.securityid = ciqtradingitem.securityid
+            JOIN
+                ciqexchangerate on ciqtradingitem.currencyid = ciqexchangerate.currencyid
+                    AND ciqexchangerate.pricedate = ciqmarketcap.pricingdate
+            JOIN
+                ciqcurrency on ciqtradingitem.currencyid = ciqcurrency.currencyid
+            JOIN
+                ciqexchange on ciqtradingitem.exchangeid = ciqexchange.exchangeid
+            JOIN
+                ciqcountrygeo on ciqcompany.countryid = ciqcountrygeo.countryid
+            WHERE
+                ciqmarketcap.pricingdate BETWEEN %(since)s::date AND %(until)s::date
+            AND
+                ciqexchangerate.latestsnapflag = 1
+            AND
+                ciqcompany.companytypeid in (4, 5)
+            AND
+                ciqsecurity.primaryflag = 1
+            AND
+                ciqtradingitem.primaryflag = 1
+            ORDER BY
+                ciqmarketcap.companyid, ciqmarketcap.pricingdate
+            ON CONFLICT (companyid, pricingdate) DO UPDATE SET
+                marketcap = EXCLUDED.marketcap,
+                usdmarketcap = EXCLUDED.usdmarketcap,
+                companyname = EXCLUDED.companyname,
+                tickersymbol = EXCLUDED.tickersymbol,
+                currency = EXCLUDED.currency,
+                exchange = EXCLUDED.exchange,
+                country = EXCLUDED.country
+        """
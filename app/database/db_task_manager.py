@@ -1,19 +1,59 @@
+from __future__ import annotations
+import asyncio
+from contextlib import aclosing
+from datetime import date, timedelta
+from functools import cache
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Dict, Iterator, Tuple
+from app.utils.imports import LazyModule
 from app.utils.logging import get_logger
-from app.database.base_database import BaseDatabase
-import pandas as pd
+from app.utils.metrics import stage
+from app.database.async_postgres_database import iterate_in_thread
+from app.database.base_database import AsyncBaseDatabase, BaseDatabase
+from app.database.daily_market_cap import TABLE_NAME as SUMMARY_TABLE_NAME
+from app.database.fx_rates import FxRates
+from app.models.screen_result import ScreenResult
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    np = LazyModule("numpy")
+    pd = LazyModule("pandas")
+
+# Initialize logger
 logger = get_logger(__name__)
 
 
 class TaskManagerRepository:
     """Repository for handling task operations with api."""
 
-    def __init__(self, database: BaseDatabase):
+    def __init__(
+        self,
+        database: BaseDatabase,
+        async_database: AsyncBaseDatabase | None = None,
+        use_summary_table: bool = False,
+        fx_rates: FxRates | None = None,
+    ):
         """Initialize repository with database connection.
 
         Args:
             database: Database instance for data access
+            async_database: Async database instance used by the *_async methods,
+                if None the blocking database is run in a worker thread instead
+            use_summary_table: If True, screen the pre-joined screener_daily_mktcap
+                table (see DailyMarketCapTable) instead of joining the CIQ tables
+            fx_rates: If set, the CIQ screens are converted to USD in memory with these
+                rates instead of joining ciqexchangerate (the summary table is already in USD)
         """
         self.database = database
+        self.async_database = async_database
+        self.use_summary_table = use_summary_table
+        self.fx_rates = fx_rates
+
+    @property
+    def converts_in_memory(self) -> bool:
+        """True if the materialized screens are converted to USD with fx_rates."""
+        return self.fx_rates is not None and not self.use_summary_table
 
     def test_connection_query(self) -> pd.DataFrame:
         """Test the connection to the database.
@@ -23,7 +63,15 @@ class TaskManagerRepository:
         """
         return self.database.query_all("SELECT * from ciqcompany limit 10;")
 
-    def query_global_market_cap(self, asofdate: str, mktcap_thres: float, country: str = "US", allow_fuzzy: bool = False) -> pd.DataFrame:
+    def query_global_market_cap(
+        self,
+        asofdate: str,
+        mktcap_thres: float,
+        country: str = "US",
+        allow_fuzzy: bool = False,
+        latest_only: bool = False,
+        limit: int | None = None,
+    ) -> ScreenResult:
         """Query the global market cap that is above the threshold and at a given date.
 
         we do not really need the fuzzy, as the marketcap is pretty dense over vacations and holidays
@@ -33,21 +81,316 @@ class TaskManagerRepository:
             mktcap_thres: The market cap threshold (in million USD)
             country: The country code to filter companies (default: "US")
             allow_fuzzy: If True, look for data within 5 days of asofdate if exact date not available
+            latest_only: If True, only return the most recent row of every company, sorted by usdmarketcap
+            limit: If set, return at most this many rows (the largest ones if latest_only)
+        Returns:
+            ScreenResult: The companies with their market cap
+        """
+        params = self._global_market_cap_params(asofdate, mktcap_thres, country, limit)
+        if self.converts_in_memory:
+            assert self.fx_rates is not None
+            rates = self.fx_rates.window(self._first_pricingdate(params, allow_fuzzy), params["asofdate"])
+            return self._query_local_market_cap(
+                params, rates, allow_fuzzy=allow_fuzzy, all_countries=country == "Global", latest_only=latest_only
+            )
+
+        name, query = self._build_global_market_cap_query(
+            allow_fuzzy, country == "Global", latest_only, self.use_summary_table
+        )
+        columns = self.database.query_prepared_columns(name, query, params)
+        with stage("transform"):
+            return ScreenResult.from_columns(columns)
+
+    async def query_global_market_cap_async(
+        self,
+        asofdate: str,
+        mktcap_thres: float,
+        country: str = "US",
+        allow_fuzzy: bool = False,
+        latest_only: bool = False,
+        limit: int | None = None,
+    ) -> ScreenResult:
+        """Async version of query_global_market_cap, see there for the arguments.
+
+        Returns:
+            ScreenResult: The companies with their market cap
+        """
+        if self.async_database is None:
+            return await asyncio.to_thread(
+                self.query_global_market_cap, asofdate, mktcap_thres, country, allow_fuzzy, latest_only, limit
+            )
+
+        params = self._global_market_cap_params(asofdate, mktcap_thres, country, limit)
+        if self.converts_in_memory:
+            assert self.fx_rates is not None
+            # the rates of a date are queried once, later screens only read them from memory
+            first = self._first_pricingdate(params, allow_fuzzy)
+            if self.fx_rates.is_loaded(first, params["asofdate"]):
+                rates = self.fx_rates.window(first, params["asofdate"])
+            else:
+                rates = await asyncio.to_thread(self.fx_rates.window, first, params["asofdate"])
+            return await self._query_local_market_cap_async(
+                params, rates, allow_fuzzy=allow_fuzzy, all_countries=country == "Global", latest_only=latest_only
+            )
+
+        name, query = self._build_global_market_cap_query(
+            allow_fuzzy, country == "Global", latest_only, self.use_summary_table
+        )
+        columns = await self.async_database.query_prepared_columns(name, query, params)
+        with stage("transform"):
+            return ScreenResult.from_columns(columns)
+
+    def _query_local_market_cap(
+        self, params: Dict[str, Any], rates: np.ndarray, *, allow_fuzzy: bool, all_countries: bool, latest_only: bool
+    ) -> ScreenResult:
+        """Query a screen in local currency and convert it to USD in memory."""
+        local_params = self._local_market_cap_params(params, rates, allow_fuzzy)
+        if local_params is None:
+            return ScreenResult.empty()
+        name, query = self._build_global_market_cap_query(allow_fuzzy, all_countries, latest_only, local_currency=True)
+        columns = self.database.query_prepared_columns(name, query, local_params)
+        return self._to_usd(columns, rates, local_params["first"], latest_only, params["limit"])
+
+    async def _query_local_market_cap_async(
+        self, params: Dict[str, Any], rates: np.ndarray, *, allow_fuzzy: bool, all_countries: bool, latest_only: bool
+    ) -> ScreenResult:
+        """Async version of _query_local_market_cap."""
+        assert self.async_database is not None
+        local_params = self._local_market_cap_params(params, rates, allow_fuzzy)
+        if local_params is None:
+            return ScreenResult.empty()
+        name, query = self._build_global_market_cap_query(allow_fuzzy, all_countries, latest_only, local_currency=True)
+        columns = await self.async_database.query_prepared_columns(name, query, local_params)
+        return self._to_usd(columns, rates, local_params["first"], latest_only, params["limit"])
+
+    @staticmethod
+    def _first_pricingdate(params: Dict[str, Any], allow_fuzzy: bool) -> date:
+        """Get the first pricing date a screen reads."""
+        return params["asofdate"] - timedelta(days=3) if allow_fuzzy else params["asofdate"]
+
+    def _local_market_cap_params(
+        self, params: Dict[str, Any], rates: np.ndarray, allow_fuzzy: bool
+    ) -> Dict[str, Any] | None:
+        """Add the local currency thresholds to the parameters, None if there are no rates."""
+        if not np.isfinite(rates).any():
+            return None
+        return {
+            **params,
+            "first": self._first_pricingdate(params, allow_fuzzy),
+            "local_thres": FxRates.local_thresholds(rates, params["mktcap_thres"]),
+        }
+
+    @staticmethod
+    def _to_usd(
+        columns: Dict[str, Any], rates: np.ndarray, first: date, latest_only: bool, limit: int | None
+    ) -> ScreenResult:
+        """Convert a local currency screen to USD, then sort and limit it like the sql would."""
+        with stage("transform"):
+            columns = dict(columns)
+            currencyid = np.asarray(columns.pop("currencyid"), dtype=np.int64)
+            marketcap = np.asarray(columns["marketcap"], dtype=np.float64)
+            day_index = (np.asarray(columns["pricingdate"], dtype="datetime64[D]") - np.datetime64(first, "D")).astype(np.int64)
+            usd = FxRates.to_usd(marketcap, day_index, currencyid, rates)
+            res = ScreenResult.from_columns({**columns, "usdmarketcap": np.round(usd, 2)})
+
+            if latest_only:
+                return res.top(limit)
+            return res.sort_desc("pricingdate", "usdmarketcap", limit=limit)
+
+    def query_latest_pricingdate(self) -> date | None:
+        """Get the most recent pricing date with market caps, the version of the screens' data.
+
+        Returns:
+            date | None: The last loaded pricing date, None if there is no data
+        """
+        return self._to_date(self.database.query_all(self._latest_pricingdate_query()))
+
+    async def query_latest_pricingdate_async(self) -> date | None:
+        """Async version of query_latest_pricingdate.
+
+        Returns:
+            date | None: The last loaded pricing date, None if there is no data
+        """
+        if self.async_database is None:
+            return await asyncio.to_thread(self.query_latest_pricingdate)
+        return self._to_date(await self.async_database.query_all(self._latest_pricingdate_query()))
+
+    def _latest_pricingdate_query(self) -> str:
+        """Build the query of the last pricing date of the screened table."""
+        source = SUMMARY_TABLE_NAME if self.use_summary_table else "ciqmarketcap"
+        return f"SELECT max(pricingdate) AS pricingdate FROM {source}"
+
+    @staticmethod
+    def _to_date(res: Any) -> date | None:
+        """Get the single date of a query result, None if it is NULL."""
+        df = pd.DataFrame(res)
+        if df.empty or pd.isna(df.iloc[0, 0]):
+            return None
+        return pd.Timestamp(df.iloc[0, 0]).date()
+
+    def stream_global_market_cap(
+        self,
+        asofdate: str,
+        mktcap_thres: float,
+        country: str = "US",
+        allow_fuzzy: bool = False,
+        latest_only: bool = False,
+        limit: int | None = None,
+        chunk_size: int = 2000,
+    ) -> Iterator[ScreenResult]:
+        """Stream the result of query_global_market_cap in chunks, see there for the arguments.
+
+        Args:
+            chunk_size: Number of rows per chunk
+
+        Yields:
+            ScreenResult: The next chunk of at most chunk_size rows, in the order of the query
+        """
+        _, query = self._build_global_market_cap_query(
+            allow_fuzzy, country == "Global", latest_only, self.use_summary_table
+        )
+        params = self._global_market_cap_params(asofdate, mktcap_thres, country, limit)
+        for columns in self.database.stream_columns(query, params, chunk_size):
+            yield ScreenResult.from_columns(columns)
+
+    def stream_global_market_cap_async(
+        self,
+        asofdate: str,
+        mktcap_thres: float,
+        country: str = "US",
+        allow_fuzzy: bool = False,
+        latest_only: bool = False,
+        limit: int | None = None,
+        chunk_size: int = 2000,
+    ) -> AsyncGenerator[ScreenResult, None]:
+        """Async version of stream_global_market_cap, see there for the arguments.
+
+        Returns:
+            AsyncGenerator[ScreenResult, None]: Chunks of at most chunk_size rows, in the order of the query
+        """
+        if self.async_database is None:
+            chunks = self.stream_global_market_cap(
+                asofdate, mktcap_thres, country, allow_fuzzy, latest_only, limit, chunk_size
+            )
+            return iterate_in_thread(chunks)
+
+        _, query = self._build_global_market_cap_query(
+            allow_fuzzy, country == "Global", latest_only, self.use_summary_table
+        )
+        params = self._global_market_cap_params(asofdate, mktcap_thres, country, limit)
+        return self._to_results(self.async_database.stream_columns(query, params, chunk_size))
+
+    @staticmethod
+    async def _to_results(chunks: AsyncGenerator[Dict[str, Any], None]) -> AsyncGenerator[ScreenResult, None]:
+        """Convert streamed chunks to screen results, closing the stream when done."""
+        async with aclosing(chunks):
+            async for columns in chunks:
+                yield ScreenResult.from_columns(columns)
+
+    @staticmethod
+    def _global_market_cap_params(asofdate: str, mktcap_thres: float, country: str, limit: int | None) -> Dict[str, Any]:
+        """Validate the arguments of query_global_market_cap and build the query parameters.
+
         Returns:
-            pd.DataFrame: A dataframe with the company ID and market cap
+            dict: The query parameters by placeholder name
         """
         # check asofdate is a str
         if not isinstance(asofdate, str):
             raise ValueError("asofdate must be a string")
 
-        if country == "Global":
-            all_countries = True
-        else:
-            all_countries = False
+        return {
+            "asofdate": date.fromisoformat(asofdate),
+            "mktcap_thres": mktcap_thres,
+            "country": country,
+            "limit": None if limit is None else int(limit),
+        }
+
+    @staticmethod
+    @cache
+    def _build_global_market_cap_query(
+        allow_fuzzy: bool, all_countries: bool, latest_only: bool, from_summary: bool = False, local_currency: bool = False
+    ) -> Tuple[str, str]:
+        """Build the sql template of query_global_market_cap, see there for the arguments.
+
+        The inputs are passed as parameters instead of being formatted into the sql, so
+        there is one template (and one server-side plan) per combination of flags.
+
+        Args:
+            from_summary: If True, read the pre-joined screener_daily_mktcap table
+                instead of joining the CIQ tables
+            local_currency: If True, return the market caps in their currency with their
+                currencyid and no usdmarketcap, unsorted and without limit. The threshold
+                is applied as %(local_thres)s[day][currencyid + 1], a 2d array of the
+                thresholds in local currency per pricing date from %(first)s (see FxRates)
+
+        Returns:
+            tuple: The statement name and the sql with %(name)s placeholders
+        """
+        name = "{}_market_cap_{}_{}_{}".format(
+            "summary" if from_summary else "local" if local_currency else "global",
+            "fuzzy" if allow_fuzzy else "exact",
+            "global" if all_countries else "country",
+            "latest" if latest_only else "all",
+        )
+
+        # tables holding the companyid and pricingdate, and the country of a row
+        source = SUMMARY_TABLE_NAME if from_summary else "ciqmarketcap"
+        country_column = f"{SUMMARY_TABLE_NAME}.country" if from_summary else "ciqcountrygeo.isocountry2"
+
+        # keep only the most recent row of every company in the database
+        # instead of shipping every pricing date of the window to pandas
+        select = f"SELECT DISTINCT ON ({source}.companyid)" if latest_only else "SELECT"
 
-        # Common SELECT fields and table joins for both scenarios
-        query = """
-            SELECT 
+        if local_currency:
+            # converted to usd in memory, no exchange rate join
+            query = f"""
+            {select}
+                ciqmarketcap.companyid,
+                ciqmarketcap.marketcap,
+                ciqmarketcap.pricingdate,
+                ciqtradingitem.currencyid,
+                ciqcompany.companyname,
+                ciqtradingitem.tickersymbol,
+                ciqcurrency.isocode as currency,
+                ciqexchange.exchangesymbol as exchange,
+                ciqcountrygeo.isocountry2 as country
+            FROM
+                ciqmarketcap
+            JOIN
+                ciqcompany ON ciqmarketcap.companyID = ciqcompany.companyID
+            JOIN
+                ciqsecurity ON ciqmarketcap.companyID = ciqsecurity.companyID
+            JOIN
+                ciqtradingitem on ciqsecurity.securityid = ciqtradingitem.securityid
+            JOIN
+                ciqcurrency on ciqtradingitem.currencyid = ciqcurrency.currencyid
+            JOIN
+                ciqexchange on ciqtradingitem.exchangeid = ciqexchange.exchangeid
+            JOIN
+                ciqcountrygeo on ciqcompany.countryid = ciqcountrygeo.countryid
+            WHERE
+            """
+        elif from_summary:
+            # the joins and the usd conversion are done when the table is loaded
+            query = f"""
+            {select}
+                {source}.companyid,
+                {source}.marketcap,
+                {source}.pricingdate,
+                {source}.usdmarketcap,
+                {source}.companyname,
+                {source}.tickersymbol,
+                {source}.currency,
+                {source}.exchange,
+                {source}.country
+            FROM
+                {source}
+            WHERE
+            """
+        else:
+            # Common SELECT fields and table joins for both scenarios
+            query = f"""
+            {select}
                 ciqmarketcap.companyid,
                 ciqmarketcap.marketcap,
                 ciqmarketcap.pricingdate,
@@ -79,11 +422,11 @@ class TaskManagerRepository:
         # Date conditions differ based on allow_fuzzy
         if allow_fuzzy:
             query += f"""
-                ciqmarketcap.pricingdate BETWEEN DATE('{asofdate}') - INTERVAL '3 days' AND '{asofdate}'
+                {source}.pricingdate BETWEEN %(asofdate)s::date - INTERVAL '3 days' AND %(asofdate)s::date
             """
         else:
             query += f"""
-                ciqmarketcap.pricingdate = '{asofdate}'
+                {source}.pricingdate = %(asofdate)s::date
             """
 
         # add country filter if not all countries
@@ -92,28 +435,70 @@ class TaskManagerRepository:
         else:
             query += f"""
                 AND 
-                    ciqcountrygeo.isocountry2 = '{country}'
+                    {country_column} = %(country)s::text
             """
 
-        # Common WHERE conditions for both scenarios
-        query += f"""
+        if from_summary:
+            query += f"""
             AND
-                ciqexchangerate.pricedate = '{asofdate}'
+                {source}.usdmarketcap >= %(mktcap_thres)s::numeric
+            """
+        elif local_currency:
+            # a missing rate is NULL, which drops the row like the exchange rate join does
+            query += """
+            AND
+                ciqmarketcap.marketcap >= (%(local_thres)s::float8[])
+                    [ciqmarketcap.pricingdate - %(first)s::date + 1][ciqtradingitem.currencyid + 1]
+            AND
+                ciqcompany.companytypeid in (4, 5)
+            AND
+                ciqsecurity.primaryflag = 1
+            AND
+                ciqtradingitem.primaryflag = 1
+            """
+        else:
+            # Common WHERE conditions for both scenarios
+            query += """
+            AND
+                ciqexchangerate.pricedate = ciqmarketcap.pricingdate
             AND
                 ciqexchangerate.latestsnapflag = 1
             AND
-                ciqmarketcap.marketcap / ciqexchangerate.priceclose >= {mktcap_thres}
+                ciqmarketcap.marketcap / ciqexchangerate.priceclose >= %(mktcap_thres)s::numeric
             AND
                 ciqcompany.companytypeid in (4, 5)
             AND 
                 ciqsecurity.primaryflag = 1
             AND 
                 ciqtradingitem.primaryflag = 1
+            """
+
+        if local_currency:
+            # sorted and limited after the usd conversion
+            if latest_only:
+                query += f"""
+                ORDER BY
+                    {source}.companyid, {source}.pricingdate DESC
+                """
+            return name, query
+
+        if latest_only:
+            query = f"""
+            SELECT * FROM ({query}
+                ORDER BY
+                    {source}.companyid, {source}.pricingdate DESC
+            ) AS latest
             ORDER BY
-                ciqmarketcap.pricingdate DESC, usdmarketcap DESC
-        """
+                usdmarketcap DESC
+            """
+        else:
+            query += f"""
+            ORDER BY
+                {source}.pricingdate DESC, usdmarketcap DESC
+            """
 
-        res = self.database.query_all(query)
-        # convert to dataframe
-        df = pd.DataFrame(res)
-        return df
\ No newline at end of file
+        # LIMIT NULL returns all rows
+        query += """
+            LIMIT %(limit)s::bigint
+        """
+        return name, query
@@ -0,0 +1,142 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Dict, List
+from app.database.base_database import BaseDatabase
+from app.utils.imports import LazyModule
+from app.utils.logging import get_logger
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+else:
+    np = LazyModule("numpy")
+    pd = LazyModule("pandas")
+
+# Initialize logger
+logger = get_logger(__name__)
+
+
+class FxRates:
+    """USD exchange rates of every currency per pricing date, loaded once per date.
+
+    The rates of a date are kept as a dense vector indexed by currencyid (NaN for
+    currencies without a rate), so converting a screen to USD is one vectorized
+    division and every screen of the date reuses the same vector instead of joining
+    ciqexchangerate again. A rate is the price of one USD in the currency, the
+    usd market cap is marketcap / rate.
+    """
+
+    def __init__(self, database: BaseDatabase, maxdates: int = 64):
+        """Initialize the rates.
+
+        Args:
+            database: Database holding ciqexchangerate
+            maxdates: Number of dates kept in memory, the least recently used is dropped
+        """
+        self.database = database
+        self.maxdates = maxdates
+        self._rates: OrderedDict[date, np.ndarray] = OrderedDict()
+        # the repository calls in from the database threads
+        self._lock = threading.Lock()
+
+    def window(self, first: date, last: date) -> np.ndarray:
+        """Get the rates of consecutive dates, loading the missing ones in one query.
+
+        Args:
+            first: First pricing date
+            last: Last pricing date
+
+        Returns:
+            np.ndarray: One row per date from first to last, one column per currencyid
+        """
+        dates = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        with self._lock:
+            missing = [d for d in dates if d not in self._rates]
+            if missing:
+                self._load(missing[0], missing[-1])
+            vectors = []
+            for d in dates:
+                # dates without rates are only kept once they are final, see _load
+                vectors.append(self._rates.get(d, np.empty(0)))
+                if d in self._rates:
+                    self._rates.move_to_end(d)
+
+        width = max((len(vector) for vector in vectors), default=0)
+        matrix = np.full((len(dates), width), np.nan)
+        for i, vector in enumerate(vectors):
+            matrix[i, : len(vector)] = vector
+        return matrix
+
+    def is_loaded(self, first: date, last: date) -> bool:
+        """Check whether window(first, last) is answered from memory without a query."""
+        return all(first + timedelta(days=i) in self._rates for i in range((last - first).days + 1))
+
+    def _load(self, first: date, last: date) -> None:
+        """Query the rates of a range of dates, callers hold the lock."""
+        res = pd.DataFrame(
+            self.database.query_all(
+                """
+                SELECT pricedate, currencyid, priceclose
+                FROM ciqexchangerate
+                WHERE pricedate BETWEEN %(first)s::date AND %(last)s::date
+                AND latestsnapflag = 1
+                """,
+                {"first": first, "last": last},
+            ),
+            columns=["pricedate", "currencyid", "priceclose"],
+        )
+        by_date: Dict[date, pd.DataFrame] = {
+            pd.Timestamp(d).date(): group for d, group in res.groupby("pricedate", sort=False)
+        }
+
+        today = date.today()
+        for i in range((last - first).days + 1):
+            d = first + timedelta(days=i)
+            group = by_date.get(d)
+            if group is None:
+                # a past date without rates (e.g. a weekend) stays without, today's may still be loaded
+                if d < today:
+                    self._rates[d] = np.empty(0)
+                continue
+            currencyids = group["currencyid"].to_numpy(dtype=np.int64)
+            vector = np.full(currencyids.max() + 1, np.nan)
+            vector[currencyids] = group["priceclose"].to_numpy(dtype=float)
+            self._rates[d] = vector
+
+        while len(self._rates) > self.maxdates:
+            self._rates.popitem(last=False)
+        logger.info(f"Loaded the exchange rates of {first} - {last} ({len(res)} rates)")
+
+    @staticmethod
+    def local_thresholds(rates: np.ndarray, usd_threshold: float) -> List[List[float | None]]:
+        """Convert a usd threshold into local currency thresholds.
+
+        Args:
+            rates: Rates from window
+            usd_threshold: Threshold in USD
+
+        Returns:
+            list: Per date and currencyid the threshold in the currency, None if
+                there is no rate, shaped as a sql array parameter
+        """
+        thresholds = rates * usd_threshold
+        return [[None if np.isnan(value) else float(value) for value in row] for row in thresholds]
+
+    @staticmethod
+    def to_usd(marketcap: np.ndarray, day_index: np.ndarray, currencyid: np.ndarray, rates: np.ndarray) -> np.ndarray:
+        """Convert market caps to USD with the rate of their own date.
+
+        Args:
+            marketcap: Market caps in their currency
+            day_index: Row of rates (date) of every market cap
+            currencyid: Currency of every market cap
+            rates: Rates from window
+
+        Returns:
+            np.ndarray: The market caps in USD, NaN where there is no rate
+        """
+        if len(marketcap) == 0:
+            return np.empty(0)
+        return marketcap / rates[day_index, currencyid]
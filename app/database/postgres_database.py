@@ -1,46 +1,199 @@
-from typing import Tuple, List
+from __future__ import annotations
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, Sequence, Tuple, List
+import re
+import threading
+import uuid
 import psycopg2
-import pandas as pd
-from app.database.base_database import BaseDatabase
-from app.utils.logging import get_logger
+from psycopg2 import errors, extensions
+from app.database.base_database import WritableDatabase
+from app.database.connection_pool import ConnectionPool
+from app.utils.imports import LazyModule
+from app.utils.logging import QUERY_LOGGER_NAME, get_logger
+from app.utils.metrics import stage
 from contextlib import contextmanager
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = LazyModule("pandas")
+
 # Initialize logger
 logger = get_logger(__name__)
+query_logger = get_logger(QUERY_LOGGER_NAME)
+
+# NUMERIC as float instead of Decimal, registered on the cursors of the column queries
+NUMERIC_AS_FLOAT = extensions.new_type(
+    extensions.DECIMAL.values, "NUMERIC_AS_FLOAT", lambda value, cur: None if value is None else float(value)
+)
+
+
+class PreparedStatementConnection(extensions.connection):
+    """psycopg2 connection remembering the statements prepared in its session."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: set[str] = set()
+
+
+@lru_cache(maxsize=64)
+def to_positional(query: str) -> Tuple[str, Tuple[str, ...]]:
+    """Rewrite the named placeholders of a query to the $n placeholders of PREPARE.
+
+    Args:
+        query: Query with psycopg2 placeholders like %(name)s
+
+    Returns:
+        tuple: The rewritten query and the parameter names in $n order
+    """
+    names: List[str] = []
+
+    def replace(match: re.Match) -> str:
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
 
-class PostgresDatabase(BaseDatabase):
+    return re.sub(r"%\((\w+)\)s", replace, query), tuple(names)
+
+
+class PostgresDatabase(WritableDatabase):
     """Postgres database class providing PostgresQL connection handling."""
 
-    def __init__(self, dbname: str, user: str, password:str, host: str="localhost", port: int=5432):
+    def __init__(
+        self,
+        dbname: str,
+        user: str,
+        password: str,
+        host: str = "localhost",
+        port: int = 5432,
+        pool: bool = False,
+        pool_minconn: int = 1,
+        pool_maxconn: int = 10,
+        pool_timeout: float = 30.0,
+        pool_recycle: float = 1800.0,
+        pool_pre_ping: bool = True,
+    ):
         """Initialize database with configuration.
 
         Args:
-            config: Database configuration containing connection details
+            dbname: Database name
+            user: Database user
+            password: Database password
+            host: Database host
+            port: Database port
+            pool: If True, reuse connections from a pool instead of connecting per query
+            pool_minconn: Connections opened when the pool is created
+            pool_maxconn: Maximum number of connections checked out at once
+            pool_timeout: Seconds to wait for a free pooled connection
+            pool_recycle: Maximum age in seconds of a pooled connection
+            pool_pre_ping: If True, health check pooled connections on checkout
         """
-        self.config = dict(dbname=dbname, user=user, password=password, host=host, port=port)
+        self.config: Dict[str, Any] = dict(
+            dbname=dbname,
+            user=user,
+            password=password,
+            host=host,
+            port=port,
+            connection_factory=PreparedStatementConnection,
+        )
+        self.pool_config: Dict[str, Any] = dict(
+            minconn=pool_minconn,
+            maxconn=pool_maxconn,
+            timeout=pool_timeout,
+            recycle=pool_recycle,
+            pre_ping=pool_pre_ping,
+        )
+        self.use_pool = pool
+        self._pool: ConnectionPool | None = None
+        self._pool_lock = threading.Lock()
+        # no connection is opened here, see check_connection
+
+    def check_connection(self) -> bool:
+        """Test the connection, in pool mode this also opens the initial connections.
 
+        Called at server startup instead of on construction, so building the app
+        never blocks on the database.
+
+        Returns:
+            bool: True if the database could be reached
+        """
+        dbname, host = self.config["dbname"], self.config["host"]
         try:
-            # Test connection
-            conn = psycopg2.connect(**self.config)
-            conn.close()
+            if self.use_pool:
+                self._get_pool()
+            else:
+                conn = psycopg2.connect(**self.config)
+                conn.close()
             logger.info(f"Successfully connected to database {dbname}@{host}")
+            return True
         except (Exception, psycopg2.DatabaseError) as e:
             logger.error(f"Failed to connect to database {dbname}@{host}: {e}")
+            return False
+
+    def _get_pool(self) -> ConnectionPool:
+        """Get the connection pool, creating it on first use.
 
+        Returns:
+            ConnectionPool: The connection pool of this database
+        """
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ConnectionPool(self.config, **self.pool_config)
+                    logger.info(
+                        f"Created connection pool for {self.config['dbname']}@{self.config['host']} "
+                        f"(min={self.pool_config['minconn']}, max={self.pool_config['maxconn']})"
+                    )
+        return self._pool
 
     @contextmanager
     def get_connection(self):
         """Get database connection as context manager.
 
+        In pool mode the connection is borrowed from the pool and returned afterwards,
+        otherwise a new connection is opened and closed.
+
         Yields:
             Connection: Database connection
         """
-        conn = psycopg2.connect(**self.config)
-        try:
-            yield conn
-        finally:
-            conn.close()
+        if self.use_pool:
+            pool = self._get_pool()
+            with stage("db_wait"):
+                conn = pool.getconn()
+            broken = False
+            try:
+                yield conn
+            except (psycopg2.InterfaceError, psycopg2.OperationalError):
+                # the connection itself is likely unusable, do not hand it out again
+                broken = True
+                raise
+            finally:
+                pool.putconn(conn, close=broken)
+        else:
+            with stage("db_wait"):
+                conn = psycopg2.connect(**self.config)
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Get the connection counts of the pool.
 
-    def query_all(self, query: str, params: Tuple = ()) -> List[Tuple]:
+        Returns:
+            dict: Connections in use and idle, empty if there is no pool yet
+        """
+        if self._pool is None:
+            return {}
+        return {"db_pool_in_use": self._pool.in_use, "db_pool_idle": self._pool.idle}
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+    def query_all(self, query: str, params: Tuple | Dict[str, Any] = ()) -> List[Tuple]:
         """Execute a query and return all results.
 
         Args:
@@ -52,9 +205,178 @@ class PostgresDatabase(BaseDatabase):
         """
         with self.get_connection() as conn:
             cur = conn.cursor()
-            cur.execute(query, params)
-            logger.info(f"{cur.query}: {cur.statusmessage}")
+            with stage("db_fetch"):
+                cur.execute(query, params)
+            return self._fetch_frame(cur)
+
+    def execute(self, query: str, params: Tuple | Dict[str, Any] = ()) -> int:
+        """Execute a statement that modifies the database and commit it.
+
+        Args:
+            query: SQL statement to execute
+            params: Statement parameters
+
+        Returns:
+            int: Number of affected rows
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                query_logger.info(f"{cur.query}: {cur.statusmessage}")
+                rowcount = cur.rowcount
+            conn.commit()
+            return rowcount
+
+    def query_prepared(self, name: str, query: str, params: Dict[str, Any]) -> List[Tuple]:
+        """Execute a query as a server-side prepared statement and return all results.
+
+        The statement is prepared once per pooled connection and executed by name
+        afterwards, so Postgres plans it only once per session. Without a pool every
+        query runs on a new connection and preparing would only add a round trip, so
+        the query is executed directly.
+
+        Args:
+            name: Statement name, unique per query text
+            query: SQL query with named placeholders like %(name)s
+            params: Query parameters by name
+
+        Returns:
+            list[tuple]: List of query results
+        """
+        return self._query_prepared(name, query, params, self._fetch_frame)
+
+    def query_prepared_columns(self, name: str, query: str, params: Dict[str, Any]) -> Dict[str, Sequence[Any]]:
+        """Execute a query like query_prepared and return the values of every column.
+
+        No dataframe is built and NUMERIC values are returned as floats instead of
+        Decimals, the rows are only transposed into columns.
+
+        Args:
+            name: Statement name, unique per query text
+            query: SQL query with named placeholders like %(name)s
+            params: Query parameters by name
+
+        Returns:
+            dict: The values of every column by column name
+        """
+        return self._query_prepared(name, query, params, self._fetch_columns, numeric_as_float=True)
+
+    def _query_prepared(
+        self, name: str, query: str, params: Dict[str, Any], fetch: Callable[[Any], Any], numeric_as_float: bool = False
+    ) -> Any:
+        """Execute a query as a prepared statement (see query_prepared) and fetch its result with fetch."""
+        with self.get_connection() as conn:
+            cur = conn.cursor()
+            if numeric_as_float:
+                extensions.register_type(NUMERIC_AS_FLOAT, cur)
+
+            prepared = getattr(conn, "prepared", None)
+            if not self.use_pool or prepared is None:
+                with stage("db_fetch"):
+                    cur.execute(query, params)
+                return fetch(cur)
+
+            prepared_query, param_names = to_positional(query)
+            values = tuple(params[param_name] for param_name in param_names)
+            execute = f"EXECUTE {name}"
+            if values:
+                execute += f" ({', '.join(['%s'] * len(values))})"
+
+            with stage("db_fetch"):
+                for attempt in range(2):
+                    if name not in prepared:
+                        cur.execute(f"PREPARE {name} AS {prepared_query}")
+                        prepared.add(name)
+                    try:
+                        cur.execute(execute, values)
+                        break
+                    except errors.InvalidSqlStatementName:
+                        # the session lost the statement (e.g. DISCARD ALL), prepare it again
+                        conn.rollback()
+                        prepared.discard(name)
+                        if attempt:
+                            raise
+            return fetch(cur)
+
+    def stream_query(self, query: str, params: Tuple | Dict[str, Any] = (), chunk_size: int = 2000) -> Iterator[pd.DataFrame]:
+        """Execute a query and yield the results in chunks.
+
+        The rows are read through a named (server-side) cursor, so only chunk_size rows
+        are held in memory at a time. The connection is kept for as long as the
+        generator is consumed, close the generator to release it early.
+
+        Args:
+            query: SQL query to execute
+            params: Query parameters
+            chunk_size: Number of rows fetched per round trip
+
+        Yields:
+            pd.DataFrame: The next chunk of at most chunk_size rows
+        """
+        for column_names, rows in self._stream_rows(query, params, chunk_size, numeric_as_float=False):
+            with stage("transform"):
+                chunk = pd.DataFrame(rows, columns=column_names)
+            yield chunk
+
+    def stream_columns(
+        self, query: str, params: Tuple | Dict[str, Any] = (), chunk_size: int = 2000
+    ) -> Iterator[Dict[str, Sequence[Any]]]:
+        """Execute a query like stream_query and yield the values of every column per chunk.
+
+        NUMERIC values are returned as floats, see query_prepared_columns.
+
+        Yields:
+            dict: The values of every column of the next chunk by column name
+        """
+        for column_names, rows in self._stream_rows(query, params, chunk_size, numeric_as_float=True):
+            yield self._transpose(column_names, rows)
+
+    def _stream_rows(
+        self, query: str, params: Tuple | Dict[str, Any], chunk_size: int, numeric_as_float: bool
+    ) -> Iterator[Tuple[List[str], List[Tuple]]]:
+        """Read the rows of a query through a server-side cursor, see stream_query."""
+        with self.get_connection() as conn:
+            # a named cursor lives in the transaction, ending it (pool return or close) drops the cursor
+            cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+            cur.itersize = chunk_size
+            if numeric_as_float:
+                extensions.register_type(NUMERIC_AS_FLOAT, cur)
+            with stage("db_fetch"):
+                cur.execute(query, params)
+            query_logger.info(f"{cur.query}: streaming in chunks of {chunk_size}")
+            try:
+                while True:
+                    with stage("db_fetch"):
+                        rows = cur.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield [desc[0] for desc in cur.description], rows
+            finally:
+                if not conn.closed:
+                    cur.close()
+
+    @staticmethod
+    def _fetch_frame(cur) -> pd.DataFrame:
+        """Fetch the result of an executed cursor into a dataframe."""
+        query_logger.info(f"{cur.query}: {cur.statusmessage}")
+        with stage("db_fetch"):
             result = cur.fetchall()
+        with stage("transform"):
             column_names = [desc[0] for desc in cur.description]
             df = pd.DataFrame(result, columns=column_names)
-            return df
+        return df
+
+    @staticmethod
+    def _fetch_columns(cur) -> Dict[str, Sequence[Any]]:
+        """Fetch the result of an executed cursor as the values of every column."""
+        query_logger.info(f"{cur.query}: {cur.statusmessage}")
+        with stage("db_fetch"):
+            rows = cur.fetchall()
+        with stage("transform"):
+            return PostgresDatabase._transpose([desc[0] for desc in cur.description], rows)
+
+    @staticmethod
+    def _transpose(column_names: List[str], rows: List[Tuple]) -> Dict[str, Sequence[Any]]:
+        """Turn rows into the values of every column."""
+        columns = zip(*rows, strict=True) if rows else (() for _ in column_names)
+        return dict(zip(column_names, columns, strict=True))
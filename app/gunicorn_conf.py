@@ -0,0 +1,22 @@
+# Gunicorn configuration of the production server
+#   gunicorn -c app/gunicorn_conf.py 'app.main:create_app()'
+#
+# WEB_CONCURRENCY uvicorn workers serve the app, each with its own connection pool
+# (POSTGRES_CONNECTION_BUDGET is split between them) and the latest screens shared
+# through SHARED_CACHE_DIR. kill -HUP <master pid> reloads the code and the
+# configuration gracefully: new workers are started, the old ones finish their
+# requests within GRACEFUL_TIMEOUT seconds and exit.
+from app.config.config import get_config
+
+# every module level name is read as a gunicorn setting, "config" is one of them
+server_config = get_config().server
+
+bind = f"0.0.0.0:{server_config.port}"
+workers = server_config.workers
+worker_class = "uvicorn.workers.UvicornWorker"
+graceful_timeout = server_config.graceful_timeout
+keepalive = 5
+
+# every worker builds the app and opens its own database connections, connections
+# must not be inherited through the fork
+preload_app = False
@@ -0,0 +1,104 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from fastapi import FastAPI
+from app.cache import CacheWarmer, MarketCapHistoryStore, ScreenCache, SharedScreenCache, SnapshotStore
+from app.database import AsyncPostgresDatabase, FxRates, PostgresDatabase
+from app.database.db_task_manager import TaskManagerRepository
+from app.api.api_server import TheFunScreenerServer
+from app.api.api_service import TheFunScreenerService
+from app.api.api import TheFunScreenerAPI
+from app.api.auth import api_keys, install_reload_handler
+from app.utils.imports import preload
+from app.utils.logging import configure_logging
+from app.utils.metrics import metrics
+
+from app.config.config import get_config
+
+
+def create_app() -> FastAPI:
+    """Build the app, every worker process calls this once.
+
+    Nothing is connected or started here, the database and the cache warmer are
+    started by the lifespan of the app, so building it is fast and never blocks.
+
+    Returns:
+        FastAPI: The app with all routes registered
+    """
+    config = get_config()
+
+    # Initialize dependencies, the database connects on first use
+    database = PostgresDatabase(**config.database.db_config, **config.database.pool_config)
+    task_manager = TaskManagerRepository(
+        database,
+        AsyncPostgresDatabase(database),
+        use_summary_table=config.database.use_summary_table,
+        fx_rates=FxRates(database) if config.database.fx_in_memory else None,
+    )
+
+    # Create business services
+    snapshot_store = SnapshotStore(config.paths.full_input_dir / "snapshots")
+    screen_cache = ScreenCache(maxsize=config.cache.screen_cache_size, refresh_time=config.cache.refresh_time)
+    # the workers of a multi-worker server share the latest screens, only one of them queries each
+    shared_cache = None
+    if config.cache.shared_cache_dir is not None:
+        shared_cache = SharedScreenCache(config.cache.shared_cache_dir, refresh_time=config.cache.refresh_time)
+    # company histories, written by scripts/refresh_market_cap_history.py and mapped on first use
+    history_store = MarketCapHistoryStore(config.cache.history_dir or config.paths.full_input_dir / "history")
+    thefunscreener_service = TheFunScreenerService(
+        task_manager,
+        snapshot_store,
+        screen_cache,
+        universe_mode=config.cache.universe_mode,
+        batch_concurrency=config.service.batch_concurrency,
+        stream_chunk_size=config.service.stream_chunk_size,
+        shared_cache=shared_cache,
+        version_ttl=config.service.version_ttl,
+        history_store=history_store,
+    )
+
+    # Precompute the latest screens at startup and after every data refresh
+    cache_warmer = None
+    if config.cache.warmup:
+        cache_warmer = CacheWarmer(
+            thefunscreener_service,
+            config.cache.warmup_countries,
+            concurrency=config.cache.warmup_concurrency,
+            refresh_time=config.cache.refresh_time,
+        )
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        configure_logging()
+        await asyncio.gather(
+            # a worker also starts while the database is down, the queries fail until it is back
+            asyncio.to_thread(database.check_connection),
+            # imported lazily, loaded while the database is checked instead of on the first request
+            asyncio.to_thread(preload, "pandas", "pyarrow"),
+        )
+        if cache_warmer is not None:
+            cache_warmer.start_daily()
+        yield
+        # Return the connections when the worker stops, e.g. on a graceful reload
+        database.close()
+
+    # Create server
+    server = TheFunScreenerServer(lifespan=lifespan)
+
+    # Api endpoints
+    api = TheFunScreenerAPI(
+        thefunscreener_service, batch_max_dates=config.service.batch_max_dates, cache_warmer=cache_warmer
+    )
+
+    # Register api endpoints on the server
+    server.add_routes(api.router)
+
+    # Export the cache counters and the connection pool usage with the request metrics
+    metrics.register_gauges(lambda: {f"screen_cache_{k}": v for k, v in thefunscreener_service.get_cache_stats().items()})
+    metrics.register_gauges(database.pool_stats)
+
+    # Validate api keys against the loaded configuration, kill -HUP reloads them
+    api_keys.reload(config.api_keys)
+    install_reload_handler()
+
+    return server.app
@@ -20,4 +20,46 @@ class MarketCapEntry(BaseModel):
     tickersymbol: str
     currency: str
     exchange: str
-    country: str
\ No newline at end of file
+    country: str
+
+
+class CompanyMarketCapHistory(BaseModel):
+    """
+    Daily usd market cap of one company, one array per field:
+    {"companyid": 21835, "pricingdate": ["2025-05-02", "2025-05-03"], "usdmarketcap": [3181425.3, 3235237.69]}
+    """
+    companyid: int
+    pricingdate: list[str]
+    usdmarketcap: list[float]
+
+
+class Constituent(BaseModel):
+    """
+    A company that entered or left a screen, with its rank (1 = largest) in the screen it is part of
+    """
+    companyid: int
+    companyname: str
+    tickersymbol: str
+    rank: int
+    usdmarketcap: float
+
+
+class RankMove(BaseModel):
+    """
+    A company in both screens whose rank changed
+    """
+    companyid: int
+    tickersymbol: str
+    from_rank: int
+    to_rank: int
+
+
+class ConstituentChanges(BaseModel):
+    """
+    Changes of a screen between two dates, adds and moves by their new rank, drops by their old rank
+    """
+    from_date: str
+    to_date: str
+    adds: list[Constituent]
+    drops: list[Constituent]
+    moves: list[RankMove]
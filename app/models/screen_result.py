@@ -0,0 +1,310 @@
+from __future__ import annotations
+import heapq
+from functools import cache
+from itertools import islice
+from operator import itemgetter
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Mapping, Sequence, Tuple
+from app.utils.imports import LazyModule
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+else:
+    np = LazyModule("numpy")
+    pd = LazyModule("pandas")
+    pa = LazyModule("pyarrow")
+
+# fields of a screen, in the order of MarketCapEntry
+FIELDS = (
+    "companyid", "marketcap", "pricingdate", "usdmarketcap", "companyname",
+    "tickersymbol", "currency", "exchange", "country",
+)
+FLOAT_FIELDS = ("marketcap", "usdmarketcap")
+STRING_FIELDS = ("companyname", "tickersymbol")
+# low cardinality string fields, stored as codes into a dictionary of their distinct values
+CATEGORICAL_FIELDS = ("currency", "exchange", "country")
+
+
+@cache
+def arrow_schema() -> pa.Schema:
+    """Get the Arrow schema of a screen, built on first use so pyarrow is imported lazily."""
+    return pa.schema([
+        ("companyid", pa.int64()),
+        ("marketcap", pa.float64()),
+        ("pricingdate", pa.date32()),
+        ("usdmarketcap", pa.float64()),
+        ("companyname", pa.string()),
+        ("tickersymbol", pa.string()),
+        ("currency", pa.dictionary(pa.int32(), pa.string())),
+        ("exchange", pa.dictionary(pa.int32(), pa.string())),
+        ("country", pa.dictionary(pa.int32(), pa.string())),
+    ])
+
+
+def _object_array(values: Iterable[Any]) -> np.ndarray:
+    """Build a 1d object array, also from values that are sequences themselves."""
+    values = list(values)
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def factorize(values: Sequence[Any] | np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Encode values as codes into the array of their distinct values.
+
+    Args:
+        values: The values, e.g. a column of currency codes
+
+    Returns:
+        tuple: The int32 code of every value and the distinct values in order of appearance
+    """
+    lookup: Dict[Any, int] = {}
+    codes = np.fromiter((lookup.setdefault(value, len(lookup)) for value in values), dtype=np.int32, count=len(values))
+    return codes, _object_array(lookup)
+
+
+class ScreenResult:
+    """Market-cap screen held as one typed NumPy array per field.
+
+        companyid                    int64
+        marketcap, usdmarketcap      float64 (NaN for NULL)
+        pricingdate                  datetime64[D]
+        companyname, tickersymbol    object
+        currency, exchange, country  int32 codes into `dictionaries[field]`
+
+    Sorting, deduplication and top-k are argsort/argpartition plus one fancy index
+    per column, head is a view, and the categorical dictionaries are shared between
+    a result and the results derived from it. pandas is only needed by to_pandas
+    and from_pandas.
+    """
+
+    __slots__ = ("columns", "dictionaries")
+
+    def __init__(self, columns: Dict[str, np.ndarray], dictionaries: Dict[str, np.ndarray]):
+        """Wrap typed columns, see from_columns to build a result from plain values.
+
+        Args:
+            columns: Array of every field, the codes for the categorical fields
+            dictionaries: Distinct values of every categorical field
+        """
+        self.columns = columns
+        self.dictionaries = dictionaries
+
+    @classmethod
+    def from_columns(cls, values: Mapping[str, Sequence[Any] | np.ndarray]) -> ScreenResult:
+        """Build a result from the values of every field, e.g. the columns of a query result.
+
+        Args:
+            values: Values by field name, other keys are ignored. Numbers may be
+                Decimals, dates datetime.date or datetime64, NULL is None
+
+        Returns:
+            ScreenResult: The typed result
+        """
+        columns: Dict[str, np.ndarray] = {}
+        dictionaries: Dict[str, np.ndarray] = {}
+        for field in FIELDS:
+            column = values[field]
+            if field == "companyid":
+                columns[field] = np.asarray(column, dtype=np.int64)
+            elif field in FLOAT_FIELDS:
+                # Decimals and None (NaN) are converted by numpy
+                columns[field] = np.asarray(column, dtype=np.float64)
+            elif field == "pricingdate":
+                columns[field] = np.asarray(column, dtype="datetime64[D]")
+            elif field in CATEGORICAL_FIELDS:
+                columns[field], dictionaries[field] = factorize(column)
+            else:
+                columns[field] = _object_array(column)
+        return cls(columns, dictionaries)
+
+    @classmethod
+    def empty(cls) -> ScreenResult:
+        """Build a result without rows."""
+        return cls.from_columns({field: () for field in FIELDS})
+
+    @classmethod
+    def concat(cls, results: Sequence[ScreenResult]) -> ScreenResult:
+        """Concatenate results, e.g. the chunks of a streamed screen.
+
+        Args:
+            results: The results, in order
+
+        Returns:
+            ScreenResult: All rows of the results
+        """
+        results = [result for result in results if len(result)]
+        if not results:
+            return cls.empty()
+        if len(results) == 1:
+            return results[0]
+
+        columns = {
+            field: np.concatenate([result.columns[field] for result in results])
+            for field in FIELDS if field not in CATEGORICAL_FIELDS
+        }
+        dictionaries = {}
+        for field in CATEGORICAL_FIELDS:
+            # map the codes of every result into one merged dictionary
+            lookup: Dict[Any, int] = {}
+            codes = []
+            for result in results:
+                dictionary = result.dictionaries[field]
+                mapping = np.fromiter(
+                    (lookup.setdefault(value, len(lookup)) for value in dictionary), dtype=np.int32, count=len(dictionary)
+                )
+                codes.append(mapping[result.columns[field]])
+            columns[field] = np.concatenate(codes)
+            dictionaries[field] = _object_array(lookup)
+        return cls(columns, dictionaries)
+
+    @classmethod
+    def merge_top(cls, results: Sequence[ScreenResult], n: int | None = None) -> ScreenResult:
+        """Merge results sorted by usdmarketcap into one sorted result, e.g. the screens of a region's countries.
+
+        A k-way merge of the sorted results, so only the first n rows of every result
+        are read and ties keep the order of the results.
+
+        Args:
+            results: The results, each sorted by usdmarketcap in descending order
+            n: If set, only the n largest companies of all results
+
+        Returns:
+            ScreenResult: The merged rows, sorted by usdmarketcap in descending order
+        """
+        results = [result if n is None else result.head(n) for result in results]
+        runs = []
+        offset = 0
+        for result in results:
+            runs.append(zip(result.columns["usdmarketcap"].tolist(), range(offset, offset + len(result)), strict=True))
+            offset += len(result)
+        merged = heapq.merge(*runs, key=itemgetter(0), reverse=True)
+        positions = np.fromiter((position for _, position in islice(merged, n)), dtype=np.int64)
+        return cls.concat(results).take(positions)
+
+    def __len__(self) -> int:
+        return len(self.columns["companyid"])
+
+    def __repr__(self) -> str:
+        return f"ScreenResult({len(self)} rows)"
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        """Get the values of a field, categorical fields are decoded."""
+        if field in CATEGORICAL_FIELDS:
+            return self.dictionaries[field][self.columns[field]]
+        return self.columns[field]
+
+    def code_of(self, field: str, value: Any) -> int | None:
+        """Get the code of a categorical value, None if no row has it."""
+        matches = np.flatnonzero(self.dictionaries[field] == value)
+        return int(matches[0]) if len(matches) else None
+
+    def take(self, indices: np.ndarray) -> ScreenResult:
+        """Get the rows at the given positions, in that order."""
+        return ScreenResult({field: column[indices] for field, column in self.columns.items()}, self.dictionaries)
+
+    def head(self, n: int) -> ScreenResult:
+        """Get the first n rows, without copying them."""
+        return ScreenResult({field: column[:n] for field, column in self.columns.items()}, self.dictionaries)
+
+    def where(self, mask: np.ndarray) -> ScreenResult:
+        """Get the rows where mask is True."""
+        return self.take(np.flatnonzero(mask))
+
+    def _descending_key(self, field: str) -> np.ndarray:
+        """Get a key of a field whose ascending order is the field's descending order."""
+        column = self.columns[field]
+        if field == "pricingdate":
+            return -column.view(np.int64)
+        return -column
+
+    def sort_desc(self, *fields: str, limit: int | None = None) -> ScreenResult:
+        """Sort in descending order, ties keep their order.
+
+        Args:
+            fields: The sort keys, the first one is the primary key
+            limit: If set, only the first limit rows, selected with argpartition
+                instead of sorting every row if there is a single key
+
+        Returns:
+            ScreenResult: The sorted rows
+        """
+        if limit is not None and limit <= 0:
+            return self.head(0)
+        if limit is not None and limit < len(self) and len(fields) == 1:
+            key = self._descending_key(fields[0])
+            top = np.argpartition(key, limit - 1)[:limit]
+            return self.take(top[np.argsort(key[top], kind="stable")])
+
+        # lexsort sorts by the last key first
+        order = np.lexsort([self._descending_key(field) for field in reversed(fields)])
+        return self.take(order if limit is None else order[:limit])
+
+    def top(self, n: int | None) -> ScreenResult:
+        """Get the n largest companies by usdmarketcap, all sorted if n is None."""
+        return self.sort_desc("usdmarketcap", limit=n)
+
+    def latest_per_company(self) -> ScreenResult:
+        """Keep the most recent row of every company, the rows keep their order."""
+        companyid = self.columns["companyid"]
+        # by company, then the latest pricing date first
+        order = np.lexsort((self._descending_key("pricingdate"), companyid))
+        sorted_ids = companyid[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = sorted_ids[1:] != sorted_ids[:-1]
+        return self.take(np.sort(order[first]))
+
+    def to_arrow(self) -> pa.Table:
+        """Convert to an Arrow table of arrow_schema(), the categorical fields stay dictionary encoded."""
+        arrays = []
+        for field in arrow_schema():
+            column = self.columns[field.name]
+            if field.name in CATEGORICAL_FIELDS:
+                arrays.append(pa.DictionaryArray.from_arrays(
+                    pa.array(column, type=pa.int32()), pa.array(self.dictionaries[field.name], type=pa.string())
+                ))
+            else:
+                # from_pandas: NaN is null
+                arrays.append(pa.array(column, type=field.type, from_pandas=True))
+        return pa.Table.from_arrays(arrays, schema=arrow_schema())
+
+    @classmethod
+    def from_arrow(cls, table: pa.Table) -> ScreenResult:
+        """Build a result from an Arrow table with the fields of a screen.
+
+        Numeric and date columns of other types (e.g. decimals or timestamps written
+        by earlier versions) are cast, plain string columns are dictionary encoded.
+
+        Args:
+            table: The table, e.g. read from a parquet or Arrow IPC file
+
+        Returns:
+            ScreenResult: The typed result
+        """
+        columns: Dict[str, np.ndarray] = {}
+        dictionaries: Dict[str, np.ndarray] = {}
+        for field in arrow_schema():
+            array = table.column(field.name).combine_chunks()
+            if field.name in CATEGORICAL_FIELDS:
+                if pa.types.is_dictionary(array.type):
+                    columns[field.name] = array.indices.to_numpy(zero_copy_only=False).astype(np.int32, copy=False)
+                    dictionaries[field.name] = _object_array(array.dictionary.to_pylist())
+                else:
+                    columns[field.name], dictionaries[field.name] = factorize(array.to_pylist())
+            elif field.name in STRING_FIELDS:
+                columns[field.name] = array.to_numpy(zero_copy_only=False)
+            elif field.name == "pricingdate":
+                columns[field.name] = array.cast(pa.date32()).to_numpy(zero_copy_only=False).astype("datetime64[D]")
+            else:
+                columns[field.name] = array.cast(field.type).to_numpy(zero_copy_only=False)
+        return cls(columns, dictionaries)
+
+    def to_pandas(self) -> pd.DataFrame:
+        """Convert to a dataframe with one column per field, categorical fields decoded."""
+        return pd.DataFrame({field: self[field] for field in FIELDS})
+
+    @classmethod
+    def from_pandas(cls, df: pd.DataFrame) -> ScreenResult:
+        """Build a result from a dataframe with (at least) the fields of a screen."""
+        return cls.from_columns({field: df[field].to_numpy() for field in FIELDS})
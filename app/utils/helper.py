@@ -1,14 +1,85 @@
 
+# market cap categories and their lower bound (in million USD)
+MKTCAP_CATEGORIES = {
+    "mega": 200e3, # 200 billion
+    "large": 10e3, # 10 billion
+    "mid": 2e3, # 2 billion
+}
+
+# named regions and the countries (iso alpha-2) they cover
+REGIONS = {
+    "EU": [
+        "AT", "BE", "BG", "HR", "CY", "CZ", "DK", "EE", "FI", "FR", "DE", "GR", "HU", "IE",
+        "IT", "LV", "LT", "LU", "MT", "NL", "PL", "PT", "RO", "SK", "SI", "ES", "SE",
+    ],
+    "EUROZONE": [
+        "AT", "BE", "HR", "CY", "EE", "FI", "FR", "DE", "GR", "IE",
+        "IT", "LV", "LT", "LU", "MT", "NL", "PT", "SK", "SI", "ES",
+    ],
+    "NORDICS": ["DK", "FI", "IS", "NO", "SE"],
+}
+
+
 def convert_mktcap_to_number(mktcap: str) -> float:
     """
     Convert mktcap from caategories to number
     """
-    if mktcap == "mega":
-        mktcap_thres = 200e3 # 200 billion
-    elif mktcap == "large":
-        mktcap_thres = 10e3 # 10 billion
-    elif mktcap == "mid":
-        mktcap_thres = 2e3 # 2 billion
-    else:
+    if mktcap not in MKTCAP_CATEGORIES:
         raise ValueError(f"Invalid market cap category: {mktcap}")
-    return mktcap_thres
\ No newline at end of file
+    return MKTCAP_CATEGORIES[mktcap]
+
+
+def resolve_countries(country: str) -> list[str]:
+    """
+    Get the countries of a screen, a country, "Global", a named region or a comma-separated list
+
+    Args:
+        country: e.g. "US", "Global", "EU" or "DE,FR,IT"
+
+    Returns:
+        list[str]: The countries to screen, "Global" stays a single screen of all countries
+
+    Raises:
+        ValueError: If a list holds something else than two letter country codes
+    """
+    if country in REGIONS:
+        return REGIONS[country]
+    if "," not in country:
+        return [country]
+
+    countries = list(dict.fromkeys(part.strip().upper() for part in country.split(",") if part.strip()))
+    invalid = [part for part in countries if not (len(part) == 2 and part.isalpha())]
+    if not countries or invalid:
+        raise ValueError(f"Invalid country list: {country}")
+    return countries
+
+
+def lowest_mktcap_threshold() -> float:
+    """
+    Get the threshold of the broadest market cap category, every category is a subset of it
+    """
+    return min(MKTCAP_CATEGORIES.values())
+
+
+def month_starts(start: str, end: str) -> list[str]:
+    """
+    Get the first day of every month between two months (both included)
+
+    Args:
+        start: The first month, formatted as YYYY-MM
+        end: The last month, formatted as YYYY-MM
+
+    Returns:
+        list[str]: The month starts, formatted as YYYY-MM-DD
+    """
+    start_year, start_month = (int(part) for part in start.split("-"))
+    end_year, end_month = (int(part) for part in end.split("-"))
+    if not (1 <= start_month <= 12 and 1 <= end_month <= 12):
+        raise ValueError(f"Invalid month range: {start} - {end}")
+
+    dates = []
+    year, month = start_year, start_month
+    while (year, month) <= (end_year, end_month):
+        dates.append(f"{year:04d}-{month:02d}-01")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return dates
@@ -0,0 +1,34 @@
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Stand-in for a module that is imported on the first attribute access.
+
+    Heavy libraries (pandas, numpy) are only needed once data is queried, modules
+    that import them lazily can be imported without paying for them, e.g. by the
+    scripts or when the app is built. Pair it with a TYPE_CHECKING import so the
+    annotations keep their types:
+
+        if TYPE_CHECKING:
+            import pandas as pd
+        else:
+            pd = LazyModule("pandas")
+    """
+
+    def __getattr__(self, name: str):
+        # the import system serializes concurrent first imports
+        module = importlib.import_module(self.__name__)
+        # later lookups find the attributes without going through __getattr__
+        self.__dict__.update(module.__dict__)
+        return getattr(module, name)
+
+
+def preload(*names: str) -> None:
+    """Import lazily imported modules ahead of their first use, e.g. at server startup.
+
+    Args:
+        names: Module names, e.g. "pandas"
+    """
+    for name in names:
+        importlib.import_module(name)
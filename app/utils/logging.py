@@ -1,33 +1,36 @@
-import json
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import random
 import sys
-import time
-from collections.abc import Callable
-from datetime import datetime
-from functools import wraps
-import asyncio
+import threading
+from datetime import datetime, timezone
+import orjson
 
 # Configure logging levels based on environment
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # Options: json, text
+# Format and write the records on a background thread, callers only enqueue them
+LOG_QUEUE = os.getenv("LOG_QUEUE", "true").lower() in ("1", "true", "yes")
+# Share of the sql statements logged by the database layer, and their max length
+LOG_QUERY_SAMPLE_RATE = float(os.getenv("LOG_QUERY_SAMPLE_RATE", "1.0"))
+LOG_QUERY_MAX_LENGTH = int(os.getenv("LOG_QUERY_MAX_LENGTH", "2000"))
 
-# Create logs directory if it doesn't exist
-os.makedirs("logs", exist_ok=True)
+# Logger of the sql statements, sampled and truncated
+QUERY_LOGGER_NAME = "app.database.queries"
 
 # Configure root logger
 root_logger = logging.getLogger()
 root_logger.setLevel(LOG_LEVEL)
 
-# Clear existing handlers to avoid duplication
-if root_logger.handlers:
-    root_logger.handlers.clear()
-
 # Custom JSON formatter
 class JsonFormatter(logging.Formatter):
     def format(self, record):
         log_record = {
-            "timestamp": datetime.utcnow().isoformat(),
+            # the time of the call, records may be formatted later on the logging thread
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).replace(tzinfo=None).isoformat(),
             "level": record.levelname,
             "message": record.getMessage(),
             "module": record.module,
@@ -43,128 +46,121 @@ class JsonFormatter(logging.Formatter):
         if hasattr(record, "extra"):
             log_record.update(record.extra)
 
-        return json.dumps(log_record)
-
-# Create console handler
-console_handler = logging.StreamHandler(sys.stdout)
-if LOG_FORMAT.lower() == "json":
-    console_handler.setFormatter(JsonFormatter())
-else:
-    console_handler.setFormatter(
-        logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    )
-root_logger.addHandler(console_handler)
-
-# Create file handler for all logs
-file_handler = logging.FileHandler(f"logs/thefunscreener_{datetime.now().strftime('%Y%m%d')}.log")
-if LOG_FORMAT.lower() == "json":
-    file_handler.setFormatter(JsonFormatter())
-else:
-    file_handler.setFormatter(
-        logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    )
-root_logger.addHandler(file_handler)
-
-# Create separate file handler for errors
-error_handler = logging.FileHandler(f"logs/thefunscreener_errors_{datetime.now().strftime('%Y%m%d')}.log")
-error_handler.setLevel(logging.ERROR)
-if LOG_FORMAT.lower() == "json":
-    error_handler.setFormatter(JsonFormatter())
-else:
-    error_handler.setFormatter(
-        logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    )
-root_logger.addHandler(error_handler)
+        return orjson.dumps(log_record, default=str).decode()
+
+
+class QueryLogFilter(logging.Filter):
+    """Sample and truncate high-volume records, warnings and errors always pass in full."""
+
+    def __init__(self, sample_rate: float = 1.0, max_length: int | None = None):
+        """
+        Args:
+            sample_rate: Share of the records that are kept, between 0 and 1
+            max_length: Messages longer than this are truncated, None keeps them whole
+        """
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.max_length = max_length
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        if self.max_length is not None:
+            message = record.getMessage()
+            if len(message) > self.max_length:
+                record.msg = message[:self.max_length] + "... [truncated]"
+                record.args = None
+        return True
+
+
+class MessageQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records for the logging thread without formatting them.
+
+    The message is merged with its arguments so it is final when it is enqueued,
+    the json formatting is left to the handlers on the logging thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class DeferredHandler(logging.Handler):
+    """Root handler until the first record is logged.
+
+    The first record creates the real handlers (see configure_logging) and is
+    passed on to them, so importing the app neither creates the logs directory
+    nor opens the log files.
+    """
+
+    def emit(self, record: logging.LogRecord) -> None:
+        configure_logging()
+        for handler in root_logger.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def make_formatter() -> logging.Formatter:
+    """Get the formatter of LOG_FORMAT."""
+    if LOG_FORMAT.lower() == "json":
+        return JsonFormatter()
+    return logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+_configure_lock = threading.Lock()
+
+
+def configure_logging() -> None:
+    """Create the log handlers of the root logger, only the first call has an effect.
+
+    Called by the first logged record or explicitly, e.g. at server startup.
+    """
+    with _configure_lock:
+        # the deferred handler is replaced once configured
+        if not any(isinstance(handler, DeferredHandler) for handler in root_logger.handlers):
+            return
+
+        # Create logs directory if it doesn't exist
+        os.makedirs("logs", exist_ok=True)
+
+        # Create console handler
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(make_formatter())
+
+        # Create file handler for all logs
+        file_handler = logging.FileHandler(f"logs/thefunscreener_{datetime.now().strftime('%Y%m%d')}.log")
+        file_handler.setFormatter(make_formatter())
+
+        # Create separate file handler for errors
+        error_handler = logging.FileHandler(f"logs/thefunscreener_errors_{datetime.now().strftime('%Y%m%d')}.log")
+        error_handler.setLevel(logging.ERROR)
+        error_handler.setFormatter(make_formatter())
+
+        handlers: list[logging.Handler] = [console_handler, file_handler, error_handler]
+        if LOG_QUEUE:
+            # the handlers run on the listener thread, the callers only put records on the queue
+            log_queue: queue.SimpleQueue = queue.SimpleQueue()
+            queue_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+            queue_listener.start()
+            # write the queued records before the interpreter exits
+            atexit.register(queue_listener.stop)
+            handlers = [MessageQueueHandler(log_queue)]
+
+        # a new list, the deferred handler may be iterating over the current one
+        root_logger.handlers = [h for h in root_logger.handlers if not isinstance(h, DeferredHandler)] + handlers
+
+
+# Clear existing handlers to avoid duplication
+root_logger.handlers = [DeferredHandler()]
+
+# Sql statements are long and logged on every query
+logging.getLogger(QUERY_LOGGER_NAME).addFilter(
+    QueryLogFilter(sample_rate=LOG_QUERY_SAMPLE_RATE, max_length=LOG_QUERY_MAX_LENGTH or None)
+)
 
 def get_logger(name: str) -> logging.Logger:
     """Get a logger with the specified name."""
     return logging.getLogger(name)
-
-def log_execution_time(func: Callable) -> Callable:
-    """Decorator to log function execution time."""
-    @wraps(func)
-    def sync_wrapper(*args, **kwargs):
-        logger = get_logger(func.__module__)
-        start_time = time.time()
-        logger.info(f"Starting {func.__name__}")
-        try:
-            result = func(*args, **kwargs)
-            execution_time = time.time() - start_time
-            logger.info(f"Completed {func.__name__} in {execution_time:.2f}s")
-            return result
-        except Exception as e:
-            execution_time = time.time() - start_time
-            logger.error(
-                f"Failed {func.__name__} after {execution_time:.2f}s",
-                exc_info=True,
-                extra={"error_type": type(e).__name__}
-            )
-            raise
-
-    @wraps(func)
-    async def async_wrapper(*args, **kwargs):
-        logger = get_logger(func.__module__)
-        start_time = time.time()
-        logger.info(f"Starting {func.__name__}")
-        try:
-            result = await func(*args, **kwargs)
-            execution_time = time.time() - start_time
-            logger.info(f"Completed {func.__name__} in {execution_time:.2f}s")
-            return result
-        except Exception as e:
-            execution_time = time.time() - start_time
-            logger.error(
-                f"Failed {func.__name__} after {execution_time:.2f}s",
-                exc_info=True,
-                extra={"error_type": type(e).__name__}
-            )
-            raise
-
-    # Return the appropriate wrapper based on whether the function is async or not
-    if asyncio.iscoroutinefunction(func):
-        return async_wrapper
-    else:
-        return sync_wrapper
-
-def log_api_call(func: Callable) -> Callable:
-    """Decorator to log API calls with request and response details."""
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        logger = get_logger(func.__module__)
-        start_time = time.time()
-
-        # Log request
-        logger.info(
-            f"API call to {func.__name__}",
-            extra={"request_params": str(kwargs)}
-        )
-
-        try:
-            result = func(*args, **kwargs)
-            execution_time = time.time() - start_time
-
-            # Log response (truncated if too large)
-            response_str = str(result)
-            if len(response_str) > 1000:
-                response_str = response_str[:1000] + "... [truncated]"
-
-            logger.info(
-                f"API response from {func.__name__}",
-                extra={
-                    "execution_time": f"{execution_time:.2f}s",
-                    "response": response_str
-                }
-            )
-            return result
-        except Exception as e:
-            execution_time = time.time() - start_time
-            logger.error(
-                f"API call to {func.__name__} failed",
-                exc_info=True,
-                extra={
-                    "execution_time": f"{execution_time:.2f}s",
-                    "error_type": type(e).__name__
-                }
-            )
-            raise
-    return wrapper
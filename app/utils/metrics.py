@@ -0,0 +1,250 @@
+# Request instrumentation
+# The layers time their stages with `with stage("db_fetch"):`, the times add up in
+# the context of the current request and the middleware turns them into
+# Prometheus histograms when the response is sent.
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+# Stages of a request, in the order they happen
+STAGES = ("auth", "db_wait", "db_fetch", "transform", "serialization")
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Row count buckets of a response
+ROW_BUCKETS = (0, 10, 100, 500, 1000, 5000, 10000, 50000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class RequestTimings:
+    """Stage durations and row count of one request."""
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+        self.rows: int | None = None
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        """Add time to a stage, stages can be entered several times per request."""
+        # database stages run on worker threads
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+
+_current: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+
+def start_request() -> RequestTimings:
+    """Start collecting the stage timings of the current request (context).
+
+    Returns:
+        RequestTimings: The timings of the request
+    """
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block as a stage of the current request, a no-op outside of requests.
+
+    Args:
+        name: The stage, one of STAGES
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def add_stage_time(name: str, seconds: float) -> None:
+    """Add an externally measured duration to a stage of the current request.
+
+    Args:
+        name: The stage, one of STAGES
+        seconds: The duration
+    """
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def record_rows(rows: int) -> None:
+    """Record the number of rows returned by the current request.
+
+    Args:
+        rows: Number of rows of the response
+    """
+    timings = _current.get()
+    if timings is not None:
+        timings.rows = (timings.rows or 0) + rows
+
+
+class Histogram:
+    """Prometheus histogram with fixed buckets, one series per label set."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Add an observation, callers hold the registry lock."""
+        key = tuple((name, labels[name]) for name in self.label_names)
+        # bucket counts (not cumulative), then +Inf, sum and count
+        series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 3))
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        """Render the histogram in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, float("inf")), series[:-2], strict=True):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{format_labels((*key, ('le', le)))} {cumulative:g}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{format_labels(key)} {series[-1]:g}")
+        return lines
+
+
+def format_labels(labels: Labels) -> str:
+    """Format label pairs as {name="value",...}."""
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+class MetricsRegistry:
+    """Request metrics of the server, rendered in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.request_duration = Histogram(
+            "thefunscreener_request_duration_seconds",
+            "Time from receiving a request until its response is sent.",
+            ("method", "route", "status"),
+            LATENCY_BUCKETS,
+        )
+        self.stage_duration = Histogram(
+            "thefunscreener_request_stage_duration_seconds",
+            "Time spent per stage of a request (auth, db_wait, db_fetch, transform, serialization).",
+            ("route", "stage"),
+            LATENCY_BUCKETS,
+        )
+        self.response_rows = Histogram(
+            "thefunscreener_response_rows",
+            "Number of rows (companies) of a response.",
+            ("route",),
+            ROW_BUCKETS,
+        )
+        self._collectors: List[Callable[[], Dict[str, Any]]] = []
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, timings: RequestTimings) -> None:
+        """Record a finished request.
+
+        Args:
+            method: HTTP method
+            route: Route template, e.g. /latest-market-cap/{country}/{mktcap}/{top_x}
+            status: HTTP status code
+            seconds: Duration of the request
+            timings: Stage timings and rows of the request
+        """
+        with self._lock:
+            self.request_duration.observe(seconds, method=method, route=route, status=str(status))
+            for name, stage_seconds in timings.stages.items():
+                self.stage_duration.observe(stage_seconds, route=route, stage=name)
+            if timings.rows is not None:
+                self.response_rows.observe(timings.rows, route=route)
+
+    def register_gauges(self, collector: Callable[[], Dict[str, Any]]) -> None:
+        """Expose the values returned by a callable as gauges on every scrape.
+
+        Args:
+            collector: Returns metric names (without prefix) to numeric values
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text format.
+
+        Returns:
+            str: The metrics page
+        """
+        with self._lock:
+            lines = [
+                "# HELP thefunscreener_requests_in_flight Requests being processed.",
+                "# TYPE thefunscreener_requests_in_flight gauge",
+                f"thefunscreener_requests_in_flight {self.in_flight}",
+            ]
+            for histogram in (self.request_duration, self.stage_duration, self.response_rows):
+                lines += histogram.render()
+
+        for collector in self._collectors:
+            for name, value in collector().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE thefunscreener_{name} gauge")
+                    lines.append(f"thefunscreener_{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the latency, stage timings and rows of every request.
+
+    The request is timed until the last body chunk is sent, so streamed responses
+    include their serialization.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = start_request()
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with self.registry._lock:
+            self.registry.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            with self.registry._lock:
+                self.registry.in_flight -= 1
+            # the router stores the matched route in the scope, unmatched paths share one label
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.registry.observe_request(scope["method"], route, status, time.perf_counter() - start, timings)
@@ -0,0 +1,120 @@
+"""Compare requests/sec of the blocking and the async market-cap path.
+
+The blocking path is what the routes did before the async backend: the coroutine
+calls the synchronous repository directly, so every request holds the event loop
+for the whole database round trip. The async path awaits the repository and lets
+concurrent requests overlap their database waits.
+
+By default the database is simulated by a fixed query latency, so the benchmark
+runs without access to CIQ. Use --live to run against the configured Postgres.
+
+    python -m benchmarks.bench_async_concurrency --requests 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+from typing import Tuple, List
+import pandas as pd
+from app.api.api_service import TheFunScreenerService
+from app.config.config import get_config
+from app.database import AsyncPostgresDatabase, BaseDatabase, PostgresDatabase
+from app.database.db_task_manager import TaskManagerRepository
+
+
+class SimulatedDatabase(BaseDatabase):
+    """Database answering every query with the same frame after a fixed delay."""
+
+    def __init__(self, latency: float, rows: int = 100):
+        self.latency = latency
+        self.frame = pd.DataFrame({
+            "companyid": range(rows),
+            "marketcap": [1e4 + i for i in range(rows)],
+            "pricingdate": pd.Timestamp("2025-05-02"),
+            "usdmarketcap": [1e4 + i for i in range(rows)],
+            "companyname": [f"Company {i}" for i in range(rows)],
+            "tickersymbol": [f"T{i}" for i in range(rows)],
+            "currency": "USD",
+            "exchange": "NasdaqGS",
+            "country": "US",
+        })
+
+    @contextmanager
+    def get_connection(self):
+        yield None
+
+    def query_all(self, query: str, params: Tuple = ()) -> List[Tuple]:
+        time.sleep(self.latency)
+        return self.frame
+
+
+def build_service(args: argparse.Namespace) -> TheFunScreenerService:
+    """Build the service on top of the simulated or the configured database."""
+    if args.live:
+        config = get_config()
+        database = PostgresDatabase(**config.database.db_config, **config.database.pool_config)
+        task_manager = TaskManagerRepository(database, AsyncPostgresDatabase(database))
+    else:
+        # without an async database the repository runs queries on worker threads
+        task_manager = TaskManagerRepository(SimulatedDatabase(args.latency))
+    return TheFunScreenerService(task_manager)
+
+
+async def run_blocking(service: TheFunScreenerService, country: str, mktcap: str) -> None:
+    """One request on the old path, blocking the event loop during the query."""
+    res = service.task_manager.query_global_market_cap(
+        asofdate=time.strftime("%Y-%m-%d"), mktcap_thres=10e3, country=country, allow_fuzzy=True
+    )
+    res.latest_per_company()
+
+
+async def run_async(service: TheFunScreenerService, country: str, mktcap: str) -> None:
+    """One request on the async path."""
+    await service.get_latest_market_cap(country, mktcap)
+
+
+async def measure(request, service: TheFunScreenerService, args: argparse.Namespace) -> float:
+    """Fire args.requests requests with at most args.concurrency in flight.
+
+    Returns:
+        float: Requests per second
+    """
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one():
+        async with semaphore:
+            await request(service, args.country, args.mktcap)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    return args.requests / (time.perf_counter() - start_time)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Total number of requests")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight at once")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated query latency in seconds")
+    parser.add_argument("--country", default="US")
+    parser.add_argument("--mktcap", default="large")
+    parser.add_argument("--live", action="store_true", help="Query the configured Postgres database")
+    parser.add_argument("--json", action="store_true", help="Print the results as json")
+    args = parser.parse_args()
+
+    service = build_service(args)
+    results = {
+        "blocking_rps": asyncio.run(measure(run_blocking, service, args)),
+        "async_rps": asyncio.run(measure(run_async, service, args)),
+    }
+    results["speedup"] = results["async_rps"] / results["blocking_rps"]
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for name, value in results.items():
+            print(f"{name:>14}: {value:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compare response building of a market-cap screen.
+
+The per-row path is what the service did before: iterate the frame with
+iterrows, validate one MarketCapEntry per row and let FastAPI encode the list.
+The vectorized path formats whole columns and writes the json with orjson.
+
+    python -m benchmarks.bench_serialization --rows 10000
+"""
+import argparse
+import json
+import timeit
+from datetime import date, timedelta
+from decimal import Decimal
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+from app.api.serialization import screen_to_json
+from app.models.marketcap import MarketCapEntry
+from app.models.screen_result import ScreenResult
+
+
+def make_screen(rows: int) -> pd.DataFrame:
+    """Build a screen shaped like the result of query_global_market_cap."""
+    return pd.DataFrame({
+        "companyid": range(rows),
+        "marketcap": [Decimal(f"{1e4 + i:.6f}") for i in range(rows)],
+        "pricingdate": [date(2025, 5, 2) - timedelta(days=i % 3) for i in range(rows)],
+        "usdmarketcap": [Decimal(f"{1e4 + i:.2f}") for i in range(rows)],
+        "companyname": [f"Company {i}" for i in range(rows)],
+        "tickersymbol": [f"T{i}" for i in range(rows)],
+        "currency": "USD",
+        "exchange": "NasdaqGS",
+        "country": "US",
+    })
+
+
+def per_row(res: pd.DataFrame) -> bytes:
+    """The previous response building."""
+    entries = [MarketCapEntry(
+        companyid=row["companyid"],
+        marketcap=row["marketcap"],
+        pricingdate=row["pricingdate"].strftime("%Y-%m-%d"),
+        usdmarketcap=row["usdmarketcap"],
+        companyname=row["companyname"],
+        tickersymbol=row["tickersymbol"],
+        currency=row["currency"],
+        exchange=row["exchange"],
+        country=row["country"]
+        ) for _, row in res.iterrows()]
+    return json.dumps(jsonable_encoder(entries)).encode("utf-8")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000, help="Rows in the screen")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions, the best one is reported")
+    parser.add_argument("--json", action="store_true", help="Print the results as json")
+    args = parser.parse_args()
+
+    screen = make_screen(args.rows)
+    # the repository returns the screen as typed columns
+    result = ScreenResult.from_pandas(screen)
+    assert json.loads(per_row(screen)) == json.loads(screen_to_json(result))
+
+    results = {
+        "rows": args.rows,
+        "per_row_ms": min(timeit.repeat(lambda: per_row(screen), number=1, repeat=args.repeat)) * 1000,
+        "vectorized_ms": min(timeit.repeat(lambda: screen_to_json(result), number=1, repeat=args.repeat)) * 1000,
+    }
+    results["speedup"] = results["per_row_ms"] / results["vectorized_ms"]
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for name, value in results.items():
+            print(f"{name:>14}: {value:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Measure the cold start of a worker process.
+
+Every measurement runs in a fresh interpreter, like a new worker after a
+scale-up or a graceful reload:
+
+    interpreter     python -c pass
+    import_database import app.database
+    import_app      import app.main
+    create_app      import app.main and build the app
+    lifespan        ... and run its startup (database check, cache warmer) and shutdown
+
+The cache warmer is disabled (WARMUP=false) so the lifespan only measures the
+startup itself. The database check uses the configured database (POSTGRES_*).
+
+    python -m benchmarks.bench_startup --repeat 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+# child processes write {"seconds": ..., "pandas": ...} of the stage they measure to a result file,
+# not to stdout where the log listener thread of the app writes as well
+STAGES = {
+    "interpreter": "pass",
+    "import_database": "import app.database",
+    "import_app": "import app.main",
+    "create_app": "import app.main; app.main.create_app()",
+    "lifespan": (
+        "import app.main\n"
+        "from fastapi.testclient import TestClient\n"
+        "with TestClient(app.main.create_app()):\n"
+        "    pass"
+    ),
+}
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+{code}
+seconds = time.perf_counter() - start
+with open({result!r}, "w") as f:
+    json.dump({{"seconds": seconds, "pandas": "pandas" in sys.modules}}, f)
+"""
+
+
+def run_stage(code: str) -> Dict[str, float]:
+    """Run code in a fresh interpreter.
+
+    Returns:
+        dict: Wall time of the process, time of the code and whether pandas was imported
+    """
+    env = {**os.environ, "WARMUP": "false"}
+    with tempfile.TemporaryDirectory() as tmp:
+        result = Path(tmp) / "startup.json"
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", CHILD.format(code=code, result=str(result))],
+            capture_output=True, text=True, check=True, env=env,
+        )
+        wall = time.perf_counter() - start
+        child = json.loads(result.read_text())
+    return {"wall": wall, "code": child["seconds"], "pandas": child["pandas"]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per stage")
+    parser.add_argument("--only", nargs="+", choices=list(STAGES), help="Stages to measure")
+    args = parser.parse_args()
+
+    for name in args.only or STAGES:
+        runs = [run_stage(STAGES[name]) for _ in range(args.repeat)]
+        wall = statistics.median(run["wall"] for run in runs) * 1000
+        code = statistics.median(run["code"] for run in runs) * 1000
+        pandas = "yes" if runs[-1]["pandas"] else "no"
+        print(f"{name:>16}: process {wall:8.1f} ms  code {code:8.1f} ms  pandas imported: {pandas}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Benchmark suite of the market-cap screens on a synthetic CIQ dataset.
+
+Measures the repository query, the in-memory post-processing, the response
+serialization and the end-to-end HTTP throughput of TheFunScreenerServer.app,
+and writes the results as json so they can be compared over time.
+
+By default the dataset is served by the in-memory stand-in. With --postgres the
+configured database (POSTGRES_*, use a scratch database) is loaded with the same
+dataset and queried instead.
+
+    python -m benchmarks.run_suite --companies 5000 --days 250 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+import httpx
+import numpy as np
+import pandas as pd
+from app.api.api import TheFunScreenerAPI
+from app.api.api_server import TheFunScreenerServer
+from app.api.api_service import TheFunScreenerService
+from app.api.auth import API_KEY_NAME, api_keys
+from app.api.serialization import ResponseFormat, render_screen
+from app.cache import MarketCapUniverse, SnapshotStore
+from app.config.config import get_config
+from app.database import AsyncPostgresDatabase, BaseDatabase, PostgresDatabase
+from app.database.db_task_manager import TaskManagerRepository
+from app.utils.helper import MKTCAP_CATEGORIES, lowest_mktcap_threshold
+from benchmarks.synthetic_ciq import SyntheticCIQDatabase, generate_ciq, load_postgres
+
+BENCH_API_KEY = "benchmark"
+
+# (country, category) screens of the query and http benchmarks
+SCREENS = [("US", "mega"), ("US", "mid"), ("JP", "large"), ("Global", "mid")]
+
+
+def timings(func: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Time a callable.
+
+    Args:
+        func: The code to time
+        repeat: Number of timed calls
+        warmup: Number of untimed calls before
+
+    Returns:
+        dict: Number of calls and the mean, median, p95 and min duration in ms
+    """
+    for _ in range(warmup):
+        func()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return summarize(durations)
+
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    """Summarize durations in ms."""
+    ordered = sorted(durations)
+    return {
+        "n": len(ordered),
+        "mean_ms": statistics.fmean(ordered),
+        "median_ms": statistics.median(ordered),
+        "p95_ms": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "min_ms": ordered[0],
+    }
+
+
+def bench_repository(task_manager: TaskManagerRepository, asofdate: str, repeat: int) -> List[Dict[str, Any]]:
+    """Time query_global_market_cap as the service calls it."""
+    results = []
+    for country, category in SCREENS:
+        thres = MKTCAP_CATEGORIES[category]
+        rows = len(task_manager.query_global_market_cap(asofdate, thres, country, allow_fuzzy=True, latest_only=True))
+        stats = timings(
+            partial(task_manager.query_global_market_cap, asofdate, thres, country, allow_fuzzy=True, latest_only=True),
+            repeat,
+        )
+        results.append({"name": "repository.query_global_market_cap", "params": {"country": country, "mktcap": category, "rows": rows}, **stats})
+    return results
+
+
+def bench_transform(task_manager: TaskManagerRepository, asofdate: str, repeat: int) -> List[Dict[str, Any]]:
+    """Time the in-memory processing of screens."""
+    thres = lowest_mktcap_threshold()
+    window = task_manager.query_global_market_cap(asofdate, thres, "Global", allow_fuzzy=True)
+    latest = task_manager.query_global_market_cap(asofdate, thres, "Global", allow_fuzzy=True, latest_only=True)
+    universe = MarketCapUniverse(latest)
+
+    def dedup():
+        window.latest_per_company().top(100)
+
+    return [
+        {"name": "transform.dedup_window", "params": {"rows": len(window)}, **timings(dedup, repeat)},
+        {"name": "transform.universe_build", "params": {"rows": len(latest)}, **timings(lambda: MarketCapUniverse(latest), repeat)},
+        {
+            "name": "transform.universe_select",
+            "params": {"rows": len(latest), "country": "US", "mktcap": "large", "top_x": 100},
+            **timings(lambda: universe.select("US", MKTCAP_CATEGORIES["large"], 100), repeat),
+        },
+    ]
+
+
+def bench_serialization(task_manager: TaskManagerRepository, asofdate: str, repeat: int) -> List[Dict[str, Any]]:
+    """Time rendering the response of a large screen in every format."""
+    screen = task_manager.query_global_market_cap(
+        asofdate, lowest_mktcap_threshold(), "Global", allow_fuzzy=True, latest_only=True
+    )
+    results = []
+    for response_format in ResponseFormat:
+        size = len(render_screen(screen, response_format).body)
+        stats = timings(partial(render_screen, screen, response_format), repeat)
+        results.append({"name": "serialization.render_screen", "params": {"format": response_format.value, "rows": len(screen), "bytes": size}, **stats})
+    return results
+
+
+async def bench_http(task_manager: TaskManagerRepository, asofdate: str, requests: int, concurrency: int) -> List[Dict[str, Any]]:
+    """Time requests through the full app, without and with the snapshot store of past screens.
+
+    The historical endpoint is used, the snapshot store only holds past screens.
+    """
+    year, month = int(asofdate[:4]), int(asofdate[5:7])
+    results = []
+    for stored in (False, True):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            snapshot_store = SnapshotStore(Path(snapshot_dir)) if stored else None
+            service = TheFunScreenerService(task_manager, snapshot_store)
+            server = TheFunScreenerServer()
+            server.add_routes(TheFunScreenerAPI(service).router)
+            transport = httpx.ASGITransport(app=server.app)  # type: ignore[arg-type]
+
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers={API_KEY_NAME: BENCH_API_KEY}) as client:
+                for country, category in SCREENS:
+                    url = f"/historical-market-cap/{country}/{category}/{year}/{month}/100"
+                    (await client.get(url)).raise_for_status()
+                    semaphore = asyncio.Semaphore(concurrency)
+                    durations: List[float] = []
+
+                    # bound to the screen of this iteration
+                    async def one(url: str = url, semaphore: asyncio.Semaphore = semaphore, durations: List[float] = durations):
+                        async with semaphore:
+                            start = time.perf_counter()
+                            res = await client.get(url)
+                            res.raise_for_status()
+                            durations.append((time.perf_counter() - start) * 1000)
+
+                    start = time.perf_counter()
+                    await asyncio.gather(*(one() for _ in range(requests)))
+                    elapsed = time.perf_counter() - start
+                    results.append({
+                        "name": "http.historical_market_cap",
+                        "params": {"country": country, "mktcap": category, "top_x": 100, "snapshot_store": stored, "concurrency": concurrency},
+                        "requests_per_s": requests / elapsed,
+                        **summarize(durations),
+                    })
+    return results
+
+
+def git_commit() -> str | None:
+    """Get the commit of the benchmarked code, if run from a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=5000, help="Number of synthetic companies")
+    parser.add_argument("--days", type=int, default=250, help="Number of synthetic trading days")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20, help="Timed calls per micro benchmark")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per http benchmark")
+    parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight at once")
+    parser.add_argument("--postgres", action="store_true", help="Load and query the configured Postgres (a scratch database)")
+    parser.add_argument("--only", nargs="+", choices=["repository", "transform", "serialization", "http"], help="Benchmarks to run")
+    parser.add_argument("--output", help="Write the results to this json file")
+    args = parser.parse_args()
+
+    tables = generate_ciq(args.companies, args.days, seed=args.seed)
+    database: BaseDatabase
+    if args.postgres:
+        config = get_config()
+        postgres = PostgresDatabase(**config.database.db_config, **config.database.pool_config)
+        load_postgres(postgres, tables)
+        database = postgres
+        task_manager = TaskManagerRepository(database, AsyncPostgresDatabase(postgres))
+    else:
+        database = SyntheticCIQDatabase(tables)
+        task_manager = TaskManagerRepository(database)
+
+    # screen the last trading day
+    asofdate = str(tables["ciqmarketcap"]["pricingdate"].max())
+    api_keys.reload([BENCH_API_KEY])
+
+    only = set(args.only or ["repository", "transform", "serialization", "http"])
+    results: List[Dict[str, Any]] = []
+    if "repository" in only:
+        results += bench_repository(task_manager, asofdate, args.repeat)
+    if "transform" in only:
+        results += bench_transform(task_manager, asofdate, args.repeat)
+    if "serialization" in only:
+        results += bench_serialization(task_manager, asofdate, args.repeat)
+    if "http" in only:
+        results += asyncio.run(bench_http(task_manager, asofdate, args.requests, args.concurrency))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "database": "postgres" if args.postgres else "in-memory",
+            "companies": args.companies,
+            "days": args.days,
+            "seed": args.seed,
+            "asofdate": asofdate,
+        },
+        "results": results,
+    }
+
+    for result in results:
+        params = ", ".join(f"{k}={v}" for k, v in result["params"].items())
+        rate = f" {result['requests_per_s']:8.1f} req/s" if "requests_per_s" in result else ""
+        print(f"{result['name']:<36} {params:<64} median {result['median_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms{rate}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""Synthetic CIQ-shaped dataset for benchmarks.
+
+Generates the tables read by query_global_market_cap (ciqmarketcap, ciqcompany,
+ciqsecurity, ciqtradingitem, ciqexchangerate, ciqcurrency, ciqexchange,
+ciqcountrygeo) at a configurable scale of companies x trading days. The data can
+be loaded into a local Postgres, or served by SyntheticCIQDatabase, an in-memory
+stand-in answering the market-cap queries with pandas.
+
+    python -m benchmarks.synthetic_ciq --companies 5000 --days 250 --load
+"""
+import argparse
+import io
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Any, Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from app.config.config import get_config
+from app.database import BaseDatabase, PostgresDatabase
+
+# countryid, isocountry2, currencyid, isocode, local currency per usd, exchanges, share of companies
+COUNTRIES: List[Tuple[int, str, int, str, float, List[Tuple[int, str]], float]] = [
+    (213, "US", 160, "USD", 1.0, [(458, "NasdaqGS"), (106, "NYSE")], 0.40),
+    (107, "JP", 85, "JPY", 150.0, [(1076, "TSE")], 0.15),
+    (30, "CN", 23, "CNY", 7.2, [(1115, "SHSE"), (1190, "SZSE")], 0.12),
+    (76, "GB", 134, "GBP", 0.79, [(1052, "LSE")], 0.07),
+    (33, "CA", 19, "CAD", 1.36, [(1083, "TSX")], 0.07),
+    (61, "DE", 5, "EUR", 0.92, [(1111, "XTRA")], 0.06),
+    (40, "CH", 21, "CHF", 0.9, [(1133, "SWX")], 0.04),
+    (97, "IN", 73, "INR", 83.0, [(1128, "NSEI")], 0.09),
+]
+
+SCHEMA = """
+    DROP TABLE IF EXISTS ciqmarketcap, ciqcompany, ciqsecurity, ciqtradingitem,
+        ciqexchangerate, ciqcurrency, ciqexchange, ciqcountrygeo, ciq_synthetic;
+    CREATE TABLE ciqcountrygeo (countryid int PRIMARY KEY, isocountry2 text);
+    CREATE TABLE ciqcurrency (currencyid int PRIMARY KEY, isocode text);
+    CREATE TABLE ciqexchange (exchangeid int PRIMARY KEY, exchangesymbol text);
+    CREATE TABLE ciqcompany (companyid bigint PRIMARY KEY, companyname text, countryid int, companytypeid int);
+    CREATE TABLE ciqsecurity (securityid bigint PRIMARY KEY, companyid bigint, primaryflag int);
+    CREATE TABLE ciqtradingitem (
+        tradingitemid bigint PRIMARY KEY, securityid bigint, tickersymbol text,
+        currencyid int, exchangeid int, primaryflag int
+    );
+    CREATE TABLE ciqexchangerate (currencyid int, pricedate date, priceclose numeric, latestsnapflag int);
+    CREATE TABLE ciqmarketcap (companyid bigint, pricingdate date, marketcap numeric);
+    -- marks the ciq tables as synthetic, so they may be replaced
+    CREATE TABLE ciq_synthetic (companies int, days int, start date);
+"""
+
+INDEXES = """
+    CREATE INDEX ON ciqmarketcap (pricingdate, companyid);
+    CREATE INDEX ON ciqexchangerate (currencyid, pricedate);
+    CREATE INDEX ON ciqsecurity (companyid);
+    CREATE INDEX ON ciqtradingitem (securityid);
+"""
+
+
+def generate_ciq(companies: int, days: int, start: date = date(2024, 1, 1), seed: int = 0) -> Dict[str, pd.DataFrame]:
+    """Generate the CIQ tables of the market-cap screens.
+
+    Company sizes are log-normally distributed (a few trillion dollar companies, a
+    long tail of small caps) and follow a random walk, like the exchange rates. Some
+    companies are of other company types, have secondary securities or listings, or
+    miss a few pricing dates, so every condition of the screens filters something.
+
+    Args:
+        companies: Number of companies
+        days: Number of trading days (weekdays) starting at start
+        start: First trading day
+        seed: Seed of the random generator
+
+    Returns:
+        dict: Table name to its rows
+    """
+    rng = np.random.default_rng(seed)
+    trading_days = pd.bdate_range(start, periods=days)
+    calendar = pd.date_range(trading_days[0], trading_days[-1])
+
+    countrygeo = pd.DataFrame([(c[0], c[1]) for c in COUNTRIES], columns=["countryid", "isocountry2"])
+    currency = pd.DataFrame([(c[2], c[3]) for c in COUNTRIES], columns=["currencyid", "isocode"])
+    exchange = pd.DataFrame(
+        [exchange for c in COUNTRIES for exchange in c[5]], columns=["exchangeid", "exchangesymbol"]
+    )
+
+    # companies
+    companyid = np.arange(1, companies + 1) * 7 + 10_000
+    country_index = rng.choice(len(COUNTRIES), size=companies, p=[c[6] for c in COUNTRIES])
+    company = pd.DataFrame({
+        "companyid": companyid,
+        "companyname": [f"Synthetic Company {i}" for i in range(companies)],
+        "countryid": [COUNTRIES[i][0] for i in country_index],
+        "companytypeid": rng.choice([4, 5, 1, 9], size=companies, p=[0.6, 0.3, 0.05, 0.05]),
+    })
+
+    # one primary security per company, some have a secondary one
+    secondary = rng.random(companies) < 0.2
+    security = pd.concat([
+        pd.DataFrame({"securityid": companyid * 10 + 1, "companyid": companyid, "primaryflag": 1}),
+        pd.DataFrame({"securityid": companyid[secondary] * 10 + 2, "companyid": companyid[secondary], "primaryflag": 0}),
+    ], ignore_index=True)
+
+    # one primary listing per security on a home exchange, some also trade in USD in the US
+    home_exchange = [COUNTRIES[i][5][rng.integers(len(COUNTRIES[i][5]))][0] for i in country_index]
+    home_currency = np.array([COUNTRIES[i][2] for i in country_index])
+    listings = [pd.DataFrame({
+        "tradingitemid": security["securityid"] * 10 + 1,
+        "securityid": security["securityid"],
+        "tickersymbol": [f"S{sid}" for sid in security["securityid"]],
+        "currencyid": np.concatenate([home_currency, home_currency[secondary]]),
+        "exchangeid": np.concatenate([home_exchange, np.array(home_exchange)[secondary]]),
+        "primaryflag": 1,
+    })]
+    otc = security["securityid"][(security["primaryflag"] == 1) & (rng.random(len(security)) < 0.1)]
+    listings.append(pd.DataFrame({
+        "tradingitemid": otc * 10 + 2, "securityid": otc, "tickersymbol": [f"O{sid}" for sid in otc],
+        "currencyid": 160, "exchangeid": 458, "primaryflag": 0,
+    }))
+    tradingitem = pd.concat(listings, ignore_index=True)
+
+    # daily exchange rates (local currency per usd), also on weekends
+    rates = []
+    for c in COUNTRIES:
+        walk = 1.0 if c[3] == "USD" else np.exp(np.cumsum(rng.normal(0, 0.004, len(calendar))))
+        rates.append(pd.DataFrame({
+            "currencyid": c[2], "pricedate": calendar.date, "priceclose": np.round(c[4] * walk, 6), "latestsnapflag": 1,
+        }))
+    exchangerate = pd.concat(rates, ignore_index=True)
+
+    # market caps in millions of local currency
+    base_usd = np.clip(rng.lognormal(np.log(800), 1.9, companies), 5, 3.5e6)
+    walk = np.exp(np.cumsum(rng.normal(0.0002, 0.018, (companies, days)), axis=1))
+    fx = (
+        exchangerate.assign(pricedate=pd.to_datetime(exchangerate["pricedate"]))
+        .pivot(index="currencyid", columns="pricedate", values="priceclose")
+        .loc[:, trading_days]
+    )
+    local = base_usd[:, None] * walk * fx.loc[home_currency].to_numpy()
+    marketcap = pd.DataFrame({
+        "companyid": np.repeat(companyid, days),
+        "pricingdate": np.tile(trading_days.date, companies),
+        "marketcap": np.round(local.ravel(), 6),
+    })
+    # some pricing dates are missing
+    marketcap = marketcap[rng.random(len(marketcap)) >= 0.02].reset_index(drop=True)
+
+    return {
+        "ciqcountrygeo": countrygeo,
+        "ciqcurrency": currency,
+        "ciqexchange": exchange,
+        "ciqcompany": company,
+        "ciqsecurity": security,
+        "ciqtradingitem": tradingitem,
+        "ciqexchangerate": exchangerate,
+        "ciqmarketcap": marketcap,
+    }
+
+
+def load_postgres(database: PostgresDatabase, tables: Dict[str, pd.DataFrame], force: bool = False) -> None:
+    """Replace the CIQ tables of a database by synthetic ones.
+
+    Only databases without CIQ tables, or with synthetic ones, are overwritten.
+
+    Args:
+        database: The (scratch) database to load
+        tables: Tables from generate_ciq
+        force: Replace existing CIQ tables that are not synthetic
+
+    Raises:
+        RuntimeError: If the database holds real CIQ tables and force is False
+    """
+    with database.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('ciqmarketcap') IS NOT NULL, to_regclass('ciq_synthetic') IS NOT NULL")
+            has_ciq, is_synthetic = cur.fetchone()
+            if has_ciq and not is_synthetic and not force:
+                raise RuntimeError("The database holds CIQ tables that are not synthetic, use a scratch database")
+
+            cur.execute(SCHEMA)
+            for name, df in tables.items():
+                buffer = io.StringIO()
+                df.to_csv(buffer, index=False, header=False)
+                buffer.seek(0)
+                cur.copy_expert(f"COPY {name} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cur.execute(INDEXES)
+            marketcap = tables["ciqmarketcap"]
+            cur.execute(
+                "INSERT INTO ciq_synthetic VALUES (%s, %s, %s)",
+                (len(tables["ciqcompany"]), marketcap["pricingdate"].nunique(), marketcap["pricingdate"].min()),
+            )
+        conn.commit()
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+        conn.commit()
+
+
+class SyntheticCIQDatabase(BaseDatabase):
+    """In-memory stand-in for a CIQ database, answering the market-cap screens with pandas.
+
+    The screen is recognized from the sql of TaskManagerRepository (exact/fuzzy date,
+    country/Global, latest only), the parameters are applied like Postgres would.
+    Values are floats instead of Decimals.
+    """
+
+    def __init__(self, tables: Dict[str, pd.DataFrame]):
+        """Pre-join the static tables, the screens only filter and convert.
+
+        Args:
+            tables: Tables from generate_ciq
+        """
+        self.tables = tables
+        company = tables["ciqcompany"]
+        company = company[company["companytypeid"].isin([4, 5])]
+        security = tables["ciqsecurity"].query("primaryflag == 1")
+        tradingitem = tables["ciqtradingitem"].query("primaryflag == 1")
+        listing = (
+            company.merge(security[["securityid", "companyid"]], on="companyid")
+            .merge(tradingitem[["securityid", "tickersymbol", "currencyid", "exchangeid"]], on="securityid")
+            .merge(tables["ciqcurrency"].rename(columns={"isocode": "currency"}), on="currencyid")
+            .merge(tables["ciqexchange"].rename(columns={"exchangesymbol": "exchange"}), on="exchangeid")
+            .merge(tables["ciqcountrygeo"].rename(columns={"isocountry2": "country"}), on="countryid")
+        )
+        marketcap = tables["ciqmarketcap"].assign(pricingdate=lambda df: pd.to_datetime(df["pricingdate"]))
+        self.daily = (
+            marketcap.merge(listing, on="companyid")
+            .sort_values("pricingdate", kind="stable")
+            .reset_index(drop=True)
+        )
+        self.pricingdates = self.daily["pricingdate"].to_numpy()
+        rates = tables["ciqexchangerate"].query("latestsnapflag == 1")
+        self.rates = rates.assign(pricedate=pd.to_datetime(rates["pricedate"])).set_index(["pricedate", "currencyid"])["priceclose"]
+
+    @contextmanager
+    def get_connection(self):
+        yield None
+
+    def query_all(self, query: str, params: Tuple | Dict[str, Any] = ()) -> List[Tuple]:
+        if isinstance(params, dict) and "asofdate" in params:
+            return self._screen(query, params)
+        if "FROM ciqexchangerate" in query:
+            rates = self.rates.reset_index()
+            between = rates["pricedate"].between(pd.Timestamp(params["first"]), pd.Timestamp(params["last"]))
+            return rates[between].assign(pricedate=lambda df: df["pricedate"].dt.date)
+        if "ciqcompany" in query:
+            return self.tables["ciqcompany"].head(10)
+        if "max(pricingdate)" in query:
+            return pd.DataFrame({"pricingdate": [self.pricingdates[-1]]})
+        raise NotImplementedError(f"{type(self).__name__} only answers the market-cap screens")
+
+    def _screen(self, query: str, params: Dict[str, Any]) -> pd.DataFrame:
+        """Evaluate a market-cap screen of TaskManagerRepository."""
+        latest_only = "DISTINCT ON" in query
+        allow_fuzzy = "BETWEEN" in query
+        all_countries = "%(country)s" not in query
+
+        asofdate = pd.Timestamp(params["asofdate"])
+        first = asofdate - timedelta(days=3) if allow_fuzzy else asofdate
+        lo = np.searchsorted(self.pricingdates, first.to_datetime64(), side="left")
+        hi = np.searchsorted(self.pricingdates, asofdate.to_datetime64(), side="right")
+        rows = self.daily.iloc[lo:hi]
+        if not all_countries:
+            rows = rows[rows["country"] == params["country"]]
+
+        # the usd conversion uses the rates of each pricing date
+        priceclose = self.rates.reindex(pd.MultiIndex.from_arrays([rows["pricingdate"], rows["currencyid"]])).to_numpy()
+        if "local_thres" in params:
+            # local currency screen, converted by the repository (see FxRates)
+            rows = rows[rows["marketcap"].to_numpy() >= priceclose * float(params["mktcap_thres"])]
+            if latest_only:
+                rows = rows.sort_values(["companyid", "pricingdate"], ascending=[True, False]).drop_duplicates("companyid")
+            columns = ["companyid", "marketcap", "pricingdate", "currencyid", "companyname",
+                       "tickersymbol", "currency", "exchange", "country"]
+            res = rows[columns].reset_index(drop=True)
+            res["pricingdate"] = res["pricingdate"].dt.date
+            return res
+
+        usd = rows["marketcap"] / priceclose
+        rows = rows.assign(usdmarketcap=usd.round(2))[usd >= float(params["mktcap_thres"])]
+
+        if latest_only:
+            rows = rows.sort_values(["companyid", "pricingdate"], ascending=[True, False]).drop_duplicates("companyid")
+            rows = rows.sort_values("usdmarketcap", ascending=False)
+        else:
+            rows = rows.sort_values(["pricingdate", "usdmarketcap"], ascending=False)
+        if params.get("limit") is not None:
+            rows = rows.head(params["limit"])
+
+        columns = ["companyid", "marketcap", "pricingdate", "usdmarketcap", "companyname",
+                   "tickersymbol", "currency", "exchange", "country"]
+        res = rows[columns].reset_index(drop=True)
+        res["pricingdate"] = res["pricingdate"].dt.date
+        return res
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=5000, help="Number of companies")
+    parser.add_argument("--days", type=int, default=250, help="Number of trading days")
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2024, 1, 1), help="First trading day")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--load", action="store_true", help="Load the tables into the configured Postgres (POSTGRES_*)")
+    parser.add_argument("--force", action="store_true", help="Replace CIQ tables that are not synthetic")
+    args = parser.parse_args()
+
+    tables = generate_ciq(args.companies, args.days, args.start, args.seed)
+    for name, df in tables.items():
+        print(f"{name:>16}: {len(df):>10} rows")
+
+    if args.load:
+        config = get_config()
+        load_postgres(PostgresDatabase(**config.database.db_config), tables, force=args.force)
+        print(f"Loaded into {config.database.db_config['dbname']}@{config.database.db_config['host']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,14 @@
 from app.database.db_task_manager import TaskManagerRepository
 from app.database.postgres_database import PostgresDatabase
-from app.config.config import Config
+from app.config.config import get_config
 
-config = Config().load_configuration()
+config = get_config()
 
 postgresdb = PostgresDatabase(**config.database.db_config)
 task_manager = TaskManagerRepository(postgresdb)
 
 res = task_manager.query_global_market_cap(asofdate="2025-05-03", mktcap_thres=10e3, country="US", allow_fuzzy=True)
-print(res)
+print(res.to_pandas())
 
 # mega cap 200b
 # large cap 10b
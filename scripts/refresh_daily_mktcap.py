@@ -0,0 +1,24 @@
+# Maintain the pre-joined screener_daily_mktcap table read by the screens
+# when SUMMARY_TABLE=true, run it after every daily data load:
+#   python scripts/refresh_daily_mktcap.py                  # new pricing dates only
+#   python scripts/refresh_daily_mktcap.py --since 2020-01-01  # backfill or reload
+import argparse
+from datetime import date
+from app.database.daily_market_cap import DailyMarketCapTable
+from app.database.postgres_database import PostgresDatabase
+from app.config.config import get_config
+
+parser = argparse.ArgumentParser(description="Refresh the screener_daily_mktcap table")
+parser.add_argument("--since", type=date.fromisoformat, help="First pricing date to load, YYYY-MM-DD")
+parser.add_argument("--until", type=date.fromisoformat, help="Last pricing date to load, YYYY-MM-DD")
+parser.add_argument("--days-per-batch", type=int, default=31, help="Pricing dates loaded per transaction")
+args = parser.parse_args()
+
+config = get_config()
+
+postgresdb = PostgresDatabase(**config.database.db_config)
+table = DailyMarketCapTable(postgresdb)
+
+table.create()
+rows = table.refresh(since=args.since, until=args.until, days_per_batch=args.days_per_batch)
+print(f"Loaded {rows} rows, latest pricing date {table.latest_pricingdate()}")
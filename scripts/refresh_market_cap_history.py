@@ -0,0 +1,25 @@
+# Maintain the memory-mapped market cap history served by /company/{companyid}/market-cap,
+# run it after every daily data load:
+#   python scripts/refresh_market_cap_history.py             # new pricing dates only
+#   python scripts/refresh_market_cap_history.py --rebuild   # build from scratch
+# The running servers pick up the new version on their next request.
+import argparse
+from datetime import date
+from app.cache import MarketCapHistoryStore
+from app.database.postgres_database import PostgresDatabase
+from app.config.config import get_config
+
+parser = argparse.ArgumentParser(description="Append the new pricing dates to the market cap history store")
+parser.add_argument("--since", type=date.fromisoformat, help="First pricing date to load, YYYY-MM-DD")
+parser.add_argument("--until", type=date.fromisoformat, help="Last pricing date to load, YYYY-MM-DD")
+parser.add_argument("--rebuild", action="store_true", help="Build the store from scratch")
+parser.add_argument("--chunk-size", type=int, default=100_000, help="Rows read from the database at a time")
+args = parser.parse_args()
+
+config = get_config()
+
+postgresdb = PostgresDatabase(**config.database.db_config)
+store = MarketCapHistoryStore(config.cache.history_dir or config.paths.full_input_dir / "history")
+
+rows = store.ingest(postgresdb, since=args.since, until=args.until, rebuild=args.rebuild, chunk_size=args.chunk_size)
+print(f"Added {rows} rows, {len(store)} rows until {store.until}")
@@ -0,0 +1,36 @@
+# Warm the screen cache of a running api server, e.g. at the end of the nightly data load:
+#   python scripts/warm_cache.py --url http://localhost:8033 --wait
+import argparse
+import sys
+import time
+import requests
+from app.api.auth import API_KEY_NAME
+from app.config.config import get_config
+
+parser = argparse.ArgumentParser(description="Precompute the latest screens of a running TheFunScreener API")
+parser.add_argument("--url", default="http://localhost:8033", help="Base url of the api server")
+parser.add_argument("--wait", action="store_true", help="Wait until the warm-up finished")
+parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for the warm-up")
+args = parser.parse_args()
+
+config = get_config()
+headers = {API_KEY_NAME: config.api_key}
+
+res = requests.post(f"{args.url}/warmup", headers=headers, timeout=30)
+res.raise_for_status()
+body = res.json()
+print(f"Warm-up {'started' if body['started'] else 'already running'}")
+
+if not args.wait:
+    sys.exit(0)
+
+deadline = time.monotonic() + args.timeout
+while time.monotonic() < deadline:
+    warmup = requests.get(f"{args.url}/health", headers=headers, timeout=30).json()["warmup"]
+    print(f"{warmup['state']}: {warmup['warmed']}/{warmup['total']} warmed, {warmup['failed']} failed")
+    if warmup["state"] in ("done", "failed"):
+        sys.exit(1 if warmup["state"] == "failed" else 0)
+    time.sleep(2)
+
+print("Timed out waiting for the warm-up")
+sys.exit(1)
@@ -1,22 +1,135 @@
+import asyncio
 import os
 import sys
+from collections.abc import Callable
+from datetime import date
+from decimal import Decimal
 import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Now imports from both app and database modules should work
+from app.api.api import TheFunScreenerAPI
+from app.api.api_service import TheFunScreenerService
+from app.api.auth import API_KEY_NAME, api_keys
 from app.database.db_task_manager import TaskManagerRepository
 from app.database.postgres_database import PostgresDatabase
-from app.config.config import Config
+from app.config.config import get_config
+from app.models.screen_result import ScreenResult
+
+# two listings with the value types psycopg2 returns (decimals and dates)
+DEFAULT_SCREEN = {
+    "companyid": [21835, 24937],
+    "marketcap": [Decimal("3235237.693557"), Decimal("3067071.869100")],
+    "pricingdate": [date(2025, 5, 3), date(2025, 5, 2)],
+    "usdmarketcap": [Decimal("3235237.69"), Decimal("3067071.87")],
+    "companyname": ["Microsoft Corporation", "Apple Inc."],
+    "tickersymbol": ["MSFT", "AAPL"],
+    "currency": ["USD", "USD"],
+    "exchange": ["NasdaqGS", "NasdaqGS"],
+    "country": ["US", "US"],
+}
+
+
+def build_screen(**columns) -> ScreenResult:
+    """Build a screen from the given columns, the other fields get a default per row.
+
+    Without columns it is DEFAULT_SCREEN. Company n is "Company n" with ticker "Tn",
+    marketcap and usdmarketcap default to each other, listed in the US on 2024-05-02.
+    """
+    if not columns:
+        return ScreenResult.from_columns(DEFAULT_SCREEN)
+
+    n = len(next(iter(columns.values())))
+    ids = columns.get("companyid", list(range(1, n + 1)))
+    caps = columns.get("usdmarketcap", columns.get("marketcap", [1000.0] * n))
+    defaults = {
+        "companyid": ids,
+        "marketcap": caps,
+        "pricingdate": [date(2024, 5, 2)] * n,
+        "usdmarketcap": caps,
+        "companyname": [f"Company {companyid}" for companyid in ids],
+        "tickersymbol": [f"T{companyid}" for companyid in ids],
+        "currency": ["USD"] * n,
+        "exchange": ["NYSE"] * n,
+        "country": ["US"] * n,
+    }
+    return ScreenResult.from_columns({**defaults, **columns})
+
+
+@pytest.fixture
+def make_screen():
+    """Factory of screens, see build_screen."""
+    return build_screen
+
 
 @pytest.fixture
 def task_manager():
     """Create a TaskManagerRepository instance with test database."""
-    config = Config().load_configuration()
+    config = get_config()
     # Create database
     db = PostgresDatabase(**config.database.db_config)
 
     # Create task manager with schema
     manager = TaskManagerRepository(db)
     yield manager
+
+
+class FakeRepository:
+    """Repository answering the screens from memory, records the queries.
+
+    caps(asofdate, country) gives the usdmarketcap by company id of a screen, the
+    screen is sorted and limited like the database does it and priced at the data
+    version. delay keeps every query running for a while, e.g. to count the
+    concurrent ones.
+    """
+
+    def __init__(self):
+        self.version = date(2024, 5, 2)
+        self.caps: Callable[[str, str], dict[int, float]] = lambda asofdate, country: {1: 20000.0}
+        self.delay = 0.0
+        self.queries: list[tuple[str, str]] = []
+        self.running = 0
+        self.max_running = 0
+
+    async def query_latest_pricingdate_async(self):
+        return self.version
+
+    async def query_global_market_cap_async(self, asofdate, mktcap_thres, country, **options):
+        self.queries.append((asofdate, country))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+
+        caps = self.caps(asofdate, country)
+        ids = sorted(caps, key=caps.__getitem__, reverse=True)[: options["limit"]]
+        return build_screen(
+            companyid=ids,
+            usdmarketcap=[caps[companyid] for companyid in ids],
+            pricingdate=[self.version] * len(ids),
+            country=[country] * len(ids),
+        )
+
+
+@pytest.fixture
+def repository() -> FakeRepository:
+    return FakeRepository()
+
+
+@pytest.fixture
+def make_client():
+    """Factory of clients of the api of a service, authenticated with a valid key."""
+
+    def make(service: TheFunScreenerService) -> TestClient:
+        app = FastAPI()
+        app.include_router(TheFunScreenerAPI(service).router)
+        api_keys.reload(["key"])
+        return TestClient(app, headers={API_KEY_NAME: "key"})
+
+    return make
@@ -0,0 +1,49 @@
+import asyncio
+import os
+import signal
+import pytest
+from fastapi import HTTPException
+from app.api import auth
+from app.api.auth import ApiKeys, get_api_key, install_reload_handler
+
+
+def test_api_keys_accepts_every_configured_key():
+    keys = ApiKeys(lambda: ["old-key", "new-key"])
+    assert keys.is_valid("old-key")
+    assert keys.is_valid("new-key")
+    assert not keys.is_valid("other-key")
+    assert not keys.is_valid("new-ke")
+    assert not keys.is_valid("ключ")
+
+
+def test_api_keys_are_loaded_once_and_reloaded_on_sighup():
+    loaded = [["first"]]
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return loaded[-1]
+
+    keys = ApiKeys(loader)
+    assert keys.is_valid("first") and keys.is_valid("first")
+    assert len(calls) == 1
+
+    previous = signal.getsignal(signal.SIGHUP)
+    try:
+        install_reload_handler(keys)
+        loaded.append(["second"])
+        os.kill(os.getpid(), signal.SIGHUP)
+    finally:
+        signal.signal(signal.SIGHUP, previous)
+
+    assert not keys.is_valid("first")
+    assert keys.is_valid("second")
+    assert len(calls) == 2
+
+
+def test_get_api_key_rejects_invalid_keys(monkeypatch):
+    monkeypatch.setattr(auth, "api_keys", ApiKeys(lambda: ["secret"]))
+    assert asyncio.run(get_api_key("secret")) == "secret"
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(get_api_key("guess"))
+    assert e.value.status_code == 401
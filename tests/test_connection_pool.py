@@ -0,0 +1,81 @@
+import pytest
+from psycopg2 import extensions
+from app.database import connection_pool
+from app.database.connection_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+    """Minimal stand-in for a psycopg2 connection."""
+
+    class _Info:
+        transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def __init__(self):
+        self.closed = 0
+        self.info = self._Info()
+        self.healthy = True
+
+    def cursor(self):
+        conn = self
+
+        class _Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+            def execute(self, query):
+                if not conn.healthy:
+                    raise RuntimeError("server closed the connection unexpectedly")
+
+        return _Cursor()
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Record every connection opened by the pool."""
+    opened = []
+
+    def connect(**kwargs):
+        conn = FakeConnection()
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(connection_pool.psycopg2, "connect", connect)
+    return opened
+
+
+def test_pool_reuses_connections(connections):
+    pool = ConnectionPool({}, minconn=1, maxconn=2)
+    for _ in range(5):
+        conn = pool.getconn()
+        pool.putconn(conn)
+    assert len(connections) == 1
+    assert pool.idle == 1
+
+
+def test_pool_replaces_unhealthy_and_stale_connections(connections):
+    pool = ConnectionPool({}, minconn=1, maxconn=2, recycle=0)
+    connections[0].healthy = False
+    conn = pool.getconn()
+    assert conn is not connections[0]
+    assert connections[0].closed
+    pool.putconn(conn)
+
+    pool.recycle = 1e-9
+    assert pool.getconn() is not conn
+    assert conn.closed
+
+
+def test_pool_times_out_when_exhausted(connections):
+    pool = ConnectionPool({}, minconn=0, maxconn=1, timeout=0.01)
+    pool.getconn()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn()
@@ -0,0 +1,53 @@
+from datetime import date
+from app.api.api_service import TheFunScreenerService, diff_constituents
+from app.models.screen_result import ScreenResult
+
+# usdmarketcap by companyid of every date
+SCREENS = {
+    "2024-01-01": {1: 500.0, 2: 400.0, 3: 300.0, 4: 200.0},
+    "2024-02-01": {2: 600.0, 1: 500.0, 3: 300.0, 5: 250.0},
+    "2024-03-01": {2: 600.0, 1: 500.0, 3: 300.0, 5: 250.0},
+}
+
+
+def sorted_screen(make_screen, caps: dict[int, float]):
+    """Screen of the usdmarketcap by companyid, sorted like the screens of the service."""
+    ids = sorted(caps, key=caps.__getitem__, reverse=True)
+    return make_screen(companyid=ids, usdmarketcap=[caps[companyid] for companyid in ids])
+
+
+def test_diff_constituents(make_screen):
+    before, after = (sorted_screen(make_screen, SCREENS[asofdate]) for asofdate in ("2024-01-01", "2024-02-01"))
+    diff = diff_constituents(before, after)
+    assert diff["adds"] == [
+        {"companyid": 5, "companyname": "Company 5", "tickersymbol": "T5", "rank": 4, "usdmarketcap": 250.0}
+    ]
+    assert [(drop["companyid"], drop["rank"]) for drop in diff["drops"]] == [(4, 4)]
+    assert diff["moves"] == [
+        {"companyid": 2, "tickersymbol": "T2", "from_rank": 2, "to_rank": 1},
+        {"companyid": 1, "tickersymbol": "T1", "from_rank": 1, "to_rank": 2},
+    ]
+
+    empty = diff_constituents(ScreenResult.empty(), before)
+    assert [add["companyid"] for add in empty["adds"]] == [1, 2, 3, 4]
+    assert empty["drops"] == empty["moves"] == []
+
+
+def test_constituent_changes_route(repository, make_client):
+    repository.version = date(2024, 3, 1)
+    repository.caps = lambda asofdate, country: SCREENS[asofdate]
+    client = make_client(TheFunScreenerService(repository))
+
+    res = client.get("/constituent-changes/US/mega/3?start=2024-01&end=2024-03")
+    assert res.status_code == 200
+    changes = res.json()
+    assert [(change["from_date"], change["to_date"]) for change in changes] == [
+        ("2024-01-01", "2024-02-01"), ("2024-02-01", "2024-03-01")
+    ]
+    # with the top 3 companies, company 4 and 5 are never constituents
+    assert changes[0]["adds"] == changes[0]["drops"] == []
+    assert [move["companyid"] for move in changes[0]["moves"]] == [2, 1]
+    assert changes[1] == {"from_date": "2024-02-01", "to_date": "2024-03-01", "adds": [], "drops": [], "moves": []}
+
+    assert client.get("/constituent-changes/US/mega/3?dates=2024-01-01").status_code == 422
+    assert client.get("/constituent-changes/US/mega/3").status_code == 422
@@ -0,0 +1,16 @@
+import re
+from app.database.daily_market_cap import DailyMarketCapTable
+
+
+def columns(clause: str) -> list[str]:
+    return [column.strip().split(".")[-1] for column in clause.split(",")]
+
+
+def test_refresh_inserts_every_row_once():
+    # rows repeated by the joins would make the upsert update a row twice and abort the refresh
+    query = DailyMarketCapTable._refresh_query()
+    conflict = columns(re.search(r"ON CONFLICT \(([^)]*)\)", query).group(1))
+    distinct = columns(re.search(r"SELECT DISTINCT ON \(([^)]*)\)", query).group(1))
+    order = columns(re.search(r"ORDER BY\s+(.*?)\s+ON CONFLICT", query, re.DOTALL).group(1))
+    assert distinct == conflict == ["companyid", "pricingdate"]
+    assert order[:len(distinct)] == distinct
@@ -36,4 +36,15 @@ def test_query_global_market_cap_top_x(task_manager):
     """
     result = task_manager.query_global_market_cap(asofdate="2025-05-12", mktcap_thres=500e3, country="US", allow_fuzzy=True)
     assert result is not None
-    assert len(result) > 20 # becasue of allow fuzzy try to capture for the last x days
\ No newline at end of file
+    assert len(result) > 20 # becasue of allow fuzzy try to capture for the last x days
+
+def test_query_global_market_cap_latest_only_limit(task_manager):
+    """Test deduplication and top_x in the database.
+
+    The fuzzy window has several pricing dates per company, only the latest one is returned.
+    """
+    result = task_manager.query_global_market_cap(asofdate="2025-05-12", mktcap_thres=500e3, country="US", allow_fuzzy=True, latest_only=True, limit=5)
+    assert len(result) == 5
+    df = result.to_pandas()
+    assert df["companyid"].is_unique
+    assert df["usdmarketcap"].is_monotonic_decreasing
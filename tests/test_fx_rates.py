@@ -0,0 +1,64 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+from app.database.db_task_manager import TaskManagerRepository
+from app.database.fx_rates import FxRates
+from app.models.screen_result import FIELDS
+
+
+class FakeDatabase:
+    """Answers the rates query of FxRates and the local currency screen."""
+
+    def __init__(self):
+        self.queries = []
+
+    def query_all(self, query, params=()):
+        self.queries.append(params)
+        return pd.DataFrame({
+            "pricedate": [date(2024, 5, 2), date(2024, 5, 2), date(2024, 5, 3)],
+            "currencyid": [0, 2, 2],
+            "priceclose": [1.0, 150.0, 160.0],
+        })
+
+    def query_prepared_columns(self, name, query, params):
+        assert name.startswith("local_market_cap")
+        # a fuzzy screen of 2024-05-03 reads from 2024-04-30, there are no rates before 2024-05-02
+        no_rates = [None, None, None]
+        assert params["local_thres"] == [no_rates, no_rates, [1000.0, None, 150000.0], [None, None, 160000.0]]
+        return {
+            "companyid": [1, 2, 3],
+            "marketcap": [2000.0, 375000.0, 480000.0],
+            "pricingdate": [date(2024, 5, 2), date(2024, 5, 2), date(2024, 5, 3)],
+            "currencyid": [0, 2, 2],
+            "companyname": ["A", "B", "C"],
+            "tickersymbol": ["A", "B", "C"],
+            "currency": ["USD", "JPY", "JPY"],
+            "exchange": ["NYSE", "TSE", "TSE"],
+            "country": ["US", "JP", "JP"],
+        }
+
+
+def test_rates_are_loaded_once_per_date():
+    database = FakeDatabase()
+    fx_rates = FxRates(database)  # type: ignore[arg-type]
+
+    rates = fx_rates.window(date(2024, 5, 2), date(2024, 5, 3))
+    np.testing.assert_array_equal(rates, [[1.0, np.nan, 150.0], [np.nan, np.nan, 160.0]])
+    assert fx_rates.is_loaded(date(2024, 5, 2), date(2024, 5, 3))
+    fx_rates.window(date(2024, 5, 3), date(2024, 5, 3))
+    assert len(database.queries) == 1
+
+    usd = FxRates.to_usd(np.array([300.0, 320.0]), np.array([0, 1]), np.array([2, 2]), rates)
+    np.testing.assert_array_equal(usd, [2.0, 2.0])
+
+
+def test_screens_are_converted_with_the_rate_of_their_pricing_date():
+    database = FakeDatabase()
+    repository = TaskManagerRepository(database, fx_rates=FxRates(database))  # type: ignore[arg-type]
+
+    screen = repository.query_global_market_cap("2024-05-03", 1000, "Global", True, False, 2)
+    assert tuple(screen.columns) == FIELDS
+    # by pricing date, then by usd market cap
+    assert screen["companyid"].tolist() == [3, 2]
+    assert screen["usdmarketcap"].tolist() == [3000.0, 2500.0]
+    assert screen["currency"].tolist() == ["JPY", "JPY"]
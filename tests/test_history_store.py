@@ -0,0 +1,107 @@
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+import pytest
+from app.api.api_service import TheFunScreenerService
+from app.cache import MarketCapHistoryStore
+
+FIRST = date(2024, 5, 1)
+
+
+class FakeDatabase:
+    """ciqmarketcap with companies 1, 5 and 9, company 9 is listed from the third day."""
+
+    def __init__(self, days: int):
+        rows = [
+            (companyid, FIRST + timedelta(days=day), companyid * 1000.0 + day)
+            for companyid in (1, 5, 9)
+            for day in range(days)
+            if companyid != 9 or day >= 2
+        ]
+        self.rows = pd.DataFrame(rows, columns=["companyid", "pricingdate", "usdmarketcap"])
+
+    def query_all(self, query, params=()):
+        value = self.rows["pricingdate"].min() if "min(" in query else self.rows["pricingdate"].max()
+        return pd.DataFrame({"pricingdate": [value]})
+
+    def stream_columns(self, query, params=(), chunk_size=2000):
+        rows = self.rows[self.rows["pricingdate"].between(params["since"], params["until"])]
+        rows = rows.sort_values(["companyid", "pricingdate"])
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows.iloc[start : start + chunk_size]
+            yield {column: chunk[column].tolist() for column in chunk.columns}
+
+
+def test_appended_store_matches_a_rebuild(tmp_path):
+    database = FakeDatabase(days=10)
+    appended = MarketCapHistoryStore(tmp_path / "appended")
+    assert appended.until is None and appended.series(1) is None
+
+    assert appended.ingest(database, until=FIRST + timedelta(days=3), chunk_size=4) == 10  # type: ignore[arg-type]
+    assert appended.ingest(database, chunk_size=3) == 18  # type: ignore[arg-type]
+    assert appended.ingest(database) == 0  # type: ignore[arg-type]
+    with pytest.raises(ValueError):
+        appended.ingest(database, since=FIRST)  # type: ignore[arg-type]
+
+    rebuilt = MarketCapHistoryStore(tmp_path / "rebuilt")
+    rebuilt.ingest(database, rebuild=True)  # type: ignore[arg-type]
+    assert len(appended) == len(rebuilt) == 28 and appended.until == FIRST + timedelta(days=9)
+    for companyid in (1, 5, 9):
+        np.testing.assert_array_equal(appended.series(companyid), rebuilt.series(companyid))
+
+
+def test_switch_keeps_the_previous_generation(tmp_path):
+    database = FakeDatabase(days=10)
+    store = MarketCapHistoryStore(tmp_path)
+    store.ingest(database, until=FIRST + timedelta(days=3))  # type: ignore[arg-type]
+    first = store.current.read_text()
+    # e.g. the generation another ingest is still writing
+    (tmp_path / "in-progress").mkdir()
+
+    def generations():
+        return sorted(path.name for path in tmp_path.iterdir() if path.is_dir())
+
+    store.ingest(database, until=FIRST + timedelta(days=6))  # type: ignore[arg-type]
+    second = store.current.read_text()
+    assert generations() == sorted([first, second, "in-progress"])
+
+    store.ingest(database)  # type: ignore[arg-type]
+    assert generations() == sorted([second, store.current.read_text(), "in-progress"])
+
+    class StaleCurrent:
+        """CURRENT as read by a reader before the last two switches, then as it is now."""
+
+        def __init__(self):
+            self.names = [first]
+
+        def read_text(self):
+            return self.names.pop() if self.names else store.current.read_text()
+
+    reader = MarketCapHistoryStore(tmp_path)
+    reader.current = StaleCurrent()  # type: ignore[assignment]
+    assert reader.until == FIRST + timedelta(days=9)
+
+
+def test_series_are_sliced_by_date(tmp_path):
+    store = MarketCapHistoryStore(tmp_path)
+    store.ingest(FakeDatabase(days=10))  # type: ignore[arg-type]
+
+    days, caps = store.series(9, FIRST, FIRST + timedelta(days=4))
+    assert days.astype("datetime64[D]").tolist() == [FIRST + timedelta(days=day) for day in (2, 3, 4)]
+    assert caps.tolist() == [9002.0, 9003.0, 9004.0]
+    assert not caps.flags.writeable
+    assert len(store.series(5, FIRST + timedelta(days=20))[0]) == 0
+    assert store.series(4) is None
+
+
+def test_company_market_cap_route(tmp_path, make_client):
+    store = MarketCapHistoryStore(tmp_path)
+    client = make_client(TheFunScreenerService(None, history_store=store))  # type: ignore[arg-type]
+
+    assert client.get("/company/1/market-cap").status_code == 503
+    store.ingest(FakeDatabase(days=3))  # type: ignore[arg-type]
+
+    res = client.get("/company/1/market-cap?start=2024-05-02")
+    assert res.json() == {"companyid": 1, "pricingdate": ["2024-05-02", "2024-05-03"], "usdmarketcap": [1001.0, 1002.0]}
+    assert client.get("/company/1/market-cap?start=2024-05-02", headers={"If-None-Match": res.headers["etag"]}).status_code == 304
+    assert client.get("/company/2/market-cap").status_code == 404
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import date
+from app.api.api_service import TheFunScreenerService
+from app.api.http_cache import IMMUTABLE, REVALIDATE, ScreenValidators
+from app.cache import ScreenCache
+
+
+def test_validators_match_etags_and_dates():
+    validators = ScreenValidators(date(2024, 5, 2), False, "latest", "US", "mega")
+    assert validators.etag == ScreenValidators(date(2024, 5, 2), False, "latest", "US", "mega").etag
+    assert validators.etag != ScreenValidators(date(2024, 5, 3), False, "latest", "US", "mega").etag
+    assert validators.headers["Cache-Control"] == REVALIDATE
+    assert validators.headers["Last-Modified"] == "Thu, 02 May 2024 00:00:00 GMT"
+
+    assert validators.is_not_modified(f'"other", W/{validators.etag}', None)
+    assert validators.is_not_modified("*", None)
+    assert not validators.is_not_modified('"other"', "Fri, 03 May 2024 00:00:00 GMT")
+    assert validators.is_not_modified(None, "Fri, 03 May 2024 00:00:00 GMT")
+    assert not validators.is_not_modified(None, "Wed, 01 May 2024 00:00:00 GMT")
+    assert not validators.is_not_modified(None, "not a date")
+
+
+def test_unchanged_screens_are_answered_with_304_without_querying(repository, make_client):
+    client = make_client(TheFunScreenerService(repository, screen_cache=ScreenCache(), version_ttl=0))
+
+    res = client.get("/latest-market-cap/US/mega/10")
+    assert res.status_code == 200
+    etag = res.headers["etag"]
+
+    res = client.get("/latest-market-cap/US/mega/10", headers={"If-None-Match": etag})
+    assert (res.status_code, res.content, res.headers["etag"]) == (304, b"", etag)
+    res = client.get("/latest-market-cap/US/mega/10?format=arrow", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert len(repository.queries) == 1
+
+    # new data: a new version, the cached screen of the old version is not served
+    repository.version = date(2024, 5, 3)
+    res = client.get("/latest-market-cap/US/mega/10", headers={"If-None-Match": etag})
+    assert res.status_code == 200 and res.headers["etag"] != etag
+    assert res.json()[0]["pricingdate"] == "2024-05-03"
+    assert len(repository.queries) == 2
+    # the latest screens are screened as of the data version, not today, so they do
+    # not change when the day rolls over without new data
+    assert repository.queries == [("2024-05-02", "US"), ("2024-05-03", "US")]
+
+    # screens of dates before the data version never change
+    res = client.get("/historical-market-cap/US/mega/2024/1/10")
+    assert res.headers["cache-control"] == IMMUTABLE
+    repository.version = date(2024, 6, 3)
+    res = client.get("/historical-market-cap/US/mega/2024/1/10", headers={"If-None-Match": res.headers["etag"]})
+    assert res.status_code == 304
+
+
+def test_concurrent_callers_share_one_version_query(repository):
+    calls = 0
+
+    async def query():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return repository.version
+
+    repository.query_latest_pricingdate_async = query  # type: ignore[method-assign]
+    service = TheFunScreenerService(repository, version_ttl=60)  # type: ignore[arg-type]
+
+    async def run():
+        first = await asyncio.gather(*(service.get_data_version() for _ in range(20)))
+        return [*first, await service.get_data_version()]
+
+    assert asyncio.run(run()) == [date(2024, 5, 2)] * 21
+    assert calls == 1
@@ -0,0 +1,43 @@
+import logging
+import queue
+import orjson
+from app.utils.logging import JsonFormatter, MessageQueueHandler, QueryLogFilter
+
+
+def make_record(msg, *args, level=logging.INFO):
+    return logging.LogRecord("app.database.queries", level, __file__, 1, msg, args, None)
+
+
+def test_query_log_filter_truncates_long_messages():
+    log_filter = QueryLogFilter(max_length=10)
+
+    record = make_record("SELECT %s FROM ciqmarketcap", "companyid")
+    assert log_filter.filter(record)
+    assert record.getMessage() == "SELECT com... [truncated]"
+
+    record = make_record("SELECT 1")
+    assert log_filter.filter(record)
+    assert record.getMessage() == "SELECT 1"
+
+
+def test_query_log_filter_samples_info_but_keeps_warnings():
+    log_filter = QueryLogFilter(sample_rate=0.0)
+    assert not log_filter.filter(make_record("SELECT 1"))
+    assert log_filter.filter(make_record("slow query", level=logging.WARNING))
+
+    log_filter = QueryLogFilter(sample_rate=0.5)
+    kept = sum(log_filter.filter(make_record("SELECT 1")) for _ in range(2000))
+    assert 800 < kept < 1200
+
+
+def test_queued_records_keep_their_message_and_time():
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    record = make_record("loaded %d rows", 5)
+    record.created = 0.0
+    MessageQueueHandler(log_queue).handle(record)
+
+    queued = log_queue.get_nowait()
+    assert (queued.msg, queued.args) == ("loaded 5 rows", None)
+    formatted = orjson.loads(JsonFormatter().format(queued))
+    assert formatted["message"] == "loaded 5 rows"
+    assert formatted["timestamp"] == "1970-01-01T00:00:00"
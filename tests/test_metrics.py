@@ -0,0 +1,56 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.utils.metrics import Histogram, MetricsMiddleware, MetricsRegistry, record_rows, stage, start_request
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), (0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 2.0):
+        histogram.observe(value, route="/a")
+
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{route="/a"} 4' in lines
+    assert 'latency_seconds_sum{route="/a"} 3.050000' in lines
+
+
+def test_stages_add_up_within_a_request():
+    with stage("db_fetch"):
+        pass  # outside of a request nothing is recorded
+
+    timings = start_request()
+    with stage("db_fetch"):
+        pass
+    with stage("db_fetch"):
+        pass
+    record_rows(10)
+    record_rows(5)
+
+    assert list(timings.stages) == ["db_fetch"]
+    assert timings.rows == 15
+
+
+def test_middleware_records_requests_by_route_template():
+    registry = MetricsRegistry()
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, registry=registry)
+
+    @app.get("/screen/{country}")
+    async def screen(country: str):
+        with stage("transform"):
+            record_rows(3)
+        return {"country": country}
+
+    client = TestClient(app)
+    assert client.get("/screen/US").status_code == 200
+    assert client.get("/screen/JP").status_code == 200
+    assert client.get("/missing").status_code == 404
+
+    page = registry.render()
+    assert 'thefunscreener_request_duration_seconds_count{method="GET",route="/screen/{country}",status="200"} 2' in page
+    assert 'thefunscreener_request_duration_seconds_count{method="GET",route="unmatched",status="404"} 1' in page
+    assert 'thefunscreener_request_stage_duration_seconds_count{route="/screen/{country}",stage="transform"} 2' in page
+    assert 'thefunscreener_response_rows_count{route="/screen/{country}"} 2' in page
+    assert "thefunscreener_requests_in_flight 0" in page
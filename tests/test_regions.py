@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from app.api.api_service import TheFunScreenerService
+from app.cache import ScreenCache
+from app.utils.helper import REGIONS, resolve_countries
+
+# usdmarketcap by companyid of the companies of every country
+CAPS = {"DE": {1: 900.0, 2: 300.0, 3: 100.0}, "FR": {4: 800.0, 5: 200.0}, "IT": {6: 500.0}}
+
+
+def test_resolve_countries():
+    assert resolve_countries("US") == ["US"]
+    assert resolve_countries("Global") == ["Global"]
+    assert resolve_countries("EU") == REGIONS["EU"] and len(REGIONS["EU"]) == 27
+    assert resolve_countries(" DE, FR,DE,") == ["DE", "FR"]
+    assert resolve_countries("de,fr") == ["DE", "FR"]
+    for country in (",", "DE,Global", "DE,FRA"):
+        with pytest.raises(ValueError):
+            resolve_countries(country)
+
+
+def test_region_screens_are_fanned_out_and_merged(repository):
+    repository.caps = lambda asofdate, country: CAPS.get(country, {})
+    repository.delay = 0.01
+    service = TheFunScreenerService(repository, screen_cache=ScreenCache(), batch_concurrency=2)  # type: ignore[arg-type]
+
+    res = asyncio.run(service.get_latest_market_cap("DE,FR,IT", "mid", 4))
+    assert res["usdmarketcap"].tolist() == [900.0, 800.0, 500.0, 300.0]
+    assert res["country"].tolist() == ["DE", "FR", "IT", "DE"]
+    assert sorted(country for _, country in repository.queries) == ["DE", "FR", "IT"]
+    assert repository.max_running == 2
+
+    # the screens of the countries are cached on their own
+    res = asyncio.run(service.get_latest_market_cap("FR", "mid"))
+    assert res["usdmarketcap"].tolist() == [800.0, 200.0] and len(repository.queries) == 3
+
+    res = asyncio.run(service.get_historical_market_cap("EU", "mid", 2024, 1, 2))
+    assert res["usdmarketcap"].tolist() == [900.0, 800.0]
+    assert len(repository.queries) == 3 + 27
+
+
+def test_invalid_country_lists_are_rejected(repository, make_client):
+    client = make_client(TheFunScreenerService(repository))
+
+    assert client.get("/latest-market-cap/DE,Global/mid/3").status_code == 422
+    assert client.get("/historical-market-cap/DE,FRA/mid/2024/1/3").status_code == 422
+    assert client.get("/historical-market-cap-batch/DE,XYZ/mid/3?start=2024-01&end=2024-02").status_code == 422
+    assert client.get("/constituent-changes/,/mid/3?start=2024-01&end=2024-02").status_code == 422
+    assert repository.queries == []
+
+
+def test_streamed_screens_use_the_resolved_country(repository):
+    repository.caps = lambda asofdate, country: CAPS.get(country, {})
+    service = TheFunScreenerService(repository, screen_cache=ScreenCache())  # type: ignore[arg-type]
+    asyncio.run(service.get_latest_market_cap("DE", "mid"))
+
+    async def stream(country):
+        return [chunk async for chunk in service.stream_latest_market_cap(country, "mid", 2)]
+
+    # "de," is the screen of DE, answered from the cache instead of streamed from the database
+    chunks = asyncio.run(stream("de,"))
+    assert [chunk["usdmarketcap"].tolist() for chunk in chunks] == [[900.0, 300.0]]
+    assert len(repository.queries) == 1
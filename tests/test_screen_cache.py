@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime, time, timezone
+import pytest
+from app.cache import ScreenCache
+from app.cache.screen_cache import next_refresh
+
+
+def test_single_flight_coalesces_concurrent_misses():
+    cache = ScreenCache()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "screen"
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_load(("US", "large"), load) for _ in range(200)))
+
+    assert asyncio.run(run()) == ["screen"] * 200
+    assert calls == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["coalesced"] == 199
+
+
+def test_failed_loads_are_not_cached():
+    cache = ScreenCache()
+
+    async def fail():
+        raise RuntimeError("database is down")
+
+    async def ok():
+        return "screen"
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_load("US", fail))
+    assert asyncio.run(cache.get_or_load("US", ok)) == "screen"
+    assert asyncio.run(cache.get_or_load("US", fail)) == "screen"
+    assert cache.stats()["hits"] == 1
+
+
+def test_lru_eviction():
+    cache = ScreenCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_at_the_next_refresh():
+    refresh = time(6, 0)
+    before = datetime(2025, 5, 2, 5, 0, tzinfo=timezone.utc)
+    after = datetime(2025, 5, 2, 7, 0, tzinfo=timezone.utc)
+    assert next_refresh(before, refresh) == datetime(2025, 5, 2, 6, 0, tzinfo=timezone.utc)
+    assert next_refresh(after, refresh) == datetime(2025, 5, 3, 6, 0, tzinfo=timezone.utc)
@@ -0,0 +1,82 @@
+from datetime import date
+from decimal import Decimal
+import numpy as np
+import pyarrow as pa
+import pytest
+from app.models.screen_result import ScreenResult, arrow_schema
+
+
+# fuzzy window with two pricing dates of companies 1 and 2, with the values psycopg2 returns
+FUZZY_WINDOW = {
+    "companyid": [1, 2, 1, 3, 2],
+    "marketcap": [Decimal("100.5"), Decimal("300"), Decimal("110"), None, Decimal("290")],
+    "pricingdate": [date(2024, 5, 1), date(2024, 5, 2), date(2024, 5, 2), date(2024, 5, 2), date(2024, 5, 1)],
+    "usdmarketcap": [100.5, 300.0, 110.0, 200.0, 290.0],
+    "companyname": ["A", "B", "A", "C", "B"],
+    "tickersymbol": ["A", "B", "A", "C", "B"],
+    "currency": ["USD", "CHF", "USD", "USD", "CHF"],
+    "exchange": ["NYSE", "SWX", "NYSE", "NYSE", "SWX"],
+    "country": ["US", "CH", "US", "US", "CH"],
+}
+
+
+@pytest.fixture
+def screen(make_screen) -> ScreenResult:
+    return make_screen(**FUZZY_WINDOW)
+
+
+def test_columns_are_typed_and_categoricals_encoded(screen):
+    assert screen.columns["companyid"].dtype == np.int64
+    assert screen.columns["pricingdate"].dtype == np.dtype("datetime64[D]")
+    assert np.isnan(screen["marketcap"][3])
+    assert screen.columns["currency"].tolist() == [0, 1, 0, 0, 1]
+    assert screen["currency"].tolist() == ["USD", "CHF", "USD", "USD", "CHF"]
+    assert screen.code_of("country", "CH") == 1
+    assert screen.code_of("country", "DE") is None
+
+
+def test_sorting_deduplication_and_top(screen):
+    assert screen.latest_per_company()["companyid"].tolist() == [2, 1, 3]
+    assert screen.top(2)["companyid"].tolist() == [2, 2]
+    assert screen.top(None)["usdmarketcap"].tolist() == [300.0, 290.0, 200.0, 110.0, 100.5]
+    assert screen.sort_desc("pricingdate", "usdmarketcap", limit=3)["companyid"].tolist() == [2, 3, 1]
+    assert len(screen.top(0)) == 0
+    assert screen.where(screen["country"] == "US")["companyid"].tolist() == [1, 1, 3]
+
+
+def test_concat_merges_the_dictionaries(screen):
+    other = ScreenResult.from_columns({**screen.to_pandas().iloc[3:], "currency": ["EUR", "USD"]})
+    merged = ScreenResult.concat([screen.head(2), ScreenResult.empty(), other])
+    assert merged["currency"].tolist() == ["USD", "CHF", "EUR", "USD"]
+    assert merged.dictionaries["currency"].tolist() == ["USD", "CHF", "EUR"]
+    assert len(ScreenResult.concat([])) == 0
+
+
+def test_arrow_and_pandas_roundtrip(screen):
+    table = screen.to_arrow()
+    assert table.schema == arrow_schema()
+    assert table.column("marketcap").null_count == 1
+    assert table.column("pricingdate").to_pylist()[0] == date(2024, 5, 1)
+
+    for copy in (ScreenResult.from_arrow(table), ScreenResult.from_pandas(screen.to_pandas())):
+        for field in screen.columns:
+            np.testing.assert_array_equal(copy[field], screen[field], err_msg=field)
+
+    # decimals, timestamps and plain strings, e.g. written from a dataframe
+    legacy = table.set_column(1, "marketcap", pa.array([Decimal("1.5")] * 5, type=pa.decimal128(18, 6)))
+    legacy = legacy.set_column(2, "pricingdate", table.column("pricingdate").cast(pa.timestamp("ns")))
+    legacy = legacy.set_column(8, "country", table.column("country").cast(pa.string()))
+    copy = ScreenResult.from_arrow(legacy)
+    assert copy["marketcap"].tolist() == [1.5] * 5
+    assert copy["pricingdate"].tolist() == screen["pricingdate"].tolist()
+    assert copy["country"].tolist() == screen["country"].tolist()
+
+
+def test_merge_top_is_a_k_way_merge(screen):
+    screen = screen.top(None)
+    us, ch = screen.where(screen["country"] == "US"), screen.where(screen["country"] == "CH")
+    merged = ScreenResult.merge_top([us, ScreenResult.empty(), ch])
+    assert merged["usdmarketcap"].tolist() == screen["usdmarketcap"].tolist()
+    assert merged["country"].tolist() == ["CH", "CH", "US", "US", "US"]
+    assert ScreenResult.merge_top([us, ch], 3)["companyid"].tolist() == [2, 2, 3]
+    assert len(ScreenResult.merge_top([us, ch], 0)) == len(ScreenResult.merge_top([])) == 0
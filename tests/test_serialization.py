@@ -0,0 +1,93 @@
+import asyncio
+import json
+from datetime import date
+import pyarrow as pa
+from app.api.serialization import (
+    ResponseFormat,
+    negotiate_format,
+    screen_to_arrow,
+    screen_to_columnar_json,
+    screen_to_json,
+    screen_to_ndjson,
+    stream_dated_screens,
+    stream_screen_arrow,
+    stream_screen_json,
+    stream_screen_ndjson,
+)
+from app.models.marketcap import MarketCapEntry
+from app.models.screen_result import ScreenResult
+
+
+def test_screen_to_json_matches_market_cap_entries(make_screen):
+    """The vectorized json is what validating every row as MarketCapEntry produces."""
+    df = make_screen()
+    expected = [
+        MarketCapEntry(**{**row, "pricingdate": row["pricingdate"].strftime("%Y-%m-%d")}).model_dump()
+        for row in df.to_pandas().to_dict(orient="records")
+    ]
+    assert json.loads(screen_to_json(df)) == expected
+
+
+def test_screen_to_json_of_empty_screen(make_screen):
+    assert screen_to_json(ScreenResult.empty()) == b"[]"
+
+
+def test_columnar_and_arrow_formats_hold_the_same_screen(make_screen):
+    df = make_screen()
+    records = json.loads(screen_to_json(df))
+
+    columnar = json.loads(screen_to_columnar_json(df))
+    assert columnar["length"] == 2
+    assert columnar["columns"]["companyid"] == [21835, 24937]
+    assert columnar["columns"]["currency"] == {"dictionary": ["USD"], "indices": [0, 0]}
+    # the dictionaries only hold the values of the rows sent
+    columnar = json.loads(screen_to_columnar_json(ScreenResult.concat([make_screen().take([1]), df.take([0])])))
+    assert columnar["columns"]["tickersymbol"] == ["AAPL", "MSFT"]
+    assert columnar["columns"]["exchange"] == {"dictionary": ["NasdaqGS"], "indices": [0, 0]}
+
+    table = pa.ipc.open_stream(screen_to_arrow(df)).read_all()
+    assert table.column("usdmarketcap").to_pylist() == [r["usdmarketcap"] for r in records]
+    assert table.column("pricingdate").to_pylist() == [date(2025, 5, 3), date(2025, 5, 2)]
+    assert table.column("country").to_pylist() == ["US", "US"]
+    assert pa.ipc.open_stream(screen_to_arrow(ScreenResult.empty())).read_all().num_rows == 0
+
+
+def test_negotiate_format(make_screen):
+    assert negotiate_format(None, None) is ResponseFormat.json
+    assert negotiate_format(None, "application/vnd.apache.arrow.stream;q=0.9, */*") is ResponseFormat.arrow
+    assert negotiate_format(ResponseFormat.columnar, "application/vnd.apache.arrow.stream") is ResponseFormat.columnar
+
+
+def test_stream_dated_screens_writes_one_line_per_date(make_screen):
+    async def screens():
+        yield "2024-01-01", make_screen()
+        yield "2024-02-01", make_screen().head(0)
+
+    async def collect():
+        return [line async for line in stream_dated_screens(screens())]
+
+    lines = asyncio.run(collect())
+    assert all(line.endswith(b"\n") for line in lines)
+    first, second = (json.loads(line) for line in lines)
+    assert first["date"] == "2024-01-01"
+    assert [entry["tickersymbol"] for entry in first["constituents"]] == ["MSFT", "AAPL"]
+    assert second == {"date": "2024-02-01", "constituents": []}
+
+
+def test_streamed_screen_matches_the_whole_screen(make_screen):
+    df = make_screen()
+
+    async def collect(encoder, chunks):
+        async def screens():
+            for chunk in chunks:
+                yield chunk
+        return b"".join([part async for part in encoder(screens())])
+
+    chunks = [df.head(1), df.head(0), df.take([1])]
+    assert json.loads(asyncio.run(collect(stream_screen_json, chunks))) == json.loads(screen_to_json(df))
+    assert asyncio.run(collect(stream_screen_json, [])) == b"[]"
+    assert asyncio.run(collect(stream_screen_ndjson, chunks)) == screen_to_ndjson(df)
+
+    table = pa.ipc.open_stream(asyncio.run(collect(stream_screen_arrow, chunks))).read_all()
+    assert table.to_pydict() == pa.ipc.open_stream(screen_to_arrow(df)).read_all().to_pydict()
+    assert pa.ipc.open_stream(asyncio.run(collect(stream_screen_arrow, []))).read_all().num_rows == 0
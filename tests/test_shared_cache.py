@@ -0,0 +1,47 @@
+import asyncio
+import os
+import pandas as pd
+import pytest
+from app.cache import SharedScreenCache, shared_cache
+
+
+def test_workers_share_one_load(tmp_path, make_screen):
+    # two caches on the same directory behave like two worker processes
+    workers = [SharedScreenCache(tmp_path, poll_interval=0.005) for _ in range(2)]
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return make_screen()
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_load(("2024-01-02", "US", 10000), load) for cache in workers))
+
+    for screen in asyncio.run(run()):
+        pd.testing.assert_frame_equal(screen.to_pandas(), make_screen().to_pandas())
+    assert calls == 1
+    assert sorted((cache.misses, cache.coalesced) for cache in workers) == [(0, 1), (1, 0)]
+
+    asyncio.run(workers[1].get_or_load(("2024-01-02", "US", 10000), load))
+    assert workers[1].hits == 1
+
+
+def test_entries_of_previous_refreshes_expire(tmp_path, make_screen):
+    cache = SharedScreenCache(tmp_path)
+    cache.set("key", make_screen())
+    assert cache.get("key") is not None
+
+    stale = cache.last_refresh() - 60
+    os.utime(cache.path("key"), (stale, stale))
+    assert cache.get("key") is None
+    assert cache.purge() == 1
+    assert not cache.path("key").exists()
+
+
+def test_cache_needs_flock(tmp_path, monkeypatch):
+    # the module imports without fcntl (windows), only creating the cache fails
+    monkeypatch.setattr(shared_cache, "fcntl", None)
+    with pytest.raises(RuntimeError):
+        SharedScreenCache(tmp_path)
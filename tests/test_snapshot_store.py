@@ -0,0 +1,51 @@
+from datetime import date
+from decimal import Decimal
+from app.cache import SnapshotStore
+
+
+def test_snapshot_roundtrip(tmp_path, make_screen):
+    """Snapshots keep the values psycopg2 returns (dates and decimals)."""
+    store = SnapshotStore(tmp_path)
+
+    assert store.load("2025-05-01", "US", 10e3) is None
+    store.save("2025-05-01", "US", 10e3, make_screen())
+
+    loaded = store.load("2025-05-01", "US", 10e3)
+    assert loaded is not None
+    assert loaded["companyid"].tolist() == [21835, 24937]
+    assert str(loaded["pricingdate"][0]) == "2025-05-03"
+    assert loaded["usdmarketcap"][0] == 3235237.69
+    assert loaded["country"].tolist() == ["US", "US"]
+    assert store.load("2025-05-01", "US", 200e3) is None
+
+
+def test_snapshots_written_from_dataframes_are_read(tmp_path, make_screen):
+    """Snapshots written before the screens were typed arrays hold decimals and plain strings."""
+    store = SnapshotStore(tmp_path)
+    path = store.path("2025-05-01", "US", 10e3)
+    assert path is not None
+    path.parent.mkdir(parents=True)
+    make_screen().to_pandas().assign(
+        pricingdate=[date(2025, 5, 2)] * 2, usdmarketcap=[Decimal("3235237.69"), Decimal("3067071.87")]
+    ).to_parquet(path, index=False)
+
+    loaded = store.load("2025-05-01", "US", 10e3)
+    assert loaded is not None
+    assert loaded["usdmarketcap"].tolist() == [3235237.69, 3067071.87]
+    assert loaded["exchange"].tolist() == ["NasdaqGS", "NasdaqGS"]
+
+
+def test_snapshots_of_older_versions_are_ignored(tmp_path, make_screen):
+    """Snapshots stored before SNAPSHOT_VERSION (asofdate exchange rates) are screened again."""
+    store = SnapshotStore(tmp_path)
+    path = tmp_path / "2025-05-01" / "US_10000.parquet"
+    path.parent.mkdir()
+    make_screen().to_pandas().to_parquet(path, index=False)
+    assert store.load("2025-05-01", "US", 10e3) is None
+
+
+def test_snapshot_rejects_unsafe_keys(tmp_path, make_screen):
+    store = SnapshotStore(tmp_path)
+    store.save("2025-05-01", "../US", 10e3, make_screen())
+    assert store.load("2025-05-01", "../US", 10e3) is None
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,81 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+import psycopg2
+import pytest
+from fastapi.testclient import TestClient
+from app.api.api_server import TheFunScreenerServer
+from app.config.config import Config
+from app.main import create_app
+from app.utils.imports import LazyModule
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_importing_the_app_has_no_side_effects(tmp_path):
+    code = "import sys, app.main; print(sorted(m for m in ('numpy', 'pandas', 'pyarrow') if m in sys.modules))"
+    res = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert res.stdout.strip() == "[]"
+    # the log files are created by the first record
+    assert not (tmp_path / "logs").exists()
+
+
+def test_lazy_module_imports_on_first_use():
+    json = LazyModule("json")
+    assert json.loads("[1]") == [1]
+    assert "loads" in vars(json)
+
+
+def test_the_database_is_checked_by_the_lifespan(monkeypatch):
+    connects = []
+
+    def connect(*args, **kwargs):
+        connects.append(kwargs)
+        raise psycopg2.OperationalError("database is down")
+
+    monkeypatch.setenv("WARMUP", "false")
+    monkeypatch.setattr(psycopg2, "connect", connect)
+    app = create_app()
+    assert connects == []
+
+    # the worker starts anyway
+    with TestClient(app) as client:
+        assert client.get("/metrics").status_code == 403
+    assert connects
+
+
+def test_the_connection_budget_is_split_by_the_process_worker_count(tmp_path, monkeypatch):
+    (tmp_path / ".env").write_text("WEB_CONCURRENCY=4\nPOSTGRES_CONNECTION_BUDGET=40\n")
+    monkeypatch.chdir(tmp_path)
+    # e.g. app/api.py --workers 8, restored after the test like the budget .env sets
+    monkeypatch.setenv("WEB_CONCURRENCY", "8")
+    monkeypatch.setenv("POSTGRES_CONNECTION_BUDGET", "0")
+
+    config = Config.load_configuration()
+    assert config.server.workers == 8
+    assert config.database.pool_config["pool_maxconn"] == 5
+
+
+def test_workers_run_under_gunicorn_where_installed(monkeypatch):
+    pytest.importorskip("gunicorn")
+    calls = []
+
+    def execv(path, argv):
+        calls.append(argv)
+        raise SystemExit
+
+    monkeypatch.setattr(os, "execv", execv)
+    with pytest.raises(SystemExit):
+        TheFunScreenerServer.run_workers("app.main:create_app", port=8099, workers=3, gunicorn_conf="app/gunicorn_conf.py")
+    assert calls[0][1:] == [
+        "-m", "gunicorn", "--config", "app/gunicorn_conf.py", "--bind", "0.0.0.0:8099",
+        "--workers", "3", "--graceful-timeout", "30", "app.main:create_app()",
+    ]
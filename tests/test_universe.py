@@ -0,0 +1,27 @@
+import pytest
+from app.cache import MarketCapUniverse
+
+
+@pytest.fixture
+def universe(make_screen) -> MarketCapUniverse:
+    return MarketCapUniverse(make_screen(
+        companyid=[1, 2, 3, 4, 5],
+        usdmarketcap=[3000.0, 250000.0, 12000.0, 500000.0, 9000.0],
+        currency=["USD", "USD", "CHF", "USD", "CHF"],
+        exchange=["NYSE", "NYSE", "SWX", "NYSE", "SWX"],
+        country=["US", "US", "CH", "US", "CH"],
+    ))
+
+
+def test_select_slices_by_country_threshold_and_top_x(universe):
+    assert universe.select("US", 200e3)["companyid"].tolist() == [4, 2]
+    assert universe.select("US", 2e3)["companyid"].tolist() == [4, 2, 1]
+    assert universe.select("US", 2e3, top_x=1)["companyid"].tolist() == [4]
+    assert universe.select("CH", 10e3)["companyid"].tolist() == [3]
+    assert universe.select("Global", 10e3)["companyid"].tolist() == [4, 2, 3]
+
+
+def test_select_threshold_is_inclusive_and_unknown_country_is_empty(universe):
+    assert universe.select("CH", 12000.0)["companyid"].tolist() == [3]
+    assert len(universe.select("DE", 2e3)) == 0
+    assert universe.countries == ["US", "CH"]
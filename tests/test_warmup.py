@@ -0,0 +1,47 @@
+import asyncio
+from app.cache import CacheWarmer
+
+
+class FakeService:
+    """Records the warmed screens, fails for unknown countries."""
+
+    def __init__(self):
+        self.screen_cache = {}
+        self.running = 0
+        self.max_running = 0
+
+    async def get_latest_market_cap(self, country, mktcap, top_x=None):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if country == "XX":
+            raise ValueError("unknown country")
+        self.screen_cache[(country, mktcap)] = True
+
+
+def test_warmer_loads_every_screen_with_bounded_concurrency():
+    service = FakeService()
+    warmer = CacheWarmer(service, ["US", "Global", "XX"], concurrency=2)
+    assert not warmer.ready and warmer.status()["state"] == "pending"
+
+    asyncio.run(warmer.run())
+
+    assert set(service.screen_cache) == {(c, m) for c in ("US", "Global") for m in ("mega", "large", "mid")}
+    assert service.max_running == 2
+    assert warmer.ready
+    status = warmer.status()
+    assert (status["state"], status["total"], status["warmed"], status["failed"]) == ("done", 9, 6, 3)
+
+
+def test_warmer_runs_one_warmup_at_a_time():
+    async def main():
+        warmer = CacheWarmer(FakeService(), ["US"])
+        assert warmer.start()
+        assert not warmer.start()
+        warmer.start_daily()
+        await asyncio.sleep(0.1)
+        return warmer
+
+    warmer = asyncio.run(main())
+    assert warmer.runs == 1